@@ -1,22 +1,219 @@
 from __future__ import annotations
 
+import asyncio
+import dataclasses
+import io
+import json
 import os
-from typing import Any, Dict
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 # Silence TensorFlow GPU warnings on CPU-only machines (must be set before TF import).
 os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
 os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+# librosa's numba kernels are compiled with cache=True; keep the cache next to the app so
+# it can be built once (`python main.py --precompile`, e.g. in the Docker image) and reused.
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".numba_cache"))
 
+# Heavy modules (TensorFlow, librosa/scipy via ml.predict) are imported lazily, in the
+# model warm-up thread or on first use, so the app answers /health right away.
+
+import numpy as np
 from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette.requests import Request
 
-from ml.config import AudioConfig, FeatureConfig, ModelConfig
-from ml.predict import predict_from_audio_bytes
+from ml import metrics
+from ml.batching import MicroBatcher
+from ml.cache import PredictionCache
+from ml.config import (
+    AudioConfig,
+    BatchConfig,
+    CacheConfig,
+    DecodeConfig,
+    ExecutorConfig,
+    FeatureConfig,
+    JobConfig,
+    ModelConfig,
+    RuntimeConfig,
+    UploadConfig,
+    VizConfig,
+    WindowConfig,
+    cnn_input_shape,
+    config_fingerprint,
+)
+from ml.executor import (
+    ExecutorUnavailable,
+    PipelineExecutor,
+    Saturated,
+    infer_in_worker,
+    init_worker,
+    predict_in_worker,
+    predict_windowed_in_worker,
+)
+from ml.decode import AudioSource, AudioTooLong
+from ml.ingest import UploadGuard, configure_spool
+from ml.jobs import JobQueue, JobRunner, QueueFull
+from ml.registry import ModelRegistry
+from ml.resample import check_tier
+from ml.viz import VIZ_MODES
 
 
 APP_TITLE = "Machine Learning–Based Respiratory Disease Classification Using Lung Sound Analysis"
 
-app = FastAPI(title=APP_TITLE, version="1.0.0")
+# RESAMPLE_TIER=soxr_mq: ~20% faster resampling, approximate vs the training tier (see ml.resample).
+audio_cfg = AudioConfig(resample_serving=check_tier(os.getenv("RESAMPLE_TIER", AudioConfig.resample_serving)))
+# SHARED_STFT=1 serves the faster single-STFT approximation (ml.engine); see its measured error.
+feat_cfg = FeatureConfig(shared_stft=os.getenv("SHARED_STFT", "0") not in ("0", "false", "no"))
+model_cfg = ModelConfig()
+
+MODEL_PATH = os.path.join("model", "model.h5")
+INPUT_SHAPE = cnn_input_shape(audio_cfg, feat_cfg, model_cfg)
+
+# MODEL_BACKEND=tflite serves the artifact from `python -m ml.export` without importing TensorFlow.
+runtime_cfg = RuntimeConfig(
+    backend=os.getenv("MODEL_BACKEND", RuntimeConfig.backend),
+    tflite_path=os.getenv("MODEL_TFLITE_PATH", RuntimeConfig.tflite_path),
+    num_threads=int(os.getenv("TFLITE_THREADS", RuntimeConfig.num_threads)),
+    intra_op_threads=int(os.getenv("TF_INTRA_OP_THREADS", RuntimeConfig.intra_op_threads)),
+    inter_op_threads=int(os.getenv("TF_INTER_OP_THREADS", RuntimeConfig.inter_op_threads)),
+    xla=os.getenv("TF_XLA", "0") not in ("0", "false", "no"),
+    precision=os.getenv("TF_PRECISION", RuntimeConfig.precision),
+)
+
+
+def warm_up() -> None:
+    # ml.predict (librosa/scipy) is imported here, in the warm-up thread, not at app import.
+    from ml.predict import warm_up_pipeline
+
+    warm_up_pipeline(audio_cfg, feat_cfg)
+
+
+# One model per worker process, loaded + warmed up (model and DSP pipeline) in the
+# background at startup, so /health answers while heavy imports are still running.
+registry = ModelRegistry(MODEL_PATH, input_shape=INPUT_SHAPE, runtime_cfg=runtime_cfg, warmup=warm_up)
+
+# Concurrent /predict calls share batched forward passes.
+batch_cfg = BatchConfig(
+    max_batch_size=int(os.getenv("BATCH_MAX_SIZE", BatchConfig.max_batch_size)),
+    max_wait_ms=float(os.getenv("BATCH_MAX_WAIT_MS", BatchConfig.max_wait_ms)),
+)
+batcher = MicroBatcher(registry.predict, batch_cfg)
+
+# CPU-bound decode/DSP runs off the event loop. In "process" mode every pool process
+# loads its own model and the in-process registry/batcher stay idle.
+exec_cfg = ExecutorConfig(
+    mode=os.getenv("PIPELINE_EXECUTOR", ExecutorConfig.mode),
+    max_workers=int(os.getenv("PIPELINE_WORKERS", ExecutorConfig.max_workers)),
+    max_pending=int(os.getenv("PIPELINE_MAX_PENDING", ExecutorConfig.max_pending)),
+)
+# Every pool process runs its own TensorFlow: unless set, split the cores between them
+# instead of letting each one start a thread per core.
+worker_runtime_cfg = runtime_cfg
+if exec_cfg.mode == "process" and runtime_cfg.intra_op_threads == 0:
+    n_procs = exec_cfg.max_workers or (os.cpu_count() or 1)
+    worker_runtime_cfg = dataclasses.replace(
+        runtime_cfg,
+        intra_op_threads=max(1, (os.cpu_count() or 1) // n_procs),
+        inter_op_threads=runtime_cfg.inter_op_threads or 1,
+    )
+executor = PipelineExecutor(
+    exec_cfg,
+    initializer=init_worker,
+    initargs=(MODEL_PATH, INPUT_SHAPE, worker_runtime_cfg, audio_cfg, feat_cfg),
+)
+
+# DECODE_TRUNCATE=1: single-window /predict decodes only duration_seconds + margin (approximate).
+decode_cfg = DecodeConfig(
+    fast_path=os.getenv("DECODE_FAST_PATH", "1") not in ("0", "false", "no"),
+    truncate=os.getenv("DECODE_TRUNCATE", "0") not in ("0", "false", "no"),
+    margin_seconds=float(os.getenv("DECODE_MARGIN_SECONDS", DecodeConfig.margin_seconds)),
+)
+
+# /predict?windowed=true: score long recordings as overlapping duration_seconds windows.
+win_cfg = WindowConfig(
+    hop_seconds=float(os.getenv("WINDOW_HOP_SECONDS", WindowConfig.hop_seconds)),
+    aggregate=os.getenv("WINDOW_AGGREGATE", WindowConfig.aggregate),
+    batch_size=int(os.getenv("WINDOW_BATCH_SIZE", WindowConfig.batch_size)),
+    max_windows=int(os.getenv("WINDOW_MAX_WINDOWS", WindowConfig.max_windows)),
+)
+
+# /predict?viz=json|binary|none: reduced waveform + mel for the analysis page.
+viz_cfg = VizConfig(
+    waveform_points=int(os.getenv("VIZ_WAVEFORM_POINTS", VizConfig.waveform_points)),
+    mel_height=int(os.getenv("VIZ_MEL_HEIGHT", VizConfig.mel_height)),
+    mel_width=int(os.getenv("VIZ_MEL_WIDTH", VizConfig.mel_width)),
+    mel_pool=os.getenv("VIZ_MEL_POOL", VizConfig.mel_pool),
+    binary_dtype=os.getenv("VIZ_BINARY_DTYPE", VizConfig.binary_dtype),
+)
+VIZ_FINGERPRINT = config_fingerprint(viz_cfg)[:12]
+
+# Re-uploads of the same bytes (retries, upload -> analysis page) skip the pipeline.
+cache_cfg = CacheConfig(
+    max_memory_bytes=int(float(os.getenv("PREDICTION_CACHE_MB", "64")) * 1024 * 1024),
+    disk_path=os.getenv("PREDICTION_CACHE_DB", CacheConfig.disk_path),
+    max_disk_bytes=int(float(os.getenv("PREDICTION_CACHE_DISK_MB", "512")) * 1024 * 1024),
+)
+cache = PredictionCache(cache_cfg, config_fingerprint(audio_cfg, feat_cfg, model_cfg, decode_cfg))
+
+# POST /jobs: uploads queue in a local sqlite file and are scored by background workers.
+job_cfg = JobConfig(
+    db_path=os.getenv("JOBS_DB", JobConfig.db_path),
+    workers=int(os.getenv("JOB_WORKERS", JobConfig.workers)),
+    max_queued=int(os.getenv("JOB_MAX_QUEUED", JobConfig.max_queued)),
+    retention_seconds=float(os.getenv("JOB_RETENTION_SECONDS", JobConfig.retention_seconds)),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", JobConfig.max_attempts)),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", JobConfig.lease_seconds)),
+)
+job_queue = JobQueue(job_cfg) if job_cfg.workers > 0 else None
+
+# Upload bodies are size-checked while they stream in and spooled to disk past spool_bytes.
+upload_cfg = UploadConfig(
+    max_bytes=int(float(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024),
+    max_batch_bytes=int(float(os.getenv("UPLOAD_MAX_BATCH_MB", "256")) * 1024 * 1024),
+    spool_bytes=int(float(os.getenv("UPLOAD_SPOOL_MB", "1")) * 1024 * 1024),
+    sniff=os.getenv("UPLOAD_SNIFF", "1") not in ("0", "false", "no"),
+)
+configure_spool(upload_cfg.spool_bytes)
+
+# /predict/batch limits
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "64"))
+MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv("MAX_ZIP_UNCOMPRESSED_BYTES", str(512 * 1024 * 1024)))
+BATCH_INFER_CHUNK = int(os.getenv("BATCH_INFER_CHUNK", "32"))
+
+AUDIO_CONTENT_TYPES = ("audio/wav", "audio/x-wav", "audio/mpeg", "audio/mp3", "audio/wave")
+AUDIO_EXTENSIONS = (".wav", ".mp3")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    if executor.mode == "thread":
+        registry.start()
+        batcher.start()
+    executor.start()
+    if job_runner is not None:
+        job_runner.start()
+    yield
+    if job_runner is not None:
+        await job_runner.stop()
+    executor.shutdown()
+    batcher.stop()
+    cache.close()
+    if job_queue is not None:
+        job_queue.close()
+
+
+app = FastAPI(title=APP_TITLE, version="1.0.0", lifespan=lifespan)
+
+# Added before CORS so that 413/415 rejections still carry CORS headers.
+app.add_middleware(
+    UploadGuard,
+    limits={"/predict": upload_cfg.max_bytes, "/jobs": upload_cfg.max_bytes, "/predict/batch": upload_cfg.max_batch_bytes},
+    sniff_paths=("/predict", "/jobs") if upload_cfg.sniff else (),
+)
 
 # Configure CORS with environment variables
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://localhost:3001").split(",")
@@ -30,11 +227,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-audio_cfg = AudioConfig()
-feat_cfg = FeatureConfig()
-model_cfg = ModelConfig()
 
-MODEL_PATH = os.path.join("model", "model.h5")
+async def record_request(request: Request, call_next: Any) -> Response:
+    """Per-request stage breakdown (Server-Timing header) plus request counters/latency."""
+    t0 = time.perf_counter()
+    with metrics.request() as rec:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - t0
+    route = request.scope.get("route")
+    endpoint = getattr(route, "path", "unmatched")
+    metrics.observe("lungs_request_seconds", elapsed, endpoint=endpoint)
+    metrics.observe("lungs_requests_total", 1, endpoint=endpoint, status=response.status_code)
+    timing = metrics.server_timing(rec, elapsed)
+    if timing:
+        response.headers["Server-Timing"] = timing
+    return response
+
+
+# METRICS_ENABLED=0: no middleware at all, and stage timers in ml.* are no-ops.
+if metrics.enabled():
+    app.middleware("http")(record_request)
 
 
 @app.get("/health")
@@ -42,32 +254,394 @@ def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)) -> Dict[str, Any]:
+def is_ready() -> bool:
+    if executor.mode == "process":
+        return executor.ready
+    return registry.ready and executor.ready
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """Readiness probe: 200 once the model is loaded and warmed up, 503 before that."""
+    ok = is_ready()
+    body: Dict[str, Any] = {"ready": ok, "backend": runtime_cfg.backend}
+    error = executor.error if executor.mode == "process" else registry.error
+    if error:
+        body["error"] = error
+    if executor.mode == "thread" and registry.load_seconds is not None:
+        body["load_seconds"] = round(registry.load_seconds, 3)
+    if executor.mode == "thread" and registry.settings:
+        body["runtime"] = registry.settings
+    return JSONResponse(status_code=200 if ok else 503, content=body)
+
+
+def served_fingerprint() -> Optional[str]:
+    """Content hash of the model file the workers actually loaded."""
+    return executor.fingerprint if executor.mode == "process" else registry.fingerprint
+
+
+@app.get("/metrics")
+def metrics_endpoint() -> PlainTextResponse:
+    """Prometheus scrape target: per-stage latency, input audio and batch-size histograms."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/stats")
+def stats() -> Dict[str, Any]:
+    """Runtime counters for tuning (batch sizes, queue waits, executor load, cache hits)."""
+    out = {"batching": batcher.stats(), "executor": executor.stats(), "cache": cache.stats()}
+    if job_runner is not None:
+        out["jobs"] = job_runner.stats()
+    return out
+
+
+async def cache_key(data: AudioSource, variant: str) -> Optional[str]:
+    model_fp = served_fingerprint()
+    if not cache.enabled or model_fp is None:
+        return None
+    # Hashing a large upload is CPU/disk work: keep it off the event loop.
+    return await asyncio.to_thread(cache.make_key, data, model_fp, variant)
+
+
+def json_response(body: bytes, cache_status: str) -> Response:
+    return Response(content=body, media_type="application/json", headers={"X-Cache": cache_status})
+
+
+def is_supported_audio(filename: str, content_type: Optional[str]) -> bool:
+    if content_type in AUDIO_CONTENT_TYPES:
+        return True
+    # some browsers send application/octet-stream; allow by extension fallback
+    return os.path.splitext(filename.lower())[1] in AUDIO_EXTENSIONS
+
+
+def format_prediction(label: str, confidence: float, probs: Dict[str, float]) -> Dict[str, Any]:
+    return {
+        "predicted_disease": label,
+        "confidence": round(confidence, 2),
+        "probabilities": {k: round(v, 4) for k, v in probs.items()},
+    }
+
+
+async def run_pipeline(
+    data: AudioSource, viz: str = "json"
+) -> Tuple[str, float, Dict[str, float], Optional[Dict[str, object]]]:
+    """decode -> features -> inference without blocking the event loop."""
+    if executor.mode == "process":
+        return await executor.run(
+            predict_in_worker, data, audio_cfg, feat_cfg, model_cfg, viz, viz_cfg, decode_cfg
+        )
+    from ml.predict import build_visualization, decode_probabilities, prepare_input
+
+    x, y, sr, feats = await executor.run(prepare_input, data, audio_cfg, feat_cfg, viz != "none", decode_cfg)
+    with metrics.stage("inference"):  # includes the micro-batching wait
+        row = await asyncio.wrap_future(batcher.submit(x))
+    label, confidence, probs = decode_probabilities(row, model_cfg)
+    if viz == "none":
+        return label, confidence, probs, None
+    return label, confidence, probs, build_visualization(y, sr, feats, viz_cfg, viz)
+
+
+async def run_windowed_pipeline(data: AudioSource, cfg: WindowConfig, viz: str = "json") -> Tuple[Any, ...]:
+    if executor.mode == "process":
+        return await executor.run(
+            predict_windowed_in_worker, data, audio_cfg, feat_cfg, model_cfg, cfg, viz, viz_cfg, decode_cfg
+        )
+    from ml.predict import predict_windowed_from_audio_bytes
+
+    return await executor.run(
+        predict_windowed_from_audio_bytes,
+        data,
+        audio_cfg,
+        feat_cfg,
+        model_cfg,
+        cfg,
+        registry.predict,
+        viz,
+        viz_cfg,
+        decode_cfg,
+    )
+
+
+async def upload_source(file: UploadFile) -> AudioSource:
+    """
+    Thread mode decodes straight from Starlette's spooled upload (the body is never
+    copied into one bytes object); process workers get the bytes, since arguments
+    are pickled to them.
+    """
+    if executor.mode == "process":
+        return await file.read()
+    file.file.seek(0)
+    return file.file
+
+
+def check_predict_request(file: UploadFile, aggregate: Optional[str], viz: str) -> None:
+    """Parameter/upload validation shared by /predict and /jobs (raises HTTPException 400)."""
+    if aggregate is not None and aggregate not in ("mean", "max"):
+        raise HTTPException(status_code=400, detail="aggregate must be 'mean' or 'max'.")
+    if viz not in VIZ_MODES:
+        raise HTTPException(status_code=400, detail=f"viz must be one of {', '.join(VIZ_MODES)}.")
     if not file.filename:
         raise HTTPException(status_code=400, detail="Missing filename.")
-    if file.content_type not in ("audio/wav", "audio/x-wav", "audio/mpeg", "audio/mp3", "audio/wave"):
-        # some browsers send application/octet-stream; allow by extension fallback
-        ext = os.path.splitext(file.filename.lower())[1]
-        if ext not in (".wav", ".mp3"):
-            raise HTTPException(status_code=400, detail="Only WAV or MP3 files are supported.")
+    if not is_supported_audio(file.filename, file.content_type):
+        raise HTTPException(status_code=400, detail="Only WAV or MP3 files are supported.")
+
+
+async def predict_cache_key(
+    data: AudioSource, windowed: bool, aggregate: Optional[str], viz: str
+) -> Optional[str]:
+    cfg = dataclasses.replace(win_cfg, aggregate=aggregate or win_cfg.aggregate)
+    variant = f"windowed:{cfg.hop_seconds}:{cfg.aggregate}" if windowed else "predict"
+    return await cache_key(data, f"{variant}:viz={viz}:{VIZ_FINGERPRINT if viz != 'none' else ''}")
+
+
+async def predict_encoded(data: AudioSource, windowed: bool, aggregate: Optional[str], viz: str) -> Tuple[bytes, str]:
+    """
+    Encoded /predict response body and its cache status ("hit" | "miss" | "off").
+    Pipeline errors propagate (Saturated, ExecutorUnavailable, decode errors).
+    """
+    key = await predict_cache_key(data, windowed, aggregate, viz)
+    if key is not None:
+        hit = await asyncio.to_thread(cache.get, key)
+        if hit is not None:
+            return hit, "hit"
 
+    cfg = dataclasses.replace(win_cfg, aggregate=aggregate or win_cfg.aggregate)
+    if windowed:
+        label, confidence, probs, timeline, visualizations = await run_windowed_pipeline(data, cfg, viz)
+        body = {**format_prediction(label, confidence, probs), "aggregation": cfg.aggregate, "windows": timeline}
+    else:
+        label, confidence, probs, visualizations = await run_pipeline(data, viz)
+        body = format_prediction(label, confidence, probs)
+    if visualizations is not None:
+        body["visualizations"] = visualizations
+
+    with metrics.stage("serialize"):
+        encoded = json.dumps(body).encode("utf-8")
+    if key is not None:
+        await asyncio.to_thread(cache.put, key, encoded)
+    return encoded, "miss" if key is not None else "off"
+
+
+@app.post("/predict")
+async def predict(
+    file: UploadFile = File(...),
+    windowed: bool = False,
+    aggregate: Optional[str] = None,
+    viz: str = "json",
+) -> Dict[str, Any]:
+    """
+    `windowed=true` scores the whole recording as overlapping windows instead of only its
+    first duration_seconds, and adds a per-window `windows` timeline; `aggregate`
+    ("mean" | "max") overrides how windows combine into the clip-level result.
+    `viz` selects the visualization payload: "json" (float lists), "binary" (base64
+    uint8/float16 arrays with scale/offset) or "none" (skipped entirely).
+    """
+    check_predict_request(file, aggregate, viz)
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Model is warming up, retry shortly.")
+
+    data = await upload_source(file)
     try:
-        data = await file.read()
-        label, confidence, probs, viz = predict_from_audio_bytes(
-            file_bytes=data,
-            model_path=MODEL_PATH,
-            audio_cfg=audio_cfg,
-            feat_cfg=feat_cfg,
-            model_cfg=model_cfg,
-        )
+        encoded, cache_status = await predict_encoded(data, windowed, aggregate, viz)
+    except Saturated as e:
+        raise HTTPException(status_code=429, detail=f"Server busy: {e}", headers={"Retry-After": "1"})
+    except ExecutorUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except AudioTooLong as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Prediction failed: {str(e)}")
+    return json_response(encoded, cache_status)
+
+
+async def run_job(data: bytes, params: Dict[str, Any]) -> bytes:
+    encoded, _ = await predict_encoded(data, params["windowed"], params["aggregate"], params["viz"])
+    return encoded
+
+
+# Saturated pipeline: the job goes back to the queue rather than failing.
+job_runner = (
+    JobRunner(job_queue, run_job, job_cfg, ready=is_ready, retry_on=(Saturated,)) if job_queue is not None else None
+)
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    windowed: bool = False,
+    aggregate: Optional[str] = None,
+    viz: str = "json",
+) -> JSONResponse:
+    """
+    Queue a /predict call (same parameters) and return its job id immediately; poll
+    GET /jobs/{job_id}. Accepted during warm-up too. 429 once JOB_MAX_QUEUED are waiting.
+    """
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job API is disabled (JOB_WORKERS=0).")
+    check_predict_request(file, aggregate, viz)
+
+    data = await file.read()
+    params = {"filename": file.filename, "windowed": windowed, "aggregate": aggregate, "viz": viz}
+    # Re-uploads answered from the prediction cache complete on submit.
+    key = await predict_cache_key(data, windowed, aggregate, viz)
+    hit = await asyncio.to_thread(cache.get, key) if key is not None else None
+    try:
+        job_id = await asyncio.to_thread(job_queue.submit, data, params, hit)
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Job queue full: {e}", headers={"Retry-After": "5"})
+    job_runner.notify()
+    url = f"/jobs/{job_id}"
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job_id, "status": "done" if hit is not None else "queued", "status_url": url},
+        headers={"Location": url},
+    )
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> Response:
+    """Job status; once done, `result` is the same payload /predict returns."""
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Job API is disabled (JOB_WORKERS=0).")
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job id.")
+    result = job.pop("result", None)
+    body = json.dumps(job).encode("utf-8")
+    if result is not None:
+        # Splice the stored encoded response in instead of re-parsing it.
+        body = body[:-1] + b', "result": ' + result + b"}"
+    return Response(content=body, media_type="application/json")
+
+
+def unpack_zip(data: bytes) -> List[Tuple[str, Optional[bytes]]]:
+    """(name, bytes) for every file in the archive; bytes is None for non-audio members."""
+    out: List[Tuple[str, Optional[bytes]]] = []
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        infos = [
+            i for i in zf.infolist()
+            if not i.is_dir() and not i.filename.startswith("__MACOSX/") and not os.path.basename(i.filename).startswith(".")
+        ]
+        if sum(i.file_size for i in infos) > MAX_ZIP_UNCOMPRESSED_BYTES:
+            raise HTTPException(status_code=413, detail="Zip archive is too large once uncompressed.")
+        for info in infos:
+            if os.path.splitext(info.filename.lower())[1] in AUDIO_EXTENSIONS:
+                out.append((info.filename, zf.read(info)))
+            else:
+                out.append((info.filename, None))
+    return out
+
+
+@app.post("/predict/batch")
+async def predict_batch(files: List[UploadFile] = File(...)) -> Dict[str, Any]:
+    """
+    Several recordings in one request (multiple `files` parts, or a single .zip).
+    Files are featurized in parallel and scored with one batched forward pass;
+    a file that fails is reported in its own entry without failing the batch.
+    """
+    if not is_ready():
+        raise HTTPException(status_code=503, detail="Model is warming up, retry shortly.")
+    from ml.predict import decode_probabilities, infer_in_chunks, prepare_input
+
+    entries: List[Tuple[str, Optional[bytes]]] = []
+    for f in files:
+        name = f.filename or ""
+        if name.lower().endswith(".zip") or f.content_type in ("application/zip", "application/x-zip-compressed"):
+            try:
+                entries.extend(unpack_zip(await f.read()))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive: {name}")
+        elif name and is_supported_audio(name, f.content_type):
+            entries.append((name, await f.read()))
+        else:
+            entries.append((name, None))
+    if not entries:
+        raise HTTPException(status_code=400, detail="No files uploaded.")
+    if sum(1 for _, data in entries if data is not None) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FILES} audio files per batch.")
+
+    results: List[Dict[str, Any]] = [{"filename": name} for name, _ in entries]
+    keys: Dict[int, str] = {}
+    for i, (r, (_, data)) in enumerate(zip(results, entries)):
+        if data is None:
+            r["error"] = "Only WAV or MP3 files are supported."
+            continue
+        key = await cache_key(data, "batch")
+        if key is None:
+            continue
+        hit = await asyncio.to_thread(cache.get, key)
+        if hit is not None:
+            r.update(json.loads(hit))
+            entries[i] = (entries[i][0], None)  # already answered
+        else:
+            keys[i] = key
+
+    # Featurize in parallel, using at most one executor slot per worker so a big batch
+    # does not starve (or get rejected by) the pool's in-flight limit.
+    slots = asyncio.Semaphore(executor.max_workers)
+
+    async def featurize(data: bytes) -> np.ndarray:
+        async with slots:
+            x, _, _, _ = await executor.run(prepare_input, data, audio_cfg, feat_cfg, False, decode_cfg)
+            return x
+
+    todo = [i for i, (_, data) in enumerate(entries) if data is not None]
+    outcomes = await asyncio.gather(*(featurize(entries[i][1]) for i in todo), return_exceptions=True)
+    ok: List[Tuple[int, np.ndarray]] = []
+    for i, x in zip(todo, outcomes):
+        if isinstance(x, BaseException):
+            results[i]["error"] = f"Prediction failed: {x}"
+        else:
+            ok.append((i, x))
+
+    if ok:
+        x_b = np.stack([x for _, x in ok], axis=0)
+        infer = infer_in_worker if executor.mode == "process" else registry.predict
+        try:
+            probs_b = await executor.run(infer_in_chunks, infer, x_b, BATCH_INFER_CHUNK)
+        except Saturated as e:
+            raise HTTPException(status_code=429, detail=f"Server busy: {e}", headers={"Retry-After": "1"})
+        except ExecutorUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        for (i, _), row in zip(ok, probs_b):
+            pred = format_prediction(*decode_probabilities(row, model_cfg))
+            results[i].update(pred)
+            if i in keys:
+                await asyncio.to_thread(cache.put, keys[i], json.dumps(pred).encode("utf-8"))
 
     return {
-        "predicted_disease": label,
-        "confidence": round(confidence, 2),
-        "probabilities": {k: round(v, 4) for k, v in probs.items()},
-        "visualizations": viz,
+        "count": len(results),
+        "succeeded": sum(1 for r in results if "error" not in r),
+        "results": results,
     }
 
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lung sound classification API.")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="report per-import and per-phase startup timings (time to /health, /ready, first prediction) and exit",
+    )
+    parser.add_argument("--profile-json", default=None, help="also write the startup profile to this JSON file")
+    parser.add_argument(
+        "--precompile", action="store_true", help="run the DSP pipeline once to fill the numba cache, then exit"
+    )
+    args = parser.parse_args()
+
+    if args.precompile:
+        warm_up()
+    elif args.profile_startup:
+        import sys
+
+        from ml.startup import profile_startup
+
+        profile_startup(sys.modules[__name__], json_path=args.profile_json)
+    else:
+        import uvicorn
+
+        uvicorn.run(app, host=args.host, port=args.port)
@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import queue
+import sys
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+from .config import BatchConfig
+
+
+@dataclass
+class _Pending:
+    x: np.ndarray
+    future: Future
+    enqueued: float = field(default_factory=time.perf_counter)
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching for single-example inference requests:
+    - callers `submit` one (H, W, C) tensor and get a Future for its probability row
+    - a dispatcher thread runs one forward pass when max_batch_size requests are
+      queued or the oldest one has waited max_wait_ms, whichever comes first
+    Batch-size and queue-wait stats are kept for tuning both limits. An unexpected error
+    while collecting or dispatching a batch is logged, counted (`dispatch_errors`) and set
+    on every request of that batch; the dispatcher keeps running.
+    """
+
+    def __init__(self, infer: Callable[[np.ndarray], np.ndarray], cfg: BatchConfig, stats_window: int = 2048):
+        if cfg.max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.infer = infer
+        self.cfg = cfg
+        self._queue: "queue.Queue[Optional[_Pending]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._stats_lock = threading.Lock()
+        self._batch_sizes: Counter = Counter()
+        self._waits_ms: Deque[float] = deque(maxlen=stats_window)
+        self._infer_ms: Deque[float] = deque(maxlen=stats_window)
+        self._n_requests = 0
+        self._n_batches = 0
+        self._n_errors = 0
+        self._n_dispatch_errors = 0
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, x: np.ndarray) -> Future:
+        fut: Future = Future()
+        self._queue.put(_Pending(x=x, future=fut))
+        return fut
+
+    def __call__(self, x_b: np.ndarray) -> np.ndarray:
+        """Blocking (B, H, W, C) -> (B, n_classes); lets the batcher stand in for `infer`."""
+        futures = [self.submit(x) for x in x_b]
+        return np.stack([f.result() for f in futures], axis=0)
+
+    def _collect(self, batch: List[_Pending]) -> List[_Pending]:
+        """Append queued requests to `batch` (in place, so a failure knows what was dequeued)."""
+        first = batch[0]
+        deadline = first.enqueued + self.cfg.max_wait_ms / 1000.0
+        while len(batch) < self.cfg.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown sentinel: finish this batch, then exit.
+                self._queue.put(None)
+                break
+            if item.future.set_running_or_notify_cancel():
+                batch.append(item)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            # Requests whose caller went away (asyncio.wrap_future cancels the future) are
+            # dropped when dequeued; a running future can no longer be cancelled.
+            if not first.future.set_running_or_notify_cancel():
+                continue
+            batch = [first]
+            try:
+                self._dispatch(self._collect(batch))
+            except Exception as e:  # one bad batch must not stop the dispatcher
+                self._fail(batch, e)
+
+    def _fail(self, batch: List[_Pending], error: Exception) -> None:
+        """Resolve every still-pending request of a batch the dispatcher failed on."""
+        with self._stats_lock:
+            self._n_dispatch_errors += 1
+        print(f"Micro-batcher failed on a batch of {len(batch)}: {type(error).__name__}: {error}", file=sys.stderr)
+        for p in batch:
+            if not p.future.done():
+                try:
+                    p.future.set_exception(error)
+                except Exception:  # resolved concurrently
+                    pass
+
+    def _dispatch(self, batch: List[_Pending]) -> None:
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            probs = np.asarray(self.infer(np.stack([p.x for p in batch], axis=0)))
+        except Exception as e:
+            error = e
+        for i, p in enumerate(batch):
+            try:
+                if error is not None:
+                    p.future.set_exception(error)
+                else:
+                    p.future.set_result(probs[i])
+            except Exception as e:  # e.g. infer returned fewer rows than requests
+                if not p.future.done():
+                    p.future.set_exception(e)
+        done = time.perf_counter()
+
+        with self._stats_lock:
+            self._n_batches += 1
+            self._n_requests += len(batch)
+            self._n_errors += int(error is not None)
+            self._batch_sizes[len(batch)] += 1
+            self._infer_ms.append((done - started) * 1000.0)
+            self._waits_ms.extend((started - p.enqueued) * 1000.0 for p in batch)
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            waits = list(self._waits_ms)
+            infer_ms = list(self._infer_ms)
+            return {
+                "max_batch_size": self.cfg.max_batch_size,
+                "max_wait_ms": self.cfg.max_wait_ms,
+                "requests": self._n_requests,
+                "batches": self._n_batches,
+                "errors": self._n_errors,
+                "dispatch_errors": self._n_dispatch_errors,
+                "queue_depth": self._queue.qsize(),
+                "mean_batch_size": round(self._n_requests / self._n_batches, 3) if self._n_batches else 0.0,
+                "batch_size_histogram": {str(k): v for k, v in sorted(self._batch_sizes.items())},
+                "queue_wait_ms": {
+                    "mean": round(float(np.mean(waits)), 3) if waits else 0.0,
+                    "p50": round(_percentile(waits, 50), 3),
+                    "p95": round(_percentile(waits, 95), 3),
+                    "max": round(max(waits), 3) if waits else 0.0,
+                },
+                "infer_ms": {
+                    "mean": round(float(np.mean(infer_ms)), 3) if infer_ms else 0.0,
+                    "p95": round(_percentile(infer_ms, 95), 3),
+                },
+            }
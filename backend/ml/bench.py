@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+"""
+Benchmarks for the preprocessing, feature and inference hot paths.
+
+Inputs are synthetic lung sounds (breathing noise with wheezes and crackles) at
+several sample rates, durations and containers, so runs are reproducible without
+the dataset. Each case reports latency percentiles, throughput and the peak Python
+heap allocation of one call (tracemalloc, which numpy reports into).
+
+Run:
+  cd backend
+  python -m ml.bench --out bench.json                       # full suite
+  python -m ml.bench --quick --only 'features|infer'        # subset, fewer repeats
+  python -m ml.bench --baseline bench_baseline.json         # exit 1 on regressions
+  python -m ml.bench --out bench_baseline.json --quick      # (re)record a baseline
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import re
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import AudioConfig, FeatureConfig, ModelConfig, RuntimeConfig, cnn_input_shape
+
+SAMPLE_RATES = (8000, 16000, 22050, 44100)
+DURATIONS = (6.0, 30.0)
+FORMATS = ("wav", "mp3")
+LONG_DURATIONS = (180.0, 600.0)  # decode-path cases: multi-minute uploads
+
+
+def synth_lung_sound(seconds: float, sr: int, seed: int = 0) -> np.ndarray:
+    """
+    Deterministic stand-in for an auscultation recording: low-passed breath noise
+    under a ~4 s inhale/exhale envelope, a wheeze (gliding tone) on some breaths and
+    sparse crackles (damped transients). Peak amplitude 0.5.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * sr)
+    t = np.arange(n) / sr
+
+    # Breath noise: white noise through a short moving-average low-pass.
+    k = max(1, sr // 2000)
+    noise = np.convolve(rng.standard_normal(n + k - 1), np.ones(k) / k, mode="valid")
+    period = rng.uniform(3.5, 4.5)
+    envelope = np.abs(np.sin(np.pi * t / (period / 2))) ** 2
+    y = 0.3 * envelope * noise
+
+    breath = np.floor(t / (period / 2)).astype(np.int64)
+    wheezy = rng.random(int(breath.max()) + 1) < 0.5
+    f0 = rng.uniform(250.0, 600.0)
+    phase = 2 * np.pi * np.cumsum(f0 * (1.0 + 0.15 * np.sin(2 * np.pi * 0.5 * t))) / sr
+    y += 0.2 * envelope * wheezy[breath] * np.sin(phase)
+
+    crackle_len = max(8, int(0.01 * sr))
+    decay = np.exp(-np.arange(crackle_len) / (0.002 * sr)) * np.sin(2 * np.pi * 800.0 * np.arange(crackle_len) / sr)
+    for start in rng.integers(0, max(1, n - crackle_len), size=int(seconds * 3)):
+        y[start : start + crackle_len] += rng.uniform(0.3, 0.8) * decay[: n - start]
+
+    return (0.5 * y / (np.max(np.abs(y)) + 1e-8)).astype(np.float32)
+
+
+def encode_audio(y: np.ndarray, sr: int, fmt: str, channels: int = 1) -> bytes:
+    import soundfile as sf
+
+    if channels > 1:  # slightly different channels, so downmixing is not a no-op
+        y = np.stack([y * (1.0 - 0.1 * c) for c in range(channels)], axis=1)
+    buf = io.BytesIO()
+    if fmt == "mp3":
+        sf.write(buf, y, sr, format="MP3")
+    elif fmt == "flac":
+        sf.write(buf, y, sr, format="FLAC", subtype="PCM_16")
+    else:
+        sf.write(buf, y, sr, format="WAV", subtype="PCM_16")
+    return buf.getvalue()
+
+
+@dataclass
+class Case:
+    name: str
+    fn: Callable[[], Any]
+    items: int = 1  # clips (or requests) handled per call
+    audio_seconds: float = 0.0  # audio handled per call, for the real-time factor
+
+
+def time_case(case: Case, repeats: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        case.fn()
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        case.fn()
+        times.append(time.perf_counter() - t0)
+    t = np.asarray(times) * 1000.0
+
+    tracemalloc.start()
+    try:
+        case.fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median_s = float(np.median(t)) / 1000.0
+    out = {
+        "repeats": repeats,
+        "p50_ms": round(float(np.percentile(t, 50)), 3),
+        "p90_ms": round(float(np.percentile(t, 90)), 3),
+        "p99_ms": round(float(np.percentile(t, 99)), 3),
+        "mean_ms": round(float(t.mean()), 3),
+        "min_ms": round(float(t.min()), 3),
+        "throughput_per_s": round(case.items / median_s, 2) if median_s > 0 else None,
+        "peak_alloc_mb": round(peak / 2**20, 3),
+    }
+    if case.audio_seconds:
+        out["x_realtime"] = round(case.audio_seconds / median_s, 1) if median_s > 0 else None
+    return out
+
+
+def dsp_cases(audio_cfg: AudioConfig, feat_cfg: FeatureConfig, quick: bool) -> List[Case]:
+    from .engine import featurize_clip
+    from .features import extract_all_features
+    from .predict import prepare_input
+    from .preprocess import load_audio, pad_or_trim, reduce_noise, resample
+
+    srs = (16000, 44100) if quick else SAMPLE_RATES
+    durations = DURATIONS[:1] if quick else DURATIONS
+    cases: List[Case] = []
+    for seconds in durations:
+        for sr in srs:
+            y = synth_lung_sound(seconds, sr, seed=sr)
+            for fmt in FORMATS:
+                data = encode_audio(y, sr, fmt)
+                tag = f"{fmt}/{sr}Hz/{seconds:g}s"
+                cases.append(Case(f"load_audio[{tag}]", lambda d=data: load_audio(d, audio_cfg), 1, seconds))
+                if fmt == "wav":
+                    cases.append(Case(f"prepare_input[{tag}]", lambda d=data: prepare_input(d, audio_cfg, feat_cfg), 1, seconds))
+            if sr != audio_cfg.target_sr:
+                for tier in ("soxr_hq", "soxr_mq", "polyphase"):
+                    cases.append(
+                        Case(f"resample_{tier}[{sr}Hz/{seconds:g}s]", lambda y=y, sr=sr, t=tier: resample(y, sr, audio_cfg, t), 1, seconds)
+                    )
+                batch = np.stack([synth_lung_sound(seconds, sr, seed=s) for s in range(8)])
+                cases.append(
+                    Case(f"resample_soxr_mq[8x{sr}Hz/{seconds:g}s]", lambda b=batch, sr=sr: resample(b, sr, audio_cfg, "soxr_mq"), 8, 8 * seconds)
+                )
+
+        y = synth_lung_sound(seconds, audio_cfg.target_sr, seed=1)
+        cases.append(Case(f"reduce_noise[{seconds:g}s]", lambda y=y: reduce_noise(y), 1, seconds))
+
+    sr = audio_cfg.target_sr
+    clip = pad_or_trim(synth_lung_sound(audio_cfg.duration_seconds, sr, seed=2), sr, audio_cfg)
+    batch = np.stack([pad_or_trim(synth_lung_sound(audio_cfg.duration_seconds, sr, seed=s), sr, audio_cfg) for s in range(8)])
+    d = audio_cfg.duration_seconds
+    cases.append(Case("extract_all_features[1]", lambda: extract_all_features(clip, sr, feat_cfg), 1, d))
+    cases.append(Case("extract_all_features[8]", lambda: extract_all_features(batch, sr, feat_cfg), 8, 8 * d))
+    cases.append(Case("featurize_clip", lambda: featurize_clip(clip, sr, audio_cfg, feat_cfg), 1, d))
+    return cases
+
+
+def decode_cases(audio_cfg: AudioConfig, quick: bool) -> List[Case]:
+    """
+    Multi-minute uploads through the decoder: `librosa` (librosa.load, the previous
+    load_audio), `fast` (sniffed soundfile read of the whole file) and `fast_window`
+    (only duration_seconds + margin, as single-window /predict decodes).
+    """
+    from .config import DecodeConfig
+    from .decode import decode_audio
+
+    window = audio_cfg.duration_seconds + DecodeConfig.margin_seconds
+    durations = LONG_DURATIONS[:1] if quick else LONG_DURATIONS
+    cases: List[Case] = []
+    for seconds in durations:
+        y = synth_lung_sound(seconds, 44100, seed=int(seconds))
+        for fmt, channels in (("wav", 1), ("wav", 2), ("flac", 2), ("mp3", 2)):
+            data = encode_audio(y, 44100, fmt, channels)
+            tag = f"{fmt}/{channels}ch/44100Hz/{seconds:g}s"
+            cases.append(Case(f"decode_librosa[{tag}]", lambda d=data: decode_audio(d, fast_path=False), 1, seconds))
+            cases.append(Case(f"decode_fast[{tag}]", lambda d=data: decode_audio(d), 1, seconds))
+            cases.append(Case(f"decode_fast_window[{tag}]", lambda d=data: decode_audio(d, max_seconds=window), 1, seconds))
+    return cases
+
+
+def inference_cases(model_path: str, input_shape: Tuple[int, int, int], runtime_cfg: RuntimeConfig) -> List[Case]:
+    from .registry import ModelRegistry
+
+    registry = ModelRegistry(model_path, input_shape, runtime_cfg)
+    registry.load()
+    if not registry.ready:
+        raise RuntimeError(f"Model failed to load: {registry.error}")
+    rng = np.random.default_rng(0)
+    cases = []
+    for b in (1, 8, 32):
+        x_b = rng.standard_normal((b,) + input_shape).astype(np.float32)
+        cases.append(Case(f"infer[{runtime_cfg.backend}/{b}]", lambda x_b=x_b: registry.predict(x_b), b))
+    return cases
+
+
+def api_cases(quick: bool) -> Tuple[List[Case], Callable[[], None]]:
+    """End-to-end /predict through the in-process ASGI client (cache off, so every call runs the pipeline)."""
+    os.environ["PREDICTION_CACHE_MB"] = "0"
+    os.environ.pop("PREDICTION_CACHE_DB", None)
+    import main
+    from fastapi.testclient import TestClient
+
+    client = TestClient(main.app)
+    client.__enter__()
+    if not main.registry.wait(timeout=600) or not main.registry.ready:
+        client.__exit__(None, None, None)
+        raise RuntimeError(f"API not ready: {main.registry.error}")
+
+    def post(data: bytes, query: str = "") -> None:
+        r = client.post(f"/predict{query}", files={"file": ("bench.wav", data, "audio/wav")})
+        if r.status_code != 200:
+            raise RuntimeError(f"/predict{query} -> {r.status_code}: {r.text[:300]}")
+
+    cases = []
+    for sr in (16000,) if quick else (16000, 44100):
+        data = encode_audio(synth_lung_sound(6.0, sr, seed=3), sr, "wav")
+        cases.append(Case(f"api_predict[{sr}Hz/6s]", lambda d=data: post(d), 1, 6.0))
+        cases.append(Case(f"api_predict_viz_none[{sr}Hz/6s]", lambda d=data: post(d, "?viz=none"), 1, 6.0))
+    long_clip = encode_audio(synth_lung_sound(30.0, 16000, seed=4), 16000, "wav")
+    cases.append(Case("api_predict_windowed[16000Hz/30s]", lambda: post(long_clip, "?windowed=true&viz=none"), 1, 30.0))
+    return cases, lambda: client.__exit__(None, None, None)
+
+
+def environment() -> Dict[str, Any]:
+    import librosa
+
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "librosa": librosa.__version__,
+    }
+
+
+def compare(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    time_threshold: float,
+    memory_threshold: float,
+    metric: str = "p50_ms",
+) -> List[Dict[str, Any]]:
+    """One row per case present in both runs; `regression` when a ratio exceeds 1 + threshold."""
+    rows = []
+    for name in sorted(set(current) & set(baseline)):
+        cur, base = current[name], baseline[name]
+        time_ratio = cur[metric] / base[metric] if base.get(metric) else None
+        mem_ratio = cur["peak_alloc_mb"] / base["peak_alloc_mb"] if base.get("peak_alloc_mb") else None
+        rows.append(
+            {
+                "case": name,
+                "baseline_ms": base[metric],
+                "current_ms": cur[metric],
+                "time_ratio": round(time_ratio, 3) if time_ratio is not None else None,
+                "memory_ratio": round(mem_ratio, 3) if mem_ratio is not None else None,
+                "regression": bool(
+                    (time_ratio is not None and time_ratio > 1.0 + time_threshold)
+                    or (mem_ratio is not None and mem_ratio > 1.0 + memory_threshold)
+                ),
+            }
+        )
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the preprocessing, feature, inference and /predict paths.")
+    parser.add_argument("--out", default="bench.json", help="results JSON path")
+    parser.add_argument("--baseline", default=None, help="compare against this results JSON; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed p50 slowdown vs the baseline (0.15 = +15%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed peak-allocation growth vs the baseline")
+    parser.add_argument("--metric", default="p50_ms", choices=("p50_ms", "p90_ms", "mean_ms", "min_ms"))
+    parser.add_argument("--repeats", type=int, default=None, help="timed calls per case (default 20, 5 with --quick)")
+    parser.add_argument("--quick", action="store_true", help="fewer sample rates/durations and repeats")
+    parser.add_argument("--only", default=None, help="regex; run only matching cases")
+    parser.add_argument("--no-decode", action="store_true", help="skip the multi-minute decode cases")
+    parser.add_argument("--no-model", action="store_true", help="skip inference and /predict cases")
+    parser.add_argument("--no-api", action="store_true", help="skip end-to-end /predict cases")
+    parser.add_argument("--backend", choices=("keras", "tflite"), default=os.getenv("MODEL_BACKEND", RuntimeConfig.backend))
+    args = parser.parse_args(argv)
+    repeats = args.repeats or (5 if args.quick else 20)
+
+    audio_cfg, feat_cfg, model_cfg = AudioConfig(), FeatureConfig(), ModelConfig()
+    runtime_cfg = RuntimeConfig(backend=args.backend)
+    input_shape = cnn_input_shape(audio_cfg, feat_cfg, model_cfg)
+
+    cases = dsp_cases(audio_cfg, feat_cfg, args.quick)
+    if not args.no_decode:
+        cases += decode_cases(audio_cfg, args.quick)
+    close_api: Optional[Callable[[], None]] = None
+    if not args.no_model:
+        cases += inference_cases(os.path.join("model", "model.h5"), input_shape, runtime_cfg)
+        if not args.no_api:
+            os.environ["MODEL_BACKEND"] = args.backend
+            api, close_api = api_cases(args.quick)
+            cases += api
+    if args.only:
+        pattern = re.compile(args.only)
+        cases = [c for c in cases if pattern.search(c.name)]
+
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        for case in cases:
+            results[case.name] = time_case(case, repeats)
+            r = results[case.name]
+            print(
+                f"{case.name:<44} p50 {r['p50_ms']:>9.2f} ms  p90 {r['p90_ms']:>9.2f} ms  "
+                f"{r['throughput_per_s']:>8.1f}/s  peak {r['peak_alloc_mb']:>7.2f} MB"
+            )
+    finally:
+        if close_api is not None:
+            close_api()
+
+    report: Dict[str, Any] = {"environment": environment(), "repeats": repeats, "results": results}
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline["results"], args.threshold, args.memory_threshold, args.metric)
+        regressions = [r for r in rows if r["regression"]]
+        report["comparison"] = {
+            "baseline": args.baseline,
+            "metric": args.metric,
+            "threshold": args.threshold,
+            "memory_threshold": args.memory_threshold,
+            "cases": rows,
+        }
+        print(f"\nvs {args.baseline} ({args.metric}, +{args.threshold:.0%} time / +{args.memory_threshold:.0%} memory allowed):")
+        for r in rows:
+            flag = "REGRESSION" if r["regression"] else ""
+            print(f"  {r['case']:<44} x{r['time_ratio']}  mem x{r['memory_ratio']}  {flag}")
+        missing = sorted(set(baseline["results"]) - set(results))
+        if missing and not args.only:
+            print(f"  not run (in baseline): {', '.join(missing)}")
+        if regressions:
+            print(f"{len(regressions)} regression(s).")
+            exit_code = 1
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.out}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
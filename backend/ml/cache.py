@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional, Union
+
+from .config import CacheConfig
+
+
+class PredictionCache:
+    """
+    Content-addressed cache of encoded prediction responses:
+    - key = sha256(audio bytes) + config fingerprint + model fingerprint + request variant
+    - in-memory LRU bounded by encoded bytes
+    - optional sqlite tier that survives restarts (bounded by bytes, least recently used out)
+    Entries of other model fingerprints are dropped as soon as a new model fingerprint is
+    seen, so replacing model.h5 invalidates the cache on the next worker start.
+    """
+
+    def __init__(self, cfg: CacheConfig, config_fp: str):
+        self.cfg = cfg
+        self.config_fp = config_fp
+        self._mem: "OrderedDict[str, bytes]" = OrderedDict()
+        self._mem_bytes = 0
+        self._model_fp: Optional[str] = None
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        if cfg.disk_path:
+            os.makedirs(os.path.dirname(cfg.disk_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(cfg.disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS predictions ("
+                " key TEXT PRIMARY KEY, model_fp TEXT NOT NULL, value BLOB NOT NULL,"
+                " size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.cfg.max_memory_bytes > 0 or self._db is not None
+
+    def make_key(self, data: Union[bytes, BinaryIO], model_fp: str, variant: str) -> str:
+        """`data` is the upload's bytes or a seekable file (hashed in chunks, then rewound)."""
+        self._use_model(model_fp)
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            h = hashlib.sha256(data)
+        else:
+            h = hashlib.sha256()
+            data.seek(0)
+            for block in iter(lambda: data.read(1 << 20), b""):
+                h.update(block)
+            data.seek(0)
+        h.update(f"|{self.config_fp}|{model_fp}|{variant}".encode("utf-8"))
+        return h.hexdigest()
+
+    def _use_model(self, model_fp: str) -> None:
+        """Switching model fingerprint invalidates everything cached for the previous one."""
+        with self._lock:
+            if model_fp == self._model_fp:
+                return
+            self._model_fp = model_fp
+            self._mem.clear()
+            self._mem_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions WHERE model_fp != ?", (model_fp,))
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._mem.get(key)
+            if value is not None:
+                self._mem.move_to_end(key)
+                self.hits_memory += 1
+                return value
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE predictions SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self.hits_disk += 1
+                    self._mem_put(key, bytes(row[0]))
+                    return bytes(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            self._mem_put(key, value)
+            if self._db is not None and len(value) <= self.cfg.max_disk_bytes:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO predictions (key, model_fp, value, size, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, self._model_fp or "", value, len(value), time.time()),
+                )
+                self._evict_disk()
+
+    def _mem_put(self, key: str, value: bytes) -> None:
+        if len(value) > self.cfg.max_memory_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old)
+        self._mem[key] = value
+        self._mem_bytes += len(value)
+        while self._mem_bytes > self.cfg.max_memory_bytes:
+            _, evicted = self._mem.popitem(last=False)
+            self._mem_bytes -= len(evicted)
+
+    def _evict_disk(self) -> None:
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM predictions").fetchone()
+        if total <= self.cfg.max_disk_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM predictions ORDER BY accessed ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.cfg.max_disk_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM predictions WHERE key = ?", doomed)
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            hits = self.hits_memory + self.hits_disk
+            lookups = hits + self.misses
+            return {
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._mem),
+                "memory_bytes": self._mem_bytes,
+                "disk": bool(self._db is not None),
+                "model_fingerprint": self._model_fp,
+            }
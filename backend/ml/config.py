@@ -1,5 +1,9 @@
+import dataclasses
+import hashlib
+import json
+import os
 from dataclasses import dataclass
-from typing import List
+from typing import Any, List, Tuple
 
 
 @dataclass(frozen=True)
@@ -7,6 +11,8 @@ class AudioConfig:
     target_sr: int = 16000
     duration_seconds: float = 6.0  # pad/trim to fixed length for CNN stability
     top_db: int = 30  # used by librosa effects (optional)
+    resample_serving: str = "soxr_hq"  # ml.resample tier for /predict; same as training (soxr_mq is opt-in, see ml.resample)
+    resample_training: str = "soxr_hq"  # tier for dataset featurization
 
 
 @dataclass(frozen=True)
@@ -17,6 +23,7 @@ class FeatureConfig:
     hop_length: int = 256
     fmin: int = 20
     fmax: int = 8000
+    shared_stft: bool = False  # opt-in: serve features from one STFT per clip (approximate, see ml.engine)
 
 
 @dataclass(frozen=True)
@@ -30,3 +37,93 @@ class ModelConfig:
     )
     input_channels: int = 2  # [mel, mfcc] stacked
 
+
+@dataclass(frozen=True)
+class BatchConfig:
+    max_batch_size: int = 8  # flush as soon as this many requests are queued
+    max_wait_ms: float = 5.0  # ...or when the oldest queued request waited this long
+
+
+@dataclass(frozen=True)
+class ExecutorConfig:
+    mode: str = "thread"  # "thread": preprocessing in threads, batched inference in-process; "process": whole pipeline per process
+    max_workers: int = 0  # 0 -> os.cpu_count()
+    max_pending: int = 0  # in-flight + queued requests before rejecting with 429; 0 -> 4 * max_workers
+
+
+@dataclass(frozen=True)
+class WindowConfig:
+    hop_seconds: float = 3.0  # window length is AudioConfig.duration_seconds; 50% overlap by default
+    aggregate: str = "mean"  # "mean" of window probabilities, or "max" = the most confident window
+    batch_size: int = 8  # windows featurized + scored together (bounds memory for long clips)
+    max_windows: int = 200  # longest windowed upload: duration + (max_windows - 1) * hop seconds (~10 min); 0 = no cap
+
+
+@dataclass(frozen=True)
+class CacheConfig:
+    max_memory_bytes: int = 64 * 1024 * 1024  # in-process LRU of encoded responses; 0 disables
+    disk_path: str = ""  # sqlite file for a tier that survives restarts; "" disables
+    max_disk_bytes: int = 512 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class UploadConfig:
+    max_bytes: int = 50 * 1024 * 1024  # /predict and /jobs bodies; larger uploads get 413 before they are read
+    max_batch_bytes: int = 256 * 1024 * 1024  # /predict/batch bodies
+    spool_bytes: int = 1024 * 1024  # upload buffer kept in memory; larger parts roll over to a temp file
+    sniff: bool = True  # reject single-file uploads whose first bytes are not WAV/FLAC/OGG/MP3 (415)
+
+
+@dataclass(frozen=True)
+class JobConfig:
+    db_path: str = os.path.join("jobs", "jobs.sqlite3")  # local sqlite queue (uploads are stored until done)
+    workers: int = 2  # jobs processed concurrently per API process; 0 disables the job API
+    max_queued: int = 256  # waiting jobs before POST /jobs answers 429
+    retention_seconds: float = 3600.0  # finished jobs (and their results) are deleted after this
+    max_attempts: int = 3  # claims before a job whose worker keeps dying is marked failed
+    lease_seconds: float = 30.0  # a running job whose heartbeat is older than this is recovered
+    poll_interval_seconds: float = 1.0  # idle workers re-check the queue this often (and on every submit)
+    cleanup_interval_seconds: float = 60.0
+
+
+@dataclass(frozen=True)
+class DecodeConfig:
+    fast_path: bool = True  # sniff the container and read with soundfile; False = librosa.load for everything
+    truncate: bool = False  # opt-in: single-window /predict decodes only duration_seconds + margin_seconds (approximate)
+    margin_seconds: float = 1.0  # context past the kept window for the resampler and gate statistics
+
+
+@dataclass(frozen=True)
+class VizConfig:
+    waveform_points: int = 2000  # peak-preserving buckets over the whole clip
+    mel_height: int = 128
+    mel_width: int = 128  # the whole clip is pooled down to this many frames (not cropped)
+    mel_pool: str = "area"  # "area" (block mean) or "max"
+    binary_dtype: str = "uint8"  # viz=binary arrays: "uint8" (with scale/offset) or "float16"
+
+
+@dataclass(frozen=True)
+class RuntimeConfig:
+    backend: str = "keras"  # "keras" (model.h5 via TensorFlow) or "tflite" (exported artifact, no TensorFlow import)
+    tflite_path: str = os.path.join("model", "model.tflite")  # written by `python -m ml.export`
+    num_threads: int = 0  # TFLite interpreter threads; 0 -> runtime default
+    intra_op_threads: int = 0  # TensorFlow threads per op; 0 -> TF default (all cores)
+    inter_op_threads: int = 0  # TensorFlow ops run concurrently; 0 -> TF default
+    xla: bool = False  # XLA JIT-compile the inference function (and train step)
+    precision: str = "float32"  # "float32" | "mixed_bfloat16" (only on CPUs with bf16 support) | "auto"
+
+
+def config_fingerprint(*cfgs: Any) -> str:
+    """Stable hash of dataclass config values (e.g. AudioConfig, FeatureConfig)."""
+    payload = json.dumps([[type(c).__name__, dataclasses.asdict(c)] for c in cfgs], sort_keys=True, default=list)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def cnn_input_shape(audio_cfg: AudioConfig, feat_cfg: FeatureConfig, model_cfg: ModelConfig) -> Tuple[int, int, int]:
+    """
+    (H, W, C) produced by extract_all_features for a padded/trimmed clip.
+    librosa centers frames, so a clip of N samples yields 1 + N // hop_length frames.
+    """
+    n_samples = int(audio_cfg.duration_seconds * audio_cfg.target_sr)
+    n_frames = 1 + n_samples // feat_cfg.hop_length
+    return feat_cfg.n_mels, n_frames, model_cfg.input_channels
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+"""
+Shared-STFT feature engine for serving.
+
+The reference path (preprocess_audio + extract_all_features) transforms every clip
+STFT -> ISTFT (spectral gate) -> STFT (features). Here a single analysis STFT of the
+resampled clip feeds everything: the gate mask, the denoised power spectrum, the mel
+power, the dB mel and the MFCCs (DCT of the same log-mel). The time domain is only
+revisited (one ISTFT) when the caller asks for the denoised waveform, e.g. for plots.
+
+What the round trip did to gated bins (re-analysis of an inconsistent spectrogram) is
+approximated in closed form: since STFT(ISTFT(S)) = S for the unmasked spectrum, the
+gated spectrum re-analyses to S - P(S_removed). Its power is estimated per bin as
+  kept bins:    |S|^2                     + leak(S_removed)
+  removed bins: (1 - c0)^2 |S_removed|^2  + leak(S_removed)
+with c0 the diagonal of the projection P and leak() the incoherent (power) spread of
+P over neighbouring bins/frames, both measured once per (n_fft, hop).
+
+Measured error vs the reference path (standardized CNN input, 16 kHz, 30 clips each):
+  synthetic breathing + crackles (ml.bench), 1-30 s:  mean |dx| <= 0.06,
+      95th percentile <= 0.21, max 5.4
+  gain-varied / amplitude-modulated noise, 1-12 s:   mean |dx| <= 0.08,
+      95th percentile <= 0.31, max 23 (isolated frames near the gate threshold)
+The large errors sit on single frames, but they are enough to move class
+probabilities by several percentage points, so the engine is opt-in
+(FeatureConfig.shared_stft=True, SHARED_STFT=1 in the API); by default
+featurize_clip runs the reference path. tests/test_engine.py checks both bounds.
+The returned waveform matches preprocess_audio to float32 round-off.
+"""
+
+import functools
+from typing import Dict, Optional, Tuple
+
+import librosa
+import numpy as np
+import scipy.signal
+
+from . import metrics
+from .config import AudioConfig, FeatureConfig
+from .features import _to_db, extract_all_features, features_to_cnn_input, mel_basis, mfcc_from_mel_power
+from .preprocess import GATE_HOP, GATE_N_FFT, noise_gate_mask, normalize, pad_or_trim, reduce_noise
+
+
+@functools.lru_cache(maxsize=None)
+def _gate_leakage(n_fft: int, hop: int) -> Tuple[float, np.ndarray]:
+    """(c0, 5x5 off-diagonal power kernel) of STFT(ISTFT(.)) for this framing."""
+    n_frames = 4 * (n_fft // hop) + 9
+    k, t = n_fft // 4, n_frames // 2
+    impulse = np.zeros((1 + n_fft // 2, n_frames), dtype=np.complex64)
+    impulse[k, t] = 1.0
+    y = librosa.istft(impulse, hop_length=hop, length=(n_frames - 1) * hop)
+    r = librosa.stft(y, n_fft=n_fft, hop_length=hop)
+    c0 = float(np.real(r[k, t]))
+    kernel = np.abs(r[k - 2 : k + 3, t - 2 : t + 3]) ** 2
+    kernel[2, 2] = 0.0
+    return c0, kernel.astype(np.float32)
+
+
+def _gated_stft(y: np.ndarray, n_frames: int) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Analysis STFT of `y` (zero padded to at least n_frames frames), the gate mask, and
+    the number of frames that cover the un-padded clip (the noise floor reference).
+    """
+    n_valid = 1 + len(y) // GATE_HOP
+    min_len = (n_frames - 1) * GATE_HOP
+    if len(y) < min_len:
+        y = np.pad(y, (0, min_len - len(y)))
+    stft = librosa.stft(y, n_fft=GATE_N_FFT, hop_length=GATE_HOP)
+    mask = noise_gate_mask(np.abs(stft), n_ref_frames=n_valid)
+    return stft, mask, n_valid
+
+
+def gated_power_spectrum(stft: np.ndarray, mask: np.ndarray, n_frames: int) -> np.ndarray:
+    """
+    Power spectrum (1 + n_fft/2, n_frames) of the gated clip as a second STFT of its
+    waveform would see it, without going back to the time domain.
+    """
+    # Two extra frames of context so the leakage estimate is right at the last kept frame.
+    keep = min(stft.shape[1], n_frames + 2)
+    power = np.abs(stft[:, :keep]) ** 2
+    mask = mask[:, :keep]
+
+    c0, kernel = _gate_leakage(GATE_N_FFT, GATE_HOP)
+    removed = np.where(mask, 0.0, power)
+    est = np.where(mask, power, (1.0 - c0) ** 2 * removed)
+    est += scipy.signal.fftconvolve(removed, kernel, mode="same")
+    est = np.maximum(est, 0.0)[:, :n_frames]
+    if est.shape[1] < n_frames:
+        est = np.pad(est, ((0, 0), (0, n_frames - est.shape[1])))
+    return est.astype(np.float32)
+
+
+def _peak_gain(y: np.ndarray, eps: float = 1e-8) -> float:
+    """Scale applied by preprocess.normalize, estimated from the un-gated clip."""
+    mx = float(np.max(np.abs(y - np.mean(y))))
+    return 1.0 if mx < eps else 1.0 / mx
+
+
+def featurize_clip(
+    y: np.ndarray,
+    sr: int,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    return_waveform: bool = True,
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], Optional[np.ndarray]]:
+    """
+    Resampled (un-gated, un-normalized) clip -> (x, {"mel", "mfcc"}, waveform).
+    `waveform` is the denoised, normalized, padded/trimmed clip (as preprocess_audio
+    returns it) when `return_waveform` is set, otherwise None.
+    Falls back to the reference path when the feature framing differs from the gate's.
+    """
+    if (
+        not feat_cfg.shared_stft
+        or feat_cfg.n_fft != GATE_N_FFT
+        or feat_cfg.hop_length != GATE_HOP
+        or y.size < GATE_N_FFT
+    ):
+        y_p = pad_or_trim(normalize(reduce_noise(y)), sr, audio_cfg)
+        x, feats = extract_all_features(y_p, sr, feat_cfg)
+        return x, feats, y_p
+
+    n_samples = int(audio_cfg.duration_seconds * sr)
+    n_frames = 1 + n_samples // feat_cfg.hop_length
+    with metrics.stage("noise_gate"):
+        stft, mask, n_valid = _gated_stft(y, n_frames)
+        power = gated_power_spectrum(stft, mask, n_frames) * (_peak_gain(y) ** 2)
+
+    with metrics.stage("features"):
+        mel_power = mel_basis(sr, feat_cfg) @ power
+        mel = _to_db(mel_power)
+        mfcc = mfcc_from_mel_power(mel_power, feat_cfg)
+        x = features_to_cnn_input(mel, mfcc)
+
+    waveform = None
+    if return_waveform:
+        # Same result as reduce_noise(y), reusing this STFT (frames past the clip are padding).
+        with metrics.stage("waveform"):
+            y_d = librosa.istft(stft[:, :n_valid] * mask[:, :n_valid], hop_length=GATE_HOP, length=len(y))
+            waveform = pad_or_trim(normalize(y_d.astype(np.float32)), sr, audio_cfg)
+    return x, {"mel": mel, "mfcc": mfcc}, waveform
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .config import AudioConfig, DecodeConfig, ExecutorConfig, FeatureConfig, ModelConfig, RuntimeConfig, VizConfig, WindowConfig
+
+
+class Saturated(RuntimeError):
+    """All worker slots and the bounded queue are taken; the caller should retry later."""
+
+
+class ExecutorUnavailable(RuntimeError):
+    """The pool was shut down or a worker process died."""
+
+
+# --- process-mode worker side ------------------------------------------------------------
+
+_worker_registry = None  # one ModelRegistry per worker process
+
+
+def init_worker(
+    model_path: str,
+    input_shape: Tuple[int, int, int],
+    runtime_cfg: RuntimeConfig = RuntimeConfig(),
+    audio_cfg: Optional[AudioConfig] = None,
+    feat_cfg: Optional[FeatureConfig] = None,
+) -> None:
+    """
+    ProcessPoolExecutor initializer: load + warm up the model once per process
+    (and the DSP pipeline too when the configs are given).
+    """
+    global _worker_registry
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    from .registry import ModelRegistry
+
+    warmup = None
+    if audio_cfg is not None and feat_cfg is not None:
+        from .predict import warm_up_pipeline
+
+        warmup = functools.partial(warm_up_pipeline, audio_cfg, feat_cfg)
+    _worker_registry = ModelRegistry(model_path, input_shape, runtime_cfg, warmup=warmup)
+    _worker_registry.load()
+
+
+def worker_info() -> Dict[str, object]:
+    return {
+        "pid": os.getpid(),
+        "fingerprint": _worker_registry.fingerprint if _worker_registry is not None else None,
+    }
+
+
+def infer_in_worker(x_b: np.ndarray) -> np.ndarray:
+    """(B, H, W, C) -> (B, n_classes) with this worker's model."""
+    if _worker_registry is None:
+        raise RuntimeError("Worker was started without init_worker.")
+    return _worker_registry.predict(x_b)
+
+
+def predict_in_worker(
+    file_bytes: bytes,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    model_cfg: ModelConfig,
+    viz: str = "json",
+    viz_cfg: VizConfig = VizConfig(),
+    decode_cfg: DecodeConfig = DecodeConfig(),
+) -> Tuple[str, float, Dict[str, float], Optional[Dict[str, object]]]:
+    """Full decode -> features -> inference pipeline inside a worker process."""
+    from .predict import predict_from_audio_bytes
+
+    if _worker_registry is None:
+        raise RuntimeError("Worker was started without init_worker.")
+    return predict_from_audio_bytes(
+        file_bytes=file_bytes,
+        model_path=_worker_registry.model_path,
+        audio_cfg=audio_cfg,
+        feat_cfg=feat_cfg,
+        model_cfg=model_cfg,
+        infer=_worker_registry.predict,
+        viz=viz,
+        viz_cfg=viz_cfg,
+        decode_cfg=decode_cfg,
+    )
+
+
+def predict_windowed_in_worker(
+    file_bytes: bytes,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    model_cfg: ModelConfig,
+    win_cfg: WindowConfig,
+    viz: str = "json",
+    viz_cfg: VizConfig = VizConfig(),
+    decode_cfg: DecodeConfig = DecodeConfig(),
+) -> Tuple[str, float, Dict[str, float], List[Dict[str, object]], Optional[Dict[str, object]]]:
+    """Sliding-window pipeline inside a worker process."""
+    from .predict import predict_windowed_from_audio_bytes
+
+    if _worker_registry is None:
+        raise RuntimeError("Worker was started without init_worker.")
+    return predict_windowed_from_audio_bytes(
+        file_bytes,
+        audio_cfg,
+        feat_cfg,
+        model_cfg,
+        win_cfg,
+        infer=_worker_registry.predict,
+        viz=viz,
+        viz_cfg=viz_cfg,
+        decode_cfg=decode_cfg,
+    )
+
+
+# --- API side -----------------------------------------------------------------------------
+
+
+class PipelineExecutor:
+    """
+    Runs CPU-bound pipeline steps off the asyncio event loop:
+    - "thread": a ThreadPoolExecutor (numpy/librosa/TF release the GIL for the heavy parts)
+    - "process": a spawn-context ProcessPoolExecutor; `initializer` loads a model per process
+    Concurrency is bounded: once max_pending calls are in flight, `run` raises Saturated
+    immediately instead of queueing without limit. A process pool that loses a worker is
+    rebuilt (the failing call gets ExecutorUnavailable; `ready` is False until it warms up).
+    """
+
+    def __init__(
+        self,
+        cfg: ExecutorConfig,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: Tuple[Any, ...] = (),
+    ):
+        if cfg.mode not in ("thread", "process"):
+            raise ValueError(f"Unknown executor mode: {cfg.mode!r} (expected 'thread' or 'process')")
+        self.cfg = cfg
+        self.mode = cfg.mode
+        self.max_workers = cfg.max_workers or (os.cpu_count() or 1)
+        self.max_pending = cfg.max_pending or 4 * self.max_workers
+        self._initializer = initializer
+        self._initargs = initargs
+        self._pool: Optional[Executor] = None
+        self._warmup: List[Future] = []
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._restarts = 0
+
+    def start(self) -> None:
+        if self._pool is not None:
+            return
+        if self.mode == "process":
+            # TensorFlow is not fork-safe: always spawn.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self._initializer,
+                initargs=self._initargs,
+            )
+            # Force every worker to spawn (and run its initializer) before traffic arrives.
+            self._warmup = [self._pool.submit(worker_info) for _ in range(self.max_workers)]
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+
+    def _restart(self, broken: Executor) -> None:
+        """
+        Replace a process pool that lost a worker. Until the new workers have warmed up,
+        `ready` is False. A pool that broke during warm-up (failing initializer) is kept,
+        so /ready reports its error instead of respawning on every request.
+        """
+        if self._pool is not broken or not self.ready:
+            return  # already replaced by a concurrent request, or never came up
+        self._pool = None
+        self._restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self.start()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    @property
+    def ready(self) -> bool:
+        if self._pool is None:
+            return False
+        return all(f.done() and f.exception() is None for f in self._warmup)
+
+    @property
+    def error(self) -> Optional[str]:
+        for f in self._warmup:
+            if f.done() and f.exception() is not None:
+                e = f.exception()
+                return f"{type(e).__name__}: {e}"
+        return None
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """Model fingerprint reported by the process workers (None in thread mode / before warm-up)."""
+        for f in self._warmup:
+            if f.done() and f.exception() is None:
+                return f.result()["fingerprint"]
+        return None
+
+    def _acquire(self) -> None:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise Saturated(f"{self._pending} requests in flight (limit {self.max_pending}).")
+            self._pending += 1
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        pool = self._pool
+        if pool is None:
+            raise ExecutorUnavailable("Executor is not running.")
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            if self.mode == "process":
+                # Worker-side metrics come back with the result and are folded in here.
+                result, recorded = await loop.run_in_executor(pool, functools.partial(metrics.collect, fn, *args))
+                metrics.replay(recorded)
+                return result
+            # Pool threads see the caller's context (its per-request metrics recorder).
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(pool, functools.partial(ctx.run, fn, *args))
+        except BrokenProcessPool as e:
+            self._restart(pool)
+            raise ExecutorUnavailable(f"Worker process died: {e}") from e
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "in_flight": self._pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "restarts": self._restarts,
+            }
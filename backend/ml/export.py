@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+"""
+Export model/model.h5 to a TFLite artifact for the TensorFlow-free serving backend.
+
+Quantization:
+  none     float32 weights and activations
+  float16  float16 weights (about half the size, float32 compute on CPU)
+  int8     int8 weights + activations, calibrated on a sample of real features;
+           the model keeps float32 input/output so callers do not change
+
+The export also scores the Keras model and the artifact on a sample of ml.train's
+held-out test split (calibration draws from the training split) and writes an
+accuracy/latency report.
+
+Run:
+  cd backend
+  python -m ml.export --quantize int8
+  MODEL_BACKEND=tflite uvicorn main:app
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from .config import AudioConfig, FeatureConfig, ModelConfig, RuntimeConfig, cnn_input_shape
+from .feature_store import FeatureStore, ensure_features
+from .featurize import featurize_files
+from .predict import TFLiteModel
+from .train import TrainConfig, TrainPaths, load_metadata, split_train_test
+
+QUANTIZE_MODES = ("none", "float16", "int8")
+
+
+def sample_features(
+    paths: TrainPaths,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    model_cfg: ModelConfig,
+    n: int,
+    seed: int,
+    workers: int = 0,
+    split: str = "test",
+    split_seed: int = TrainConfig.seed,
+) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Up to `n` (features, labels) from one side ("train" or "test") of ml.train's split
+    for `split_seed`, through the training feature store.
+    Without a dataset, falls back to standard-normal inputs (the scale of standardized
+    features) and labels=None: enough for agreement/latency, not for accuracy.
+    """
+    shape = cnn_input_shape(audio_cfg, feat_cfg, model_cfg)
+    rng = np.random.default_rng(seed)
+    if n <= 0:
+        return np.zeros((0,) + shape, np.float32), np.zeros((0,), np.int64)
+    if not os.path.exists(paths.metadata_csv):
+        print(f"No dataset at {paths.metadata_csv}: using synthetic inputs (no accuracy, no int8 calibration data).")
+        return rng.standard_normal((n,) + shape).astype(np.float32), None
+
+    train_df, test_df = split_train_test(load_metadata(paths, model_cfg.classes), model_cfg.classes, split_seed)
+    df = train_df if split == "train" else test_df
+    df = df.iloc[rng.permutation(len(df))]
+    label_to_idx = {c: i for i, c in enumerate(model_cfg.classes)}
+    wav_paths: List[str] = []
+    labels: List[int] = []
+    for _, row in df.iterrows():
+        wav_path = os.path.join(paths.audio_dir, str(row["filename"]))
+        if os.path.exists(wav_path):
+            wav_paths.append(wav_path)
+            labels.append(label_to_idx[str(row["label"])])
+        if len(wav_paths) >= n:
+            break
+
+    store = FeatureStore(paths.feature_store_dir, audio_cfg, feat_cfg, shape=shape)
+    hashes = ensure_features(
+        store,
+        wav_paths,
+        lambda todo: featurize_files(
+            todo, range(len(todo)), audio_cfg, feat_cfg, do_augment=False, seed=seed, workers=workers, desc="sample"
+        ),
+        on_error=lambda path, message: None,
+    )
+    ok = [i for i, h in enumerate(hashes) if h is not None]
+    x = np.stack([store.get(hashes[i]) for i in ok], axis=0).astype(np.float32)
+    return x, np.asarray(labels, dtype=np.int64)[ok]
+
+
+def convert(model: tf.keras.Model, quantize: str, calibration: np.ndarray) -> bytes:
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        if len(calibration) == 0:
+            raise ValueError("int8 quantization needs calibration features.")
+
+        def representative_dataset():
+            for x in calibration:
+                yield [x[None, ...]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def time_calls(fn: Callable[[np.ndarray], np.ndarray], x_b: np.ndarray, repeats: int) -> Dict[str, float]:
+    fn(x_b)  # warm-up
+    times = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn(x_b)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    t = np.asarray(times)
+    return {
+        "p50_ms": round(float(np.percentile(t, 50)), 3),
+        "p95_ms": round(float(np.percentile(t, 95)), 3),
+        "per_example_ms": round(float(np.median(t)) / len(x_b), 3),
+    }
+
+
+def predict_all(fn: Callable[[np.ndarray], np.ndarray], x: np.ndarray, batch_size: int = 32) -> np.ndarray:
+    return np.concatenate([np.asarray(fn(x[i : i + batch_size])) for i in range(0, len(x), batch_size)], axis=0)
+
+
+def compare(
+    keras_fn: Callable[[np.ndarray], np.ndarray],
+    lite_fn: Callable[[np.ndarray], np.ndarray],
+    x: np.ndarray,
+    labels: Optional[np.ndarray],
+    batch_size: int,
+    repeats: int,
+) -> Dict[str, object]:
+    p_keras = predict_all(keras_fn, x)
+    p_lite = predict_all(lite_fn, x)
+    diff = np.abs(p_keras - p_lite)
+    report: Dict[str, object] = {
+        "eval_examples": int(len(x)),
+        "top1_agreement": round(float(np.mean(p_keras.argmax(1) == p_lite.argmax(1))), 4),
+        "prob_abs_diff_mean": round(float(diff.mean()), 6),
+        "prob_abs_diff_max": round(float(diff.max()), 6),
+        "accuracy_keras": None,
+        "accuracy_tflite": None,
+    }
+    if labels is not None:
+        report["accuracy_keras"] = round(float(np.mean(p_keras.argmax(1) == labels)), 4)
+        report["accuracy_tflite"] = round(float(np.mean(p_lite.argmax(1) == labels)), 4)
+    batch = x[: min(batch_size, len(x))]
+    report["latency"] = {
+        "keras": {"batch_1": time_calls(keras_fn, x[:1], repeats), f"batch_{len(batch)}": time_calls(keras_fn, batch, repeats)},
+        "tflite": {"batch_1": time_calls(lite_fn, x[:1], repeats), f"batch_{len(batch)}": time_calls(lite_fn, batch, repeats)},
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Export model.h5 to TFLite and compare it with the Keras model.")
+    parser.add_argument("--quantize", choices=QUANTIZE_MODES, default="none")
+    parser.add_argument("--out", default=RuntimeConfig.tflite_path)
+    parser.add_argument("--report", default=None, help="JSON report path (default: <out>.report.json)")
+    parser.add_argument("--calibration-samples", type=int, default=200)
+    parser.add_argument("--eval-samples", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16, help="batch size for the batch latency measurement")
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--train-seed", type=int, default=TrainConfig.seed, help="ml.train --seed of the model (its test split)")
+    parser.add_argument("--workers", type=int, default=0, help="featurization processes (0 = all cores)")
+    args = parser.parse_args(argv)
+
+    audio_cfg = AudioConfig()
+    feat_cfg = FeatureConfig()
+    model_cfg = ModelConfig()
+    paths = TrainPaths()
+
+    model = tf.keras.models.load_model(paths.model_out)
+    if args.quantize == "int8" and not os.path.exists(paths.metadata_csv):
+        raise SystemExit("int8 quantization needs the training dataset for calibration features.")
+    # Calibration from the training split, evaluation on the held-out split: disjoint, and
+    # accuracy is not measured on files the model was fitted to.
+    n_calib = args.calibration_samples if args.quantize == "int8" else 0
+    sample = dict(seed=args.seed, workers=args.workers, split_seed=args.train_seed)
+    x_cal, _ = sample_features(paths, audio_cfg, feat_cfg, model_cfg, n_calib, split="train", **sample)
+    x_eval, y_eval = sample_features(paths, audio_cfg, feat_cfg, model_cfg, args.eval_samples, split="test", **sample)
+    if len(x_eval) == 0:
+        raise SystemExit("No held-out examples for evaluation.")
+
+    t0 = time.perf_counter()
+    artifact = convert(model, args.quantize, x_cal)
+    convert_s = time.perf_counter() - t0
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "wb") as f:
+        f.write(artifact)
+
+    lite = TFLiteModel(args.out)
+    spec = tf.TensorSpec(shape=(None,) + tuple(x_eval.shape[1:]), dtype=tf.float32)
+    keras_fn = tf.function(lambda t: model(t, training=False), input_signature=[spec])
+
+    report = {
+        "source": paths.model_out,
+        "artifact": args.out,
+        "quantize": args.quantize,
+        "calibration_examples": int(len(x_cal)),
+        "eval_data": "dataset test split" if y_eval is not None else "synthetic",
+        "convert_seconds": round(convert_s, 2),
+        "size_bytes": {"keras": os.path.getsize(paths.model_out), "tflite": len(artifact)},
+    }
+    report.update(
+        compare(lambda b: keras_fn(tf.constant(b)).numpy(), lite.predict, x_eval, y_eval, args.batch_size, args.repeats)
+    )
+
+    report_path = args.report or os.path.splitext(args.out)[0] + ".report.json"
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"Wrote {args.out} and {report_path}")
+
+
+if __name__ == "__main__":
+    main()
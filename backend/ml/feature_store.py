@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+"""
+Persistent, content-addressed feature store for training.
+
+Layout under <root>/<fingerprint>/ (fingerprint = AudioConfig/FeatureConfig values, so a
+config change starts a fresh namespace instead of mixing incompatible features; stores of
+clean waveforms pass feat_cfg=None and depend on AudioConfig only):
+  meta.json         entry shape/dtype, shard size, config values
+  index.json        {content_hash: [shard, row]}
+  files.json        {path: [mtime_ns, size, content_hash]} so unchanged files are not re-hashed
+  shard_00000.npy   (shard_size, *shape) arrays opened with np.lib.format.open_memmap
+  clips/<hash>.npy  shape=None stores only: one variable-length 1-D array per entry
+                    (full-length clean clips), memory-mapped on read
+
+Entries are appended and never rewritten; reads are memory-mapped, so a training run
+touches only the rows it is currently batching.
+"""
+
+import dataclasses
+import hashlib
+import json
+import os
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import AudioConfig, FeatureConfig, config_fingerprint
+
+
+def file_content_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _write_json_atomic(path: str, obj: object) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str, default: object) -> object:
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def _asdict(cfg: object) -> Dict[str, object]:
+    return json.loads(json.dumps(dataclasses.asdict(cfg), default=list))
+
+
+class FeatureStore:
+    """
+    Append-only store of float32 arrays keyed by file content hash: fixed-shape rows in
+    shards, or (shape=None) variable-length 1-D arrays in one file each.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        audio_cfg: AudioConfig,
+        feat_cfg: Optional[FeatureConfig],
+        shape: Optional[Tuple[int, ...]],
+        shard_size: int = 256,
+    ):
+        cfgs = (audio_cfg,) if feat_cfg is None else (audio_cfg, feat_cfg)
+        self.fingerprint = config_fingerprint(*cfgs)
+        self.dir = os.path.join(root, self.fingerprint)
+        self.shape = None if shape is None else tuple(int(d) for d in shape)
+        os.makedirs(self.dir, exist_ok=True)
+
+        meta_path = os.path.join(self.dir, "meta.json")
+        meta = _read_json(meta_path, None)
+        if meta is None:
+            meta = {
+                "shape": None if self.shape is None else list(self.shape),
+                "dtype": "float32",
+                "shard_size": int(shard_size),
+                "audio_cfg": _asdict(audio_cfg),
+                "feat_cfg": None if feat_cfg is None else _asdict(feat_cfg),
+            }
+            _write_json_atomic(meta_path, meta)
+        if (None if meta["shape"] is None else tuple(meta["shape"])) != self.shape:
+            raise ValueError(f"Feature store {self.dir} holds shape {meta['shape']}, expected {self.shape}")
+        self.shard_size = int(meta["shard_size"])
+
+        self._index: Dict[str, List[int]] = _read_json(os.path.join(self.dir, "index.json"), {})
+        self._files: Dict[str, List] = _read_json(os.path.join(self.dir, "files.json"), {})
+        self._shards: Dict[int, np.memmap] = {}
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self._index
+
+    def hash_file(self, path: str) -> str:
+        """Content hash of `path`, reusing the recorded hash when mtime and size are unchanged."""
+        st = os.stat(path)
+        key = os.path.abspath(path)
+        rec = self._files.get(key)
+        if rec is not None and rec[0] == st.st_mtime_ns and rec[1] == st.st_size:
+            return rec[2]
+        digest = file_content_hash(path)
+        self._files[key] = [st.st_mtime_ns, st.st_size, digest]
+        self._dirty = True
+        return digest
+
+    def _shard(self, shard: int, create: bool = False) -> np.memmap:
+        mm = self._shards.get(shard)
+        if mm is not None:
+            return mm
+        path = os.path.join(self.dir, f"shard_{shard:05d}.npy")
+        if os.path.exists(path):
+            mm = np.load(path, mmap_mode="r+")
+        elif create:
+            mm = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(self.shard_size,) + self.shape)
+        else:
+            raise KeyError(f"Missing feature shard {path}")
+        self._shards[shard] = mm
+        return mm
+
+    def _clip_path(self, content_hash: str) -> str:
+        return os.path.join(self.dir, "clips", f"{content_hash}.npy")
+
+    def _read(self, loc) -> np.ndarray:
+        if isinstance(loc, str):  # variable-length entry: its content hash
+            return np.load(self._clip_path(loc), mmap_mode="r")
+        shard, row = loc
+        return self._shard(shard)[row]
+
+    def _loc(self, content_hash: str):
+        return content_hash if self.shape is None else tuple(self._index[content_hash])
+
+    def get(self, content_hash: str) -> np.ndarray:
+        if content_hash not in self._index:
+            raise KeyError(content_hash)
+        return self._read(self._loc(content_hash))
+
+    def put(self, content_hash: str, x: np.ndarray) -> None:
+        if content_hash in self._index:
+            return
+        if self.shape is None:
+            if x.ndim != 1:
+                raise ValueError(f"Variable-length store entries are 1-D, got shape {x.shape}")
+            path = self._clip_path(content_hash)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(x, dtype=np.float32))
+            os.replace(path + ".tmp", path)
+            self._index[content_hash] = []
+            self._dirty = True
+            return
+        if tuple(x.shape) != self.shape:
+            raise ValueError(f"Feature shape {x.shape} does not match store shape {self.shape}")
+        n = len(self._index)
+        shard, row = divmod(n, self.shard_size)
+        self._shard(shard, create=True)[row] = x
+        self._index[content_hash] = [shard, row]
+        self._dirty = True
+
+    def view(self, hashes: Sequence[str]) -> "StoreView":
+        return StoreView(self, [self._loc(h) for h in hashes])
+
+    def flush(self) -> None:
+        """Persist shard data and the index (the index is written after the data it points to)."""
+        for mm in self._shards.values():
+            mm.flush()
+        if self._dirty:
+            _write_json_atomic(os.path.join(self.dir, "index.json"), self._index)
+            _write_json_atomic(os.path.join(self.dir, "files.json"), self._files)
+            self._dirty = False
+
+
+class StoreView:
+    """
+    Lazy, indexable (N, *shape) view over store rows; only requested rows are read.
+    Views of a variable-length store are indexable only (shape (N,), no `take`).
+    """
+
+    def __init__(self, store: FeatureStore, locs: List):
+        self.store = store
+        self.locs = locs
+        self.shape = (len(locs),) + (store.shape or ())
+
+    def __len__(self) -> int:
+        return len(self.locs)
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        return self.store._read(self.locs[i])
+
+    def take(self, indices: Iterable[int]) -> np.ndarray:
+        return np.stack([np.asarray(self[int(i)]) for i in indices], axis=0)
+
+
+def ensure_features(
+    store: FeatureStore,
+    paths: Sequence[str],
+    compute_many: Callable[[List[str]], Iterable[Tuple[int, Optional[np.ndarray], Optional[str]]]],
+    on_error: Optional[Callable[[str, str], None]] = None,
+) -> List[Optional[str]]:
+    """
+    Content hash per path, computing + storing features only for content not in the store.
+    `compute_many(paths)` yields (position, x, error) for the paths it is given, in any
+    order (e.g. from a process pool); x is None when the file failed.
+    Paths that fail are reported through `on_error(path, message)` and map to None.
+    """
+    def fail(path: str, message: str) -> None:
+        if on_error is None:
+            raise RuntimeError(f"{path}: {message}")
+        on_error(path, message)
+
+    out: List[Optional[str]] = [None] * len(paths)
+    todo: Dict[str, List[int]] = {}  # missing content hash -> positions in `paths`
+    for i, path in enumerate(paths):
+        try:
+            h = store.hash_file(path)
+        except OSError as e:
+            fail(path, f"{type(e).__name__}: {e}")
+            continue
+        if h in store:
+            out[i] = h
+        else:
+            todo.setdefault(h, []).append(i)
+
+    missing = list(todo)
+    first = [todo[h][0] for h in missing]
+    added = 0
+    for j, x, err in compute_many([paths[i] for i in first]):
+        h = missing[j]
+        if x is None:
+            fail(paths[first[j]], err or "no features")
+            continue
+        store.put(h, x)
+        for i in todo[h]:
+            out[i] = h
+        added += 1
+        if added % store.shard_size == 0:
+            store.flush()  # an interrupted run keeps what it already computed
+    store.flush()
+    return out
@@ -1,78 +1,110 @@
 from __future__ import annotations
 
+import functools
 from typing import Dict, Tuple
 
 import librosa
 import numpy as np
+import scipy.fft
 
+from . import metrics
 from .config import FeatureConfig
 
+# Every function below accepts a single clip or a batch: arrays are (..., freq, time)
+# and reductions (dB reference, standardization) are per clip, over the last two axes.
+
+AMIN = 1e-10
+TOP_DB = 80.0
+
+
+@functools.lru_cache(maxsize=16)
+def mel_basis(sr: int, cfg: FeatureConfig) -> np.ndarray:
+    """(n_mels, 1 + n_fft // 2) filterbank, built once per (sr, FeatureConfig)."""
+    basis = librosa.filters.mel(sr=sr, n_fft=cfg.n_fft, n_mels=cfg.n_mels, fmin=cfg.fmin, fmax=cfg.fmax)
+    basis.setflags(write=False)
+    return basis
+
+
+@functools.lru_cache(maxsize=16)
+def dct_basis(cfg: FeatureConfig) -> np.ndarray:
+    """(n_mfcc, n_mels) orthonormal DCT-II rows, as librosa.feature.mfcc applies them."""
+    basis = scipy.fft.dct(np.eye(cfg.n_mels, dtype=np.float32), type=2, norm="ortho", axis=0)[: cfg.n_mfcc]
+    basis = np.ascontiguousarray(basis)
+    basis.setflags(write=False)
+    return basis
+
+
+def power_to_db(S: np.ndarray, ref_max: bool = False) -> np.ndarray:
+    """librosa.power_to_db (ref=1.0, or ref=np.max with ref_max) with a per-clip reference and top_db."""
+    S = np.asarray(S)
+    log_spec = 10.0 * np.log10(np.maximum(AMIN, S))
+    if ref_max:
+        ref = np.max(np.abs(S), axis=(-2, -1), keepdims=True)
+        log_spec -= 10.0 * np.log10(np.maximum(AMIN, ref))
+    return np.maximum(log_spec, np.max(log_spec, axis=(-2, -1), keepdims=True) - TOP_DB)
+
 
 def _to_db(x: np.ndarray) -> np.ndarray:
-    return librosa.power_to_db(x, ref=np.max).astype(np.float32)
+    return power_to_db(x, ref_max=True).astype(np.float32)
+
+
+def mel_power_spectrogram(y: np.ndarray, sr: int, cfg: FeatureConfig) -> np.ndarray:
+    """(N,) or (B, N) waveforms -> (n_mels, T) or (B, n_mels, T) mel power."""
+    stft = librosa.stft(y, n_fft=cfg.n_fft, hop_length=cfg.hop_length)
+    return mel_basis(sr, cfg) @ (np.abs(stft) ** 2)
+
+
+def mfcc_from_mel_power(mel_power: np.ndarray, cfg: FeatureConfig) -> np.ndarray:
+    """Same as librosa.feature.mfcc(y=...) but reusing an already computed mel power spectrogram."""
+    mfcc = dct_basis(cfg) @ power_to_db(mel_power)
+    return mfcc.astype(np.float32)
 
 
 def extract_mel_spectrogram(y: np.ndarray, sr: int, cfg: FeatureConfig) -> np.ndarray:
-    mel = librosa.feature.melspectrogram(
-        y=y,
-        sr=sr,
-        n_fft=cfg.n_fft,
-        hop_length=cfg.hop_length,
-        n_mels=cfg.n_mels,
-        fmin=cfg.fmin,
-        fmax=cfg.fmax,
-        power=2.0,
-    )
+    mel = mel_power_spectrogram(y, sr, cfg)
     mel_db = _to_db(mel)
     return mel_db
 
 
 def extract_mfcc(y: np.ndarray, sr: int, cfg: FeatureConfig) -> np.ndarray:
-    mfcc = librosa.feature.mfcc(
-        y=y,
-        sr=sr,
-        n_mfcc=cfg.n_mfcc,
-        n_fft=cfg.n_fft,
-        hop_length=cfg.hop_length,
-        n_mels=cfg.n_mels,
-        fmin=cfg.fmin,
-        fmax=cfg.fmax,
-    )
-    return mfcc.astype(np.float32)
+    return mfcc_from_mel_power(mel_power_spectrogram(y, sr, cfg), cfg)
 
 
 def standardize_feature(feat: np.ndarray, eps: float = 1e-6) -> np.ndarray:
-    mu = np.mean(feat)
-    sd = np.std(feat)
-    if sd < eps:
-        return (feat - mu).astype(np.float32)
-    return ((feat - mu) / sd).astype(np.float32)
+    mu = np.mean(feat, axis=(-2, -1), keepdims=True)
+    sd = np.std(feat, axis=(-2, -1), keepdims=True)
+    return ((feat - mu) / np.where(sd < eps, 1.0, sd)).astype(np.float32)
 
 
 def features_to_cnn_input(mel: np.ndarray, mfcc: np.ndarray) -> np.ndarray:
     """
     Convert (freq x time) features into CNN input: (H, W, C) float32
+    (or (B, freq, time) batches into (B, H, W, C)).
     We align time dimension by trimming/padding to min time length.
     Channels: [mel, mfcc_resized]
     """
     # Align time length
-    t = min(mel.shape[1], mfcc.shape[1])
-    mel_a = mel[:, :t]
-    mfcc_a = mfcc[:, :t]
+    t = min(mel.shape[-1], mfcc.shape[-1])
+    mel_a = mel[..., :t]
+    mfcc_a = mfcc[..., :t]
 
     # Resize MFCC "freq" axis to match mel bins for stacking
-    mfcc_resized = librosa.util.fix_length(mfcc_a, size=mel_a.shape[0], axis=0)
+    mfcc_resized = librosa.util.fix_length(mfcc_a, size=mel_a.shape[-2], axis=-2)
 
     mel_s = standardize_feature(mel_a)
     mfcc_s = standardize_feature(mfcc_resized)
 
-    x = np.stack([mel_s, mfcc_s], axis=-1)  # (H, W, 2)
+    x = np.stack([mel_s, mfcc_s], axis=-1)  # (..., H, W, 2)
     return x.astype(np.float32)
 
 
 def extract_all_features(y: np.ndarray, sr: int, cfg: FeatureConfig) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
-    mel = extract_mel_spectrogram(y, sr, cfg)
-    mfcc = extract_mfcc(y, sr, cfg)
-    x = features_to_cnn_input(mel, mfcc)
+    """(N,) -> (H, W, 2), or a (B, N) batch of equal-length clips -> (B, H, W, 2)."""
+    # One mel power spectrogram feeds both channels (mfcc is the DCT of its log).
+    with metrics.stage("features"):
+        mel_power = mel_power_spectrogram(y, sr, cfg)
+        mel = _to_db(mel_power)
+        mfcc = mfcc_from_mel_power(mel_power, cfg)
+        x = features_to_cnn_input(mel, mfcc)
     return x, {"mel": mel, "mfcc": mfcc}
 
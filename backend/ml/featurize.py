@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+"""
+Dataset featurization for training: one audio file -> one CNN input.
+
+Kept free of TensorFlow so process-pool workers (spawned, not forked) start quickly.
+Every example draws its augmentation from its own RNG, seeded from (global seed,
+row index[, epoch]), so results do not depend on the worker count or on completion order.
+"""
+
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import AudioConfig, FeatureConfig
+from .features import extract_all_features
+from .preprocess import normalize, pad_or_trim, reduce_noise, resample
+
+# (position in the input list, features or None, error message or None)
+FeatureResult = Tuple[int, Optional[np.ndarray], Optional[str]]
+
+
+def augment(y: np.ndarray, sr: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Simple augmentation:
+    - random gain
+    - mild time shift
+    - optional gaussian noise
+    """
+    out = y.copy()
+    gain = rng.uniform(0.8, 1.2)
+    out = out * gain
+
+    shift = int(rng.uniform(-0.1, 0.1) * len(out))
+    out = np.roll(out, shift)
+
+    if rng.random() < 0.35:
+        noise = rng.normal(0, 0.005, size=out.shape).astype(np.float32)
+        out = out + noise
+
+    return out.astype(np.float32)
+
+
+def clean_waveform(wav_path: str, audio_cfg: AudioConfig) -> Tuple[np.ndarray, int]:
+    """Decoded, mono, resampled and denoised clip: everything before augmentation."""
+    import soundfile as sf
+
+    y, sr = sf.read(wav_path, dtype="float32", always_2d=False)
+    if y.ndim > 1:
+        y = np.mean(y, axis=1).astype(np.float32)
+    y, sr = resample(y, int(sr), audio_cfg, audio_cfg.resample_training)
+    return reduce_noise(y), sr
+
+
+def example_from_waveform(
+    y: np.ndarray,
+    sr: int,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    do_augment: bool,
+    rng: Optional[np.random.Generator],
+) -> np.ndarray:
+    if do_augment:
+        y = augment(y, sr, rng)
+    y = normalize(y)
+    y = pad_or_trim(y, sr, audio_cfg)
+    x, _ = extract_all_features(y, sr, feat_cfg)
+    return x
+
+
+def examples_from_waveforms(
+    ys: Sequence[np.ndarray],
+    sr: int,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    rngs: Optional[Sequence[np.random.Generator]] = None,
+) -> np.ndarray:
+    """Batched example_from_waveform: per-clip augmentation, then one (B, H, W, 2) feature pass."""
+    x, _ = extract_all_features(prepare_waveforms(ys, sr, audio_cfg, rngs), sr, feat_cfg)
+    return x
+
+
+def prepare_waveforms(
+    ys: Sequence[np.ndarray],
+    sr: int,
+    audio_cfg: AudioConfig,
+    rngs: Optional[Sequence[np.random.Generator]] = None,
+) -> np.ndarray:
+    """(B, N) model waveforms: optional per-clip augmentation, normalize, pad/trim."""
+    clips = []
+    for i, y in enumerate(ys):
+        if rngs is not None:
+            y = augment(y, sr, rngs[i])
+        clips.append(pad_or_trim(normalize(y), sr, audio_cfg))
+    return np.stack(clips, axis=0)
+
+
+def build_example(
+    wav_path: str,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    do_augment: bool,
+    rng: Optional[np.random.Generator],
+) -> np.ndarray:
+    y, sr = clean_waveform(wav_path, audio_cfg)
+    return example_from_waveform(y, sr, audio_cfg, feat_cfg, do_augment, rng)
+
+
+def stored_waveform(
+    wav_path: str,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    do_augment: bool,
+    rng: Optional[np.random.Generator],
+) -> np.ndarray:
+    """
+    Full-length clean clip for the clip store. Loader workers augment, normalize and
+    pad/trim it per epoch, in build_example's order (roll and peak see the whole clip).
+    """
+    y, _ = clean_waveform(wav_path, audio_cfg)
+    return y
+
+
+def model_waveform(
+    wav_path: str,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    do_augment: bool,
+    rng: Optional[np.random.Generator],
+) -> np.ndarray:
+    """build_example without the feature pass: the input of the in-graph front end model."""
+    y, sr = clean_waveform(wav_path, audio_cfg)
+    if do_augment:
+        y = augment(y, sr, rng)
+    return pad_or_trim(normalize(y), sr, audio_cfg)
+
+
+def example_rng(seed: int, row_index: int, epoch: Optional[int] = None) -> np.random.Generator:
+    """Per-example generator: depends only on the global seed, the row's index and the epoch."""
+    entropy = [int(seed), int(row_index)] if epoch is None else [int(seed), int(row_index), int(epoch)]
+    return np.random.default_rng(np.random.SeedSequence(entropy))
+
+
+def _featurize_one(
+    job: Callable[..., np.ndarray],
+    pos: int,
+    wav_path: str,
+    row_index: int,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    do_augment: bool,
+    seed: int,
+) -> FeatureResult:
+    try:
+        x = job(wav_path, audio_cfg, feat_cfg, do_augment, example_rng(seed, row_index))
+        return pos, x, None
+    except Exception as e:
+        return pos, None, f"{type(e).__name__}: {e}"
+
+
+def _init_worker() -> None:
+    # One process per core: keep numba/BLAS from oversubscribing each core.
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMBA_NUM_THREADS"):
+        os.environ.setdefault(var, "1")
+
+
+class Progress:
+    """Prints done/total, files/s and failures roughly every `every_s` seconds."""
+
+    def __init__(self, desc: str, total: int, every_s: float = 5.0, stream=None):
+        self.desc = desc
+        self.total = total
+        self.every_s = every_s
+        self.stream = stream or sys.stdout
+        self.done = 0
+        self.failures: List[Tuple[str, str]] = []
+        self.t0 = time.perf_counter()
+        self._last = self.t0
+
+    @property
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.t0
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def update(self, path: str, error: Optional[str]) -> None:
+        self.done += 1
+        if error is not None:
+            self.failures.append((path, error))
+            print(f"[{self.desc}] failed: {path}: {error}", file=self.stream)
+        now = time.perf_counter()
+        if now - self._last >= self.every_s:
+            self._last = now
+            self._report()
+
+    def _report(self) -> None:
+        print(
+            f"[{self.desc}] {self.done}/{self.total} files, {self.rate:.1f} files/s, {len(self.failures)} failed",
+            file=self.stream,
+            flush=True,
+        )
+
+    def close(self) -> None:
+        self._report()
+
+
+def featurize_files(
+    paths: Sequence[str],
+    row_indices: Sequence[int],
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    do_augment: bool,
+    seed: int,
+    workers: int = 0,
+    desc: str = "featurize",
+    job: Callable[..., np.ndarray] = build_example,
+) -> Iterator[FeatureResult]:
+    """
+    Run `job` (build_example, stored_waveform or model_waveform; module level, so it
+    pickles) over `paths` across `workers` processes (0 = all cores, 1 = in-process) and yield
+    (position, x, error) in completion order. A file that cannot be decoded
+    yields x=None with its error instead of raising; the run carries on.
+    At most 4 x workers files are in flight, so memory does not grow with the dataset.
+    """
+    if not paths:
+        return
+    workers = workers or (os.cpu_count() or 1)
+    progress = Progress(desc, len(paths))
+    jobs = [
+        (job, pos, path, int(row_indices[pos]), audio_cfg, feat_cfg, do_augment, seed)
+        for pos, path in enumerate(paths)
+    ]
+
+    if workers <= 1 or len(paths) <= 1:
+        for args in jobs:
+            result = _featurize_one(*args)
+            progress.update(paths[result[0]], result[2])
+            yield result
+        progress.close()
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        pending: Dict[Future, int] = {}
+        it = iter(jobs)
+        for args in it:
+            pending[pool.submit(_featurize_one, *args)] = args[1]
+            if len(pending) >= 4 * workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                pos = pending.pop(f)
+                try:
+                    result = f.result()
+                except Exception as e:  # worker crashed mid-file
+                    result = (pos, None, f"{type(e).__name__}: {e}")
+                progress.update(paths[pos], result[2])
+                yield result
+                nxt = next(it, None)
+                if nxt is not None:
+                    pending[pool.submit(_featurize_one, *nxt)] = nxt[1]
+    progress.close()
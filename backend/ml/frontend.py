@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+"""
+In-graph DSP front end: the model takes (B, N) waveforms instead of features.
+
+LogMelMfccFrontend reproduces features.extract_all_features with TensorFlow ops:
+centered Hann STFT (librosa framing, zero padded), the same slaney mel and DCT
+bases (stored as non-trainable weights), per-clip dB reference and top_db, the
+MFCC row padding and per-example standardization. Put in front of build_cnn, the
+whole feature + CNN computation is one graph that batches and runs on every core.
+
+The waveform the model expects is what features are computed from today: the
+resampled, denoised, normalized and padded/trimmed clip (preprocess.preprocess_audio,
+or featurize.model_waveform for dataset files), at AudioConfig.target_sr.
+
+Wrap an existing model.h5 and validate it against the NumPy features:
+  cd backend
+  python -m ml.frontend                     # writes model/model_waveform.keras
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import tensorflow as tf
+
+from .config import AudioConfig, FeatureConfig
+from .features import AMIN, TOP_DB, dct_basis, mel_basis
+
+_LOG10 = float(np.log(10.0))
+
+
+def _power_to_db(S: tf.Tensor, ref_max: bool) -> tf.Tensor:
+    """features.power_to_db for (B, F, T): per-clip reference and top_db."""
+    log_spec = 10.0 * tf.math.log(tf.maximum(S, AMIN)) / _LOG10
+    if ref_max:
+        ref = tf.reduce_max(tf.abs(S), axis=(1, 2), keepdims=True)
+        log_spec -= 10.0 * tf.math.log(tf.maximum(ref, AMIN)) / _LOG10
+    return tf.maximum(log_spec, tf.reduce_max(log_spec, axis=(1, 2), keepdims=True) - TOP_DB)
+
+
+def _standardize(feat: tf.Tensor, eps: float = 1e-6) -> tf.Tensor:
+    mu = tf.reduce_mean(feat, axis=(1, 2), keepdims=True)
+    sd = tf.math.reduce_std(feat, axis=(1, 2), keepdims=True)
+    return (feat - mu) / tf.where(sd < eps, tf.ones_like(sd), sd)
+
+
+@tf.keras.utils.register_keras_serializable(package="lungs")
+class LogMelMfccFrontend(tf.keras.layers.Layer):
+    """(B, N) waveforms at `sample_rate` -> (B, n_mels, 1 + N // hop_length, 2) CNN input."""
+
+    def __init__(
+        self,
+        sample_rate: int,
+        n_fft: int,
+        hop_length: int,
+        n_mels: int,
+        n_mfcc: int,
+        fmin: float,
+        fmax: float,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)  # Layer kwargs only (name, dtype, trainable): valid on Keras 2 and 3
+        self.sample_rate = int(sample_rate)
+        self.n_fft = int(n_fft)
+        self.hop_length = int(hop_length)
+        self.n_mels = int(n_mels)
+        self.n_mfcc = int(n_mfcc)
+        self.fmin = fmin
+        self.fmax = fmax
+
+    @classmethod
+    def from_configs(cls, audio_cfg: AudioConfig, feat_cfg: FeatureConfig, **kwargs) -> "LogMelMfccFrontend":
+        return cls(
+            audio_cfg.target_sr,
+            feat_cfg.n_fft,
+            feat_cfg.hop_length,
+            feat_cfg.n_mels,
+            feat_cfg.n_mfcc,
+            feat_cfg.fmin,
+            feat_cfg.fmax,
+            **kwargs,
+        )
+
+    def _feature_config(self) -> FeatureConfig:
+        return FeatureConfig(
+            n_mels=self.n_mels,
+            n_mfcc=self.n_mfcc,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            fmin=self.fmin,
+            fmax=self.fmax,
+        )
+
+    def build(self, input_shape) -> None:
+        cfg = self._feature_config()
+        mel = np.asarray(mel_basis(self.sample_rate, cfg), dtype=np.float32)
+        dct = np.asarray(dct_basis(cfg), dtype=np.float32)
+        self.mel_basis = self.add_weight(
+            name="mel_basis", shape=mel.shape, initializer=tf.keras.initializers.Constant(mel), trainable=False
+        )
+        self.dct_basis = self.add_weight(
+            name="dct_basis", shape=dct.shape, initializer=tf.keras.initializers.Constant(dct), trainable=False
+        )
+        super().build(input_shape)
+
+    def call(self, y: tf.Tensor) -> tf.Tensor:
+        pad = self.n_fft // 2
+        y = tf.pad(tf.cast(y, tf.float32), [[0, 0], [pad, pad]])
+        stft = tf.signal.stft(
+            y,
+            frame_length=self.n_fft,
+            frame_step=self.hop_length,
+            fft_length=self.n_fft,
+            window_fn=tf.signal.hann_window,
+            pad_end=False,
+        )  # (B, T, F)
+        power = tf.math.square(tf.math.real(stft)) + tf.math.square(tf.math.imag(stft))
+        mel_power = tf.einsum("mf,btf->bmt", self.mel_basis, power)
+
+        mel_db = _power_to_db(mel_power, ref_max=True)
+        mfcc = tf.einsum("km,bmt->bkt", self.dct_basis, _power_to_db(mel_power, ref_max=False))
+        # librosa.util.fix_length on the MFCC rows: zero rows below, or crop.
+        if self.n_mfcc < self.n_mels:
+            mfcc = tf.pad(mfcc, [[0, 0], [0, self.n_mels - self.n_mfcc], [0, 0]])
+        else:
+            mfcc = mfcc[:, : self.n_mels]
+        return tf.stack([_standardize(mel_db), _standardize(mfcc)], axis=-1)
+
+    def compute_output_shape(self, input_shape):
+        n = input_shape[-1]
+        t = None if n is None else 1 + int(n) // self.hop_length
+        return (input_shape[0], self.n_mels, t, 2)
+
+    def get_config(self) -> Dict[str, object]:
+        config = super().get_config()
+        config.update(
+            sample_rate=self.sample_rate,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            n_mels=self.n_mels,
+            n_mfcc=self.n_mfcc,
+            fmin=self.fmin,
+            fmax=self.fmax,
+        )
+        return config
+
+
+def build_waveform_model(
+    feature_model: tf.keras.Model, audio_cfg: AudioConfig, feat_cfg: FeatureConfig, jit_compile: bool = False
+) -> tf.keras.Model:
+    """(B, N) waveform model around a feature-input CNN (e.g. a trained model.h5); weights are shared."""
+    n_samples = int(audio_cfg.duration_seconds * audio_cfg.target_sr)
+    inputs = tf.keras.Input(shape=(n_samples,), name="waveform")
+    # The DSP stays float32 under a mixed_bfloat16 policy (STFT/dB in bf16 are far off).
+    features = LogMelMfccFrontend.from_configs(audio_cfg, feat_cfg, name="frontend", dtype="float32")(inputs)
+    outputs = feature_model(features)
+    model = tf.keras.Model(inputs=inputs, outputs=outputs, name=f"{feature_model.name}_waveform")
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=1e-3),
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+        jit_compile=jit_compile,
+    )
+    return model
+
+
+def build_waveform_cnn(
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    input_shape: tuple,
+    architecture: str = "cnn",
+    num_classes: Optional[int] = None,
+    jit_compile: bool = False,
+) -> tf.keras.Model:
+    """Untrained feature model (modeling.ARCHITECTURES) behind the front end, for training on waveforms."""
+    from .modeling import build_model
+
+    feature_model = build_model(architecture, input_shape, num_classes=num_classes)
+    return build_waveform_model(feature_model, audio_cfg, feat_cfg, jit_compile=jit_compile)
+
+
+def validation_clips(audio_cfg: AudioConfig, n: int, seed: int) -> np.ndarray:
+    """(n, N) model waveforms from synthetic lung sounds at several native rates."""
+    from .bench import synth_lung_sound
+    from .preprocess import normalize, pad_or_trim, reduce_noise, resample
+
+    clips = []
+    rates = (4000, 16000, 22050, 44100, 48000)
+    for i in range(n):
+        sr = rates[i % len(rates)]
+        seconds = (3.0, 6.0, 9.0)[i % 3]  # padded, exact and trimmed clips
+        y, sr = resample(synth_lung_sound(seconds, sr, seed=seed + i), sr, audio_cfg)
+        clips.append(pad_or_trim(normalize(reduce_noise(y)), sr, audio_cfg))
+    return np.stack(clips, axis=0)
+
+
+def compare_features(x_ref: np.ndarray, x_graph: np.ndarray) -> Dict[str, float]:
+    d = np.abs(x_ref - x_graph)
+    return {
+        "mean_abs_diff": round(float(d.mean()), 6),
+        "p99_abs_diff": round(float(np.percentile(d, 99)), 6),
+        "max_abs_diff": round(float(d.max()), 6),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .features import extract_all_features
+
+    parser = argparse.ArgumentParser(description="Wrap a feature CNN with the in-graph front end and validate it.")
+    parser.add_argument("--model", default=os.path.join("model", "model.h5"))
+    parser.add_argument("--out", default=os.path.join("model", "model_waveform.keras"))
+    parser.add_argument("--samples", type=int, default=30, help="synthetic validation clips")
+    parser.add_argument("--tolerance", type=float, default=1e-3, help="max allowed mean |dx| vs extract_all_features")
+    parser.add_argument("--batch-size", type=int, default=16, help="batch for the latency comparison")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    audio_cfg, feat_cfg = AudioConfig(), FeatureConfig()
+    sr = audio_cfg.target_sr
+    feature_model = tf.keras.models.load_model(args.model)
+    model = build_waveform_model(feature_model, audio_cfg, feat_cfg)
+    frontend = model.get_layer("frontend")
+
+    y = validation_clips(audio_cfg, args.samples, args.seed)
+    x_ref, _ = extract_all_features(y, sr, feat_cfg)
+    report: Dict[str, object] = {"clips": int(len(y)), "features": compare_features(x_ref, frontend(y).numpy())}
+
+    p_ref = feature_model.predict(x_ref, verbose=0)
+    p_graph = model.predict(y, verbose=0)
+    report["predictions"] = {
+        "top1_agreement": round(float(np.mean(p_ref.argmax(1) == p_graph.argmax(1))), 4),
+        "prob_abs_diff_max": round(float(np.abs(p_ref - p_graph).max()), 6),
+    }
+
+    batch = y[: args.batch_size]
+    ref_fn = tf.function(lambda t: feature_model(t, training=False))
+    graph_fn = tf.function(lambda t: model(t, training=False))
+
+    def numpy_path() -> None:
+        ref_fn(tf.constant(extract_all_features(batch, sr, feat_cfg)[0]))
+
+    def graph_path() -> None:
+        graph_fn(tf.constant(batch))
+
+    timings = {}
+    for name, fn in (("numpy_features_then_cnn", numpy_path), ("in_graph", graph_path)):
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(args.repeats):
+            fn()
+        timings[name] = round((time.perf_counter() - t0) / args.repeats * 1000.0, 2)
+    report["latency_ms_per_batch"] = {"batch_size": int(len(batch)), **timings}
+
+    if report["features"]["mean_abs_diff"] > args.tolerance:
+        print(json.dumps(report, indent=2))
+        print(f"Front end differs from extract_all_features beyond tolerance ({args.tolerance}); {args.out} not written.")
+        return 1
+
+    # Save next to the target and only replace it once the artifact reloads to the same outputs.
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    root, ext = os.path.splitext(args.out)
+    tmp_path = f"{root}.tmp{ext}"
+    model.save(tmp_path)
+    reloaded = tf.keras.models.load_model(tmp_path)
+    report["reload_prob_abs_diff_max"] = round(float(np.abs(reloaded.predict(y, verbose=0) - p_graph).max()), 8)
+    if report["reload_prob_abs_diff_max"] > 1e-5:
+        os.remove(tmp_path)
+        print(json.dumps(report, indent=2))
+        print(f"Reloaded model does not reproduce its predictions; {args.out} not written.")
+        return 1
+    os.replace(tmp_path, args.out)
+    report["artifact"] = args.out
+    print(json.dumps(report, indent=2))
+    print(f"Wrote {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+"""
+Upload size and format limits, enforced while the request body streams in.
+
+UploadGuard is a plain ASGI middleware (it never buffers a body) for the upload routes:
+- a Content-Length above the route's limit is answered 413 before any body is read;
+- body bytes are counted as they arrive (chunked uploads carry no Content-Length), and
+  parsing stops with 413 as soon as the limit is passed;
+- on sniffing routes the first bytes of the first multipart file part must look like
+  WAV/FLAC/OGG/MP3 (ml.decode.sniff_format), else 415 right after the part header.
+Starlette's multipart parser writes each file part into a SpooledTemporaryFile;
+`configure_spool` sets how much of it stays in memory before it rolls over to disk.
+The API then decodes from that file (ml.decode accepts file objects), so a request
+holds at most spool_bytes of encoded upload in memory.
+"""
+
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from .decode import AUDIO_FORMATS, sniff_format
+
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+# Bytes of body searched for the first part's headers before giving up on sniffing.
+_PEEK_LIMIT = 64 * 1024
+_SNIFF_BYTES = 12
+
+
+class UploadTooLarge(HTTPException):
+    """Raised from the guarded `receive` mid-body; FastAPI re-raises it as a 413 response."""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Upload is larger than {limit} bytes.")
+
+
+def configure_spool(spool_bytes: int) -> None:
+    """In-memory size of Starlette's per-file SpooledTemporaryFile."""
+    from starlette.formparsers import MultiPartParser
+
+    # The attribute was renamed between Starlette releases.
+    for attr in ("spool_max_size", "max_file_size"):
+        if hasattr(MultiPartParser, attr):
+            setattr(MultiPartParser, attr, int(spool_bytes))
+
+
+def multipart_boundary(content_type: bytes) -> Optional[bytes]:
+    ctype, _, params = content_type.partition(b";")
+    if ctype.strip().lower() != b"multipart/form-data":
+        return None
+    for param in params.split(b";"):
+        key, _, value = param.strip().partition(b"=")
+        if key.lower() == b"boundary":
+            return value.strip(b'"')
+    return None
+
+
+def first_file_head(prefix: bytes, boundary: bytes, complete: bool = False) -> Tuple[str, Optional[bytes]]:
+    """
+    Look at the start of a multipart body: ("more", None) until the first part's headers
+    and first bytes have arrived, ("field", None) when the first part is not a file,
+    ("file", head) with its first _SNIFF_BYTES content bytes otherwise.
+    """
+    delim = b"--" + boundary
+    start = prefix.find(delim)
+    if start < 0:
+        return "more", None
+    header_end = prefix.find(b"\r\n\r\n", start + len(delim))
+    if header_end < 0:
+        return "more", None
+    if b"filename=" not in prefix[start + len(delim) : header_end].lower():
+        return "field", None
+    content = prefix[header_end + 4 :]
+    end = content.find(b"\r\n" + delim)
+    if end >= 0:
+        return "file", content[:end][:_SNIFF_BYTES]
+    if len(content) < _SNIFF_BYTES and not complete:
+        return "more", None
+    return "file", content[:_SNIFF_BYTES]
+
+
+async def _reject(send: Send, status: int, detail: str) -> None:
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class UploadGuard:
+    """
+    ASGI middleware: `limits` maps POST paths to their maximum body size in bytes;
+    `sniff_paths` are the single-file routes whose first file part is format-checked.
+    """
+
+    def __init__(self, app: Any, limits: Dict[str, int], sniff_paths: Sequence[str] = ()):
+        self.app = app
+        self.limits = dict(limits)
+        self.sniff_paths = frozenset(sniff_paths)
+
+    async def __call__(self, scope: Dict[str, Any], receive: Receive, send: Send) -> None:
+        limit = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if limit is None or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length", b"")
+        if length.isdigit() and int(length) > limit:
+            await _reject(send, 413, f"Upload is larger than {limit} bytes.")
+            return
+
+        received = 0
+        replay: List[Message] = []
+        boundary = multipart_boundary(headers.get(b"content-type", b"")) if scope["path"] in self.sniff_paths else None
+        if boundary is not None:
+            # Read just far enough to see the first bytes of the uploaded file.
+            prefix = b""
+            while True:
+                message = await receive()
+                replay.append(message)
+                if message["type"] != "http.request":
+                    break
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if received > limit:
+                    await _reject(send, 413, f"Upload is larger than {limit} bytes.")
+                    return
+                prefix += chunk
+                complete = not message.get("more_body", False)
+                state, head = first_file_head(prefix, boundary, complete)
+                if state == "file":
+                    fmt = sniff_format(head)
+                    if fmt not in AUDIO_FORMATS:
+                        await _reject(send, 415, "Upload is not WAV, FLAC, OGG or MP3 audio.")
+                        return
+                    break
+                if state == "field" or complete or len(prefix) > _PEEK_LIMIT:
+                    break
+
+        async def guarded_receive() -> Message:
+            nonlocal received
+            if replay:
+                return replay.pop(0)
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise UploadTooLarge(limit)
+            return message
+
+        await self.app(scope, guarded_receive, send)
@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+"""
+Asynchronous prediction jobs backed by a local sqlite queue.
+
+POST /jobs stores the upload and its request parameters and returns a job id right
+away; JobRunner workers (asyncio tasks in the API process) claim queued jobs oldest
+first, run the same pipeline as /predict and store the encoded response. The queue
+survives restarts: a claim is a lease held by a per-process token and renewed by a
+heartbeat, so jobs whose worker process is gone (even if a restarted process got the
+same pid) are put back once the lease expires (up to max_attempts claims), and
+finished jobs are deleted retention_seconds after they finished.
+
+Backpressure: `submit` raises QueueFull once max_queued jobs are waiting, and a job
+whose pipeline call is rejected as Saturated goes back to the queue instead of failing.
+JobQueue is synchronous (sqlite); async callers run its methods via asyncio.to_thread.
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from . import metrics
+from .config import JobConfig
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class QueueFull(RuntimeError):
+    """The queue already holds max_queued waiting jobs."""
+
+
+@dataclass(frozen=True)
+class Job:
+    id: str
+    data: bytes
+    params: Dict[str, Any]
+    created: float
+
+
+class JobQueue:
+    """
+    sqlite table of jobs (status, params, audio until finished, encoded result or error).
+    Claims are atomic (BEGIN IMMEDIATE), so several API processes on one host can share
+    the file. A running job records the claiming queue's `token` (fresh per process)
+    and a heartbeat; `recover` treats other tokens' jobs whose heartbeat is older than
+    lease_seconds as orphaned. PIDs are not used: a restarted container reuses them.
+    """
+
+    def __init__(self, cfg: JobConfig):
+        self.cfg = cfg
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(cfg.db_path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(cfg.db_path, check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, data BLOB,"
+            " result BLOB, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, owner INTEGER,"
+            " created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for name, decl in (("token", "TEXT"), ("heartbeat", "REAL")):  # added after the first release
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+        self.token = uuid.uuid4().hex
+        self.submitted = 0
+        self.rejected = 0
+
+    def submit(self, data: bytes, params: Dict[str, Any], result: Optional[bytes] = None) -> str:
+        """Queue a job (or record it as done right away when `result` is given); returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            if result is not None:
+                self._db.execute(
+                    "INSERT INTO jobs (id, status, params, result, created, started, finished)"
+                    " VALUES (?, 'done', ?, ?, ?, ?, ?)",
+                    (job_id, json.dumps(params), result, now, now, now),
+                )
+            else:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    (queued,) = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()
+                    if queued >= self.cfg.max_queued:
+                        self.rejected += 1
+                        raise QueueFull(f"{queued} jobs queued (limit {self.cfg.max_queued}).")
+                    self._db.execute(
+                        "INSERT INTO jobs (id, status, params, data, created) VALUES (?, 'queued', ?, ?, ?)",
+                        (job_id, json.dumps(params), data, now),
+                    )
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+            self.submitted += 1
+        return job_id
+
+    def claim(self) -> Optional[Job]:
+        """Oldest queued job, marked running by this process; None when the queue is empty."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, data, params, created FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, owner = ?, token = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (now, now, os.getpid(), self.token, row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(id=row[0], data=bytes(row[1]), params=json.loads(row[2]), created=row[3])
+
+    def complete(self, job_id: str, result: bytes) -> None:
+        self._finish(job_id, "done", result=result)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._finish(job_id, "failed", error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[bytes] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, data = NULL, owner = NULL, token = NULL,"
+                " finished = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def requeue(self, job_id: str) -> None:
+        """Put a claimed job back (the pipeline was saturated); the claim is not counted."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, owner = NULL, token = NULL,"
+                " attempts = attempts - 1 WHERE id = ?",
+                (job_id,),
+            )
+
+    def heartbeat(self, now: Optional[float] = None) -> int:
+        """Renew the lease of every job this queue's process is running; returns how many."""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND token = ?",
+                (now if now is not None else time.time(), self.token),
+            )
+            return cur.rowcount
+
+    def recover(self, now: Optional[float] = None) -> int:
+        """Requeue running jobs of other processes whose lease expired (or fail them after max_attempts)."""
+        cutoff = (now if now is not None else time.time()) - self.cfg.lease_seconds
+        with self._lock:
+            orphans = self._db.execute(
+                "SELECT id, attempts FROM jobs WHERE status = 'running' AND token IS NOT ?"
+                " AND (heartbeat IS NULL OR heartbeat < ?)",
+                (self.token, cutoff),
+            ).fetchall()
+            for job_id, attempts in orphans:
+                if attempts >= self.cfg.max_attempts:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'failed', error = ?, data = NULL, owner = NULL, token = NULL,"
+                        " finished = ? WHERE id = ?",
+                        (f"Worker stopped during the job ({attempts} attempts).", time.time(), job_id),
+                    )
+                else:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'queued', started = NULL, owner = NULL, token = NULL WHERE id = ?",
+                        (job_id,),
+                    )
+        return len(orphans)
+
+    def cleanup(self, now: Optional[float] = None) -> int:
+        """Delete finished jobs older than retention_seconds; returns how many were removed."""
+        cutoff = (now if now is not None else time.time()) - self.cfg.retention_seconds
+        with self._lock:
+            cur = self._db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (cutoff,))
+            return cur.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status record of one job: timestamps, attempts, queue position, encoded result or error."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, params, result, error, attempts, created, started, finished FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            status, params, result, error, attempts, created, started, finished = row
+            out: Dict[str, Any] = {
+                "job_id": job_id,
+                "status": status,
+                "params": json.loads(params),
+                "attempts": attempts,
+                "created_at": created,
+                "started_at": started,
+                "finished_at": finished,
+            }
+            if status == "queued":
+                (ahead,) = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (created,)
+                ).fetchone()
+                out["position"] = ahead
+        if result is not None:
+            out["result"] = bytes(result)
+        if error is not None:
+            out["error"] = error
+        return out
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        out = {s: 0 for s in STATUSES}
+        out.update({status: n for status, n in rows})
+        return out
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self.counts(),
+            "max_queued": self.cfg.max_queued,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+        }
+
+
+class JobRunner:
+    """
+    `cfg.workers` asyncio tasks draining a JobQueue through `handler(data, params) -> bytes`.
+    Exceptions in `retry_on` (e.g. Saturated) requeue the job after a short back-off;
+    any other exception fails it with the message. Workers wait for `ready()` (model
+    warm-up) before claiming, so jobs submitted during startup are simply queued.
+    Queue calls run in threads so sqlite never blocks the event loop; a queue error
+    (e.g. database locked) is logged and the worker keeps polling.
+    """
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[bytes, Dict[str, Any]], Awaitable[bytes]],
+        cfg: JobConfig,
+        ready: Callable[[], bool] = lambda: True,
+        retry_on: Tuple[Type[BaseException], ...] = (),
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.cfg = cfg
+        self.ready = ready
+        self.retry_on = retry_on
+        self._tasks: list = []
+        self._wake: Optional[asyncio.Event] = None
+        self.completed = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self.queue.recover()
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.cfg.workers)]
+        self._tasks.append(asyncio.create_task(self._maintain()))
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs they were running stay 'running' until their lease expires."""
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """Wake idle workers (a job was just submitted)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _idle(self) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=self.cfg.poll_interval_seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                await self._step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._error("worker", e)
+                await asyncio.sleep(self.cfg.poll_interval_seconds)
+
+    async def _step(self) -> None:
+        """Claim and run at most one job (or wait for one)."""
+        if not self.ready():
+            await asyncio.sleep(self.cfg.poll_interval_seconds)
+            return
+        job = await asyncio.to_thread(self.queue.claim)
+        if job is None:
+            await self._idle()
+            return
+        metrics.observe("lungs_job_wait_seconds", time.time() - job.created)
+        try:
+            result = await self.handler(job.data, job.params)
+        except self.retry_on:
+            self.retried += 1
+            await asyncio.to_thread(self.queue.requeue, job.id)
+            await asyncio.sleep(self.cfg.poll_interval_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            await asyncio.to_thread(self.queue.fail, job.id, f"Prediction failed: {e}")
+            metrics.observe("lungs_jobs_total", 1, status="failed")
+        else:
+            self.completed += 1
+            await asyncio.to_thread(self.queue.complete, job.id, result)
+            metrics.observe("lungs_jobs_total", 1, status="done")
+
+    async def _maintain(self) -> None:
+        """Renew this process's leases and recover expired ones every lease_seconds / 3; clean up less often."""
+        tick = min(self.cfg.lease_seconds / 3.0, self.cfg.cleanup_interval_seconds)
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                await asyncio.to_thread(self.queue.heartbeat)
+                await asyncio.to_thread(self.queue.recover)
+                if time.monotonic() - last_cleanup >= self.cfg.cleanup_interval_seconds:
+                    last_cleanup = time.monotonic()
+                    await asyncio.to_thread(self.queue.cleanup)
+            except Exception as e:
+                self._error("maintenance", e)
+
+    def _error(self, where: str, e: Exception) -> None:
+        self.errors += 1
+        print(f"Job {where} error (continuing): {type(e).__name__}: {e}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "workers": self.cfg.workers,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "errors": self.errors,
+            "queue": self.queue.stats(),
+        }
@@ -13,32 +13,164 @@ backend/dataset/icbhi_2017/audio/
 
 Put your audio files (wav/mp3) into the matching class folder.
 
+Besides filename,label every row records what the file holds, probed by decoding it
+the way training does (soundfile): sample_rate, channels, duration_seconds, decode_ok
+and the error when it failed. The build is incremental: size/mtime_ns/content_hash
+from the previous manifest are compared, and only new or changed files are hashed and
+probed (in a thread pool). A file that was only touched or moved keeps its probe via
+its content hash. The same table is written to manifest.parquet when pyarrow is installed.
+
 Run:
   cd backend
-  python -m ml.make_metadata
+  python -m ml.make_metadata [--workers N] [--full]
 """
 
+import argparse
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import pandas as pd
 
 from .config import ModelConfig
+from .feature_store import file_content_hash
+
+ALLOWED_EXT = {".wav", ".mp3"}
+PROBE_COLUMNS = ["sample_rate", "channels", "duration_seconds", "decode_ok", "error"]
+COLUMNS = ["filename", "label"] + PROBE_COLUMNS + ["size", "mtime_ns", "content_hash"]
+
+
+def probe_audio(path: str, block_frames: int = 1 << 16) -> Dict[str, object]:
+    """Decode the whole file in blocks (bounded memory): rate, channels, decoded duration, ok/error."""
+    import soundfile as sf
+
+    try:
+        with sf.SoundFile(path) as f:
+            sr, channels = int(f.samplerate), int(f.channels)
+            frames = 0
+            for block in f.blocks(blocksize=block_frames, dtype="float32"):
+                frames += len(block)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return {"sample_rate": 0, "channels": 0, "duration_seconds": 0.0, "decode_ok": False, "error": error}
+    ok = frames > 0
+    return {
+        "sample_rate": sr,
+        "channels": channels,
+        "duration_seconds": round(frames / sr, 4) if sr else 0.0,
+        "decode_ok": ok,
+        "error": "" if ok else "No audio frames.",
+    }
+
+
+def scan_audio(audio_root: Path, class_dirs: Dict[str, Path]) -> List[Tuple[str, str, str, int, int]]:
+    """(relative filename, label, absolute path, size, mtime_ns) for every audio file, via scandir."""
+    out = []
+    for label, folder in class_dirs.items():
+        stack = [str(folder)]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=True):
+                        stack.append(entry.path)
+                    elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in ALLOWED_EXT:
+                        st = entry.stat()
+                        # Store filename relative to audio_root (supports nested subfolders)
+                        rel = Path(entry.path).relative_to(audio_root).as_posix()
+                        out.append((rel, label, entry.path, int(st.st_size), int(st.st_mtime_ns)))
+    return out
+
+
+def load_previous(out_csv: Path, out_parquet: Path) -> Optional[pd.DataFrame]:
+    """Previous manifest with probe columns (parquet preferred), or None for a first/legacy run."""
+    df = None
+    if out_parquet.exists():
+        try:
+            df = pd.read_parquet(out_parquet)
+        except ImportError:
+            df = None
+    if df is None and out_csv.exists():
+        df = pd.read_csv(out_csv, keep_default_na=False)
+    if df is None or not set(COLUMNS) <= set(df.columns):
+        return None
+    df["decode_ok"] = df["decode_ok"].map(lambda v: v if isinstance(v, bool) else str(v).lower() == "true")
+    return df
+
+
+def build_manifest(
+    files: List[Tuple[str, str, str, int, int]],
+    previous: Optional[pd.DataFrame],
+    workers: int = 0,
+) -> Tuple[pd.DataFrame, Dict[str, int]]:
+    """Manifest rows for `files`, re-probing only what changed since `previous`."""
+    by_name: Dict[str, dict] = {}
+    by_hash: Dict[str, dict] = {}
+    if previous is not None:
+        for row in previous.to_dict("records"):
+            by_name[str(row["filename"])] = row
+            by_hash[str(row["content_hash"])] = row
+
+    rows: List[Optional[dict]] = [None] * len(files)
+    todo: List[int] = []
+    for i, (rel, label, _, size, mtime_ns) in enumerate(files):
+        old = by_name.get(rel)
+        if old is not None and int(old["size"]) == size and int(old["mtime_ns"]) == mtime_ns:
+            rows[i] = {**old, "label": label}
+        else:
+            todo.append(i)
+
+    counts = {"files": len(files), "unchanged": len(files) - len(todo), "rehashed": 0, "probed": 0}
+    if todo:
+        # Hash first; a file whose content is already known (touched, copied or moved) keeps its probe.
+        workers = workers or (os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            hashes = list(pool.map(file_content_hash, [files[i][2] for i in todo]))
+            to_probe = [i for i, h in zip(todo, hashes) if h not in by_hash]
+            probes = dict(zip(to_probe, pool.map(probe_audio, [files[i][2] for i in to_probe])))
+        for i, h in zip(todo, hashes):
+            rel, label, _, size, mtime_ns = files[i]
+            if i in probes:
+                probe = probes[i]
+            else:
+                probe = {c: by_hash[h][c] for c in PROBE_COLUMNS}
+            rows[i] = {"filename": rel, "label": label, **probe, "size": size, "mtime_ns": mtime_ns, "content_hash": h}
+        counts["rehashed"] = len(todo) - len(probes)
+        counts["probed"] = len(probes)
+
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    df["decode_ok"] = df["decode_ok"].astype(bool)
+    df["error"] = df["error"].fillna("").astype(str)
+    counts["removed"] = len(set(by_name) - set(df["filename"]))
+    return df.sort_values(["label", "filename"]).reset_index(drop=True), counts
+
+
+def write_parquet(df: pd.DataFrame, path: Path) -> bool:
+    """manifest.parquet next to the CSV; skipped (False) without pyarrow/fastparquet."""
+    try:
+        df.to_parquet(path, index=False)
+    except ImportError:
+        return False
+    return True
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the dataset manifest (metadata.csv) incrementally.")
+    parser.add_argument("--workers", type=int, default=0, help="hash/probe threads (0 = all cores)")
+    parser.add_argument("--full", action="store_true", help="ignore the previous manifest and re-probe every file")
+    args = parser.parse_args(argv)
 
-
-def main() -> None:
     model_cfg = ModelConfig()
 
     dataset_root = Path("dataset") / "icbhi_2017"
     audio_root = dataset_root / "audio"
     out_csv = dataset_root / "metadata.csv"
+    out_parquet = dataset_root / "manifest.parquet"
 
     if not audio_root.exists():
         raise FileNotFoundError(f"Missing folder: {audio_root}")
 
-    rows = []
-    allowed_ext = {".wav", ".mp3"}
-
     # Accept either exact class folders or lowercase variants.
     class_dirs = {}
     for c in model_cfg.classes:
@@ -53,27 +185,34 @@ def main() -> None:
             + "\n".join([f"- {audio_root / c}" for c in missing])
         )
 
-    for label, folder in class_dirs.items():
-        for p in sorted(folder.rglob("*")):
-            if not p.is_file():
-                continue
-            if p.suffix.lower() not in allowed_ext:
-                continue
-            # Store filename relative to audio_root (supports nested subfolders)
-            rel = p.relative_to(audio_root).as_posix()
-            rows.append({"filename": rel, "label": label})
-
-    if not rows:
+    t0 = time.perf_counter()
+    files = scan_audio(audio_root, class_dirs)
+    if not files:
         raise ValueError(f"No .wav/.mp3 files found under {audio_root}")
 
-    df = pd.DataFrame(rows).sort_values(["label", "filename"]).reset_index(drop=True)
+    previous = None if args.full else load_previous(out_csv, out_parquet)
+    df, counts = build_manifest(files, previous, workers=args.workers)
+
     out_csv.parent.mkdir(parents=True, exist_ok=True)
-    df.to_csv(out_csv, index=False)
-    print(f"Wrote {len(df)} rows to {out_csv}")
+    tmp = out_csv.with_suffix(".csv.tmp")
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, out_csv)
+    wrote_parquet = write_parquet(df, out_parquet)
+
+    print(
+        f"Wrote {len(df)} rows to {out_csv}" + (f" and {out_parquet}" if wrote_parquet else " (install pyarrow for parquet)")
+        + f" in {time.perf_counter() - t0:.1f}s: {counts['unchanged']} unchanged, {counts['probed']} probed,"
+        f" {counts['rehashed']} re-hashed only, {counts['removed']} removed"
+    )
+    bad = df[~df["decode_ok"]]
+    ok = df[df["decode_ok"]]
+    print(f"Audio: {ok['duration_seconds'].sum() / 3600:.2f} h decodable, {len(bad)} files failed to decode")
+    print("Sample rates: " + ", ".join(f"{int(sr)} Hz x{n}" for sr, n in ok["sample_rate"].value_counts().sort_index().items()))
+    for row in bad.head(10).itertuples():
+        print(f"  failed: {row.filename}: {row.error}")
     print("Example rows:")
-    print(df.head(10).to_string(index=False))
+    print(df[["filename", "label", "sample_rate", "channels", "duration_seconds", "decode_ok"]].head(10).to_string(index=False))
 
 
 if __name__ == "__main__":
     main()
-
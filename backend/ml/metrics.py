@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+"""
+Hot-path latency metrics, exported in the Prometheus text format (GET /metrics).
+
+  with metrics.stage("resample"):          # duration histogram lungs_stage_seconds{stage=...}
+      ...
+  metrics.observe("lungs_model_batch_size", len(x_b))
+
+Inside `metrics.request()` (one per API request) stage durations are also summed per
+request for the Server-Timing header. Pool threads see the request through contextvars
+(PipelineExecutor copies the context); process workers run under `collect()`, which
+buffers their observations and hands them back for `replay()` in the API process.
+
+METRICS_ENABLED=0 turns `stage` into a shared no-op context manager and `observe` into
+an early return.
+"""
+
+import bisect
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets)
+DEFINITIONS: Dict[str, Tuple[str, str, Sequence[float]]] = {
+    "lungs_stage_seconds": ("histogram", "Duration of one pipeline stage.", LATENCY_BUCKETS),
+    "lungs_request_seconds": ("histogram", "End-to-end request handling time.", LATENCY_BUCKETS),
+    "lungs_input_audio_seconds": (
+        "histogram",
+        "Duration of decoded input audio.",
+        (1.0, 2.0, 4.0, 6.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0),
+    ),
+    "lungs_input_sample_rate_total": ("counter", "Decoded inputs by native sample rate.", ()),
+    "lungs_model_batch_size": ("histogram", "Rows per model forward pass.", (1, 2, 4, 8, 16, 32, 64, 128)),
+    "lungs_requests_total": ("counter", "Handled requests by endpoint and status code.", ()),
+    "lungs_job_wait_seconds": (
+        "histogram",
+        "Time a job spent queued before a worker claimed it.",
+        LATENCY_BUCKETS + (30.0, 60.0, 300.0),
+    ),
+    "lungs_jobs_total": ("counter", "Finished jobs by final status.", ()),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_enabled = os.getenv("METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+_noop = contextlib.nullcontext()
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "total", "n")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: +Inf
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.n += 1
+
+
+class MetricsRegistry:
+    def __init__(self, definitions: Dict[str, Tuple[str, str, Sequence[float]]] = DEFINITIONS):
+        self.definitions = definitions
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+
+    def observe(self, name: str, value: float, labels: Labels = ()) -> None:
+        kind, _, buckets = self.definitions[name]
+        with self._lock:
+            if kind == "counter":
+                self._counters[(name, labels)] = self._counters.get((name, labels), 0.0) + value
+                return
+            h = self._histograms.get((name, labels))
+            if h is None:
+                h = self._histograms[(name, labels)] = _Histogram(buckets)
+            h.observe(value)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            hists = {k: (list(h.counts), h.total, h.n, h.buckets) for k, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines: List[str] = []
+        for name, (kind, help_text, _) in self.definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (n, labels), value in sorted(counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+                continue
+            for (n, labels), (counts, total, count, buckets) in sorted(hists.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, c in zip(buckets + (float("inf"),), counts):
+                    cumulative += c
+                    le = "+Inf" if bound == float("inf") else _fmt_value(bound)
+                    lines.append(f"{name}_bucket{_fmt_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _fmt_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+    return "{" + body + "}"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_value(v: float) -> str:
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+registry = MetricsRegistry()
+
+
+class Recorder:
+    """Per-request (or per-worker-call) state: summed stage seconds, optional observation buffer."""
+
+    __slots__ = ("stages", "buffer")
+
+    def __init__(self, buffer: bool = False):
+        self.stages: Dict[str, float] = {}
+        self.buffer: Optional[List[Tuple[str, float, Labels]]] = [] if buffer else None
+
+
+_current: contextvars.ContextVar[Optional[Recorder]] = contextvars.ContextVar("metrics_recorder", default=None)
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(on: bool) -> None:
+    global _enabled
+    _enabled = bool(on)
+
+
+def observe(name: str, value: float, **labels: Any) -> None:
+    if not _enabled:
+        return
+    key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+    rec = _current.get()
+    if rec is not None and rec.buffer is not None:
+        rec.buffer.append((name, float(value), key))
+    else:
+        registry.observe(name, float(value), key)
+
+
+class _Stage:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Stage":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self.t0
+        observe("lungs_stage_seconds", elapsed, stage=self.name)
+        rec = _current.get()
+        if rec is not None:
+            rec.stages[self.name] = rec.stages.get(self.name, 0.0) + elapsed
+
+
+def stage(name: str):
+    """Time the enclosed block as pipeline stage `name` (no-op when metrics are disabled)."""
+    return _Stage(name) if _enabled else _noop
+
+
+@contextlib.contextmanager
+def request() -> Iterator[Optional[Recorder]]:
+    """Scope one API request; yields its Recorder (None when metrics are disabled)."""
+    if not _enabled:
+        yield None
+        return
+    rec = Recorder()
+    token = _current.set(rec)
+    try:
+        yield rec
+    finally:
+        _current.reset(token)
+
+
+def collect(fn: Callable[..., Any], *args: Any) -> Tuple[Any, Optional[Recorder]]:
+    """Run `fn` in a worker process with observations buffered; returns (result, recorder)."""
+    if not _enabled:
+        return fn(*args), None
+    rec = Recorder(buffer=True)
+    token = _current.set(rec)
+    try:
+        return fn(*args), rec
+    finally:
+        _current.reset(token)
+
+
+def replay(worker: Optional[Recorder]) -> None:
+    """Fold a worker's buffered observations and stage times into this process (and request)."""
+    if worker is None or not _enabled:
+        return
+    for name, value, labels in worker.buffer or ():
+        registry.observe(name, value, labels)
+    rec = _current.get()
+    if rec is not None:
+        for name, seconds in worker.stages.items():
+            rec.stages[name] = rec.stages.get(name, 0.0) + seconds
+
+
+def server_timing(rec: Optional[Recorder], total_seconds: Optional[float] = None) -> Optional[str]:
+    """Server-Timing header value (durations in ms) for a request's recorder."""
+    if rec is None:
+        return None
+    parts = [f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in rec.stages.items()]
+    if total_seconds is not None:
+        parts.append(f"total;dur={total_seconds * 1000.0:.2f}")
+    return ", ".join(parts) or None
@@ -1,36 +1,193 @@
 from __future__ import annotations
 
+"""
+CNN architectures over the (H, W, C) time-frequency features (H mel bins, W frames).
+
+  cnn        three full 3x3 Conv2D blocks (the original model)
+  separable  same block layout; blocks 2-3 are depthwise-separable convolutions
+  time_pool  the first block halves the time axis twice (stride-2 conv in time, then
+             2x2 pooling), so the later blocks see a quarter of the frames
+
+Every variant ends in the same head, with one softmax output per ModelConfig.classes.
+`profile_model` reports parameters, FLOPs (2 x multiply-adds of conv/dense kernels)
+and measured single-sample / batch latency.
+
+Compare the variants untrained (cost only, no data needed):
+  cd backend
+  python -m ml.modeling [--batch-size 32] [--repeats 30]
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 import tensorflow as tf
 
+from .config import AudioConfig, FeatureConfig, ModelConfig, cnn_input_shape
 
-def build_cnn(input_shape: tuple) -> tf.keras.Model:
-    """
-    CNN over time-frequency features.
-    input_shape: (H, W, C) where C=2 (mel + mfcc)
-    """
-    inputs = tf.keras.Input(shape=input_shape)
-    x = tf.keras.layers.Conv2D(32, (3, 3), padding="same", activation="relu")(inputs)
-    x = tf.keras.layers.MaxPool2D((2, 2))(x)
-    x = tf.keras.layers.Dropout(0.2)(x)
+layers = tf.keras.layers
+
+
+def _conv_block(x: tf.Tensor, filters: int, dropout: float, separable: bool = False) -> tf.Tensor:
+    conv = layers.SeparableConv2D if separable else layers.Conv2D
+    x = conv(filters, (3, 3), padding="same", activation="relu")(x)
+    x = layers.MaxPool2D((2, 2))(x)
+    return layers.Dropout(dropout)(x)
 
-    x = tf.keras.layers.Conv2D(64, (3, 3), padding="same", activation="relu")(x)
-    x = tf.keras.layers.MaxPool2D((2, 2))(x)
-    x = tf.keras.layers.Dropout(0.25)(x)
 
-    x = tf.keras.layers.Conv2D(128, (3, 3), padding="same", activation="relu")(x)
-    x = tf.keras.layers.MaxPool2D((2, 2))(x)
-    x = tf.keras.layers.Dropout(0.3)(x)
+def _rate(default: float, dropout: Optional[float]) -> float:
+    return default if dropout is None else dropout
+
+
+def _cnn(inputs: tf.Tensor, dropout: Optional[float]) -> tf.Tensor:
+    x = _conv_block(inputs, 32, _rate(0.2, dropout))
+    x = _conv_block(x, 64, _rate(0.25, dropout))
+    return _conv_block(x, 128, _rate(0.3, dropout))
+
+
+def _separable(inputs: tf.Tensor, dropout: Optional[float]) -> tf.Tensor:
+    # A depthwise first layer would only see the 2 input channels: keep it a full conv.
+    x = _conv_block(inputs, 32, _rate(0.2, dropout))
+    x = _conv_block(x, 64, _rate(0.25, dropout), separable=True)
+    return _conv_block(x, 128, _rate(0.3, dropout), separable=True)
+
+
+def _time_pool(inputs: tf.Tensor, dropout: Optional[float]) -> tf.Tensor:
+    x = layers.Conv2D(32, (3, 3), strides=(1, 2), padding="same", activation="relu")(inputs)
+    x = layers.MaxPool2D((2, 2))(x)
+    x = layers.Dropout(_rate(0.2, dropout))(x)
+    x = _conv_block(x, 64, _rate(0.25, dropout))
+    return _conv_block(x, 128, _rate(0.3, dropout))
+
+
+# name -> (feature extractor, Keras model name)
+ARCHITECTURES: Dict[str, Tuple[Callable[[tf.Tensor, Optional[float]], tf.Tensor], str]] = {
+    "cnn": (_cnn, "respiratory_cnn"),
+    "separable": (_separable, "respiratory_separable_cnn"),
+    "time_pool": (_time_pool, "respiratory_time_pool_cnn"),
+}
+
+
+def build_model(
+    architecture: str,
+    input_shape: tuple,
+    num_classes: Optional[int] = None,
+    jit_compile: bool = False,
+    learning_rate: float = 1e-3,
+    dropout: Optional[float] = None,
+) -> tf.keras.Model:
+    """
+    Compiled, untrained model of one of ARCHITECTURES.
+    num_classes defaults to len(ModelConfig.classes).
+    dropout: one rate for every Dropout layer; None keeps the per-block rates (0.2 .. 0.35).
+    jit_compile: XLA-compile the train step (RuntimeConfig.xla).
+    Layers follow the global dtype policy (e.g. mixed_bfloat16); the softmax stays float32.
+    """
+    if architecture not in ARCHITECTURES:
+        raise ValueError(f"Unknown architecture: {architecture!r} (expected one of {', '.join(ARCHITECTURES)})")
+    body, name = ARCHITECTURES[architecture]
+    num_classes = num_classes or len(ModelConfig.classes)
 
-    x = tf.keras.layers.GlobalAveragePooling2D()(x)
-    x = tf.keras.layers.Dense(128, activation="relu")(x)
-    x = tf.keras.layers.Dropout(0.35)(x)
-    outputs = tf.keras.layers.Dense(5, activation="softmax")(x)
+    inputs = tf.keras.Input(shape=input_shape)
+    x = body(inputs, dropout)
+    x = layers.GlobalAveragePooling2D()(x)
+    x = layers.Dense(128, activation="relu")(x)
+    x = layers.Dropout(_rate(0.35, dropout))(x)
+    outputs = layers.Dense(num_classes, activation="softmax", dtype="float32")(x)
 
-    model = tf.keras.Model(inputs=inputs, outputs=outputs, name="respiratory_cnn")
+    model = tf.keras.Model(inputs=inputs, outputs=outputs, name=name)
     model.compile(
-        optimizer=tf.keras.optimizers.Adam(learning_rate=1e-3),
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
         loss="sparse_categorical_crossentropy",
         metrics=["accuracy"],
+        jit_compile=jit_compile,
     )
     return model
 
+
+def build_cnn(input_shape: tuple, jit_compile: bool = False, num_classes: Optional[int] = None) -> tf.keras.Model:
+    """
+    CNN over time-frequency features.
+    input_shape: (H, W, C) where C=2 (mel + mfcc)
+    """
+    return build_model("cnn", input_shape, num_classes=num_classes, jit_compile=jit_compile)
+
+
+KERNEL_ATTRS = ("kernel", "depthwise_kernel", "pointwise_kernel")  # conv/dense, separable/depthwise conv
+
+
+def count_flops(model: tf.keras.Model) -> int:
+    """
+    Inference FLOPs per example: 2 x multiply-adds of every conv/dense kernel, i.e. the
+    kernel size times the number of output positions. Pooling, activations and layers
+    without a kernel (such as the in-graph front end) are not counted.
+    """
+    total = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.Model):
+            total += count_flops(layer)
+            continue
+        # Attributes, not weight names: Keras 2 names them e.g. "conv2d/kernel:0".
+        kernels = [k for k in (getattr(layer, a, None) for a in KERNEL_ATTRS) if k is not None]
+        if not kernels:
+            continue
+        positions = int(np.prod(layer.output.shape[1:-1]))  # 1 for Dense on (B, features)
+        total += 2 * positions * sum(int(np.prod(w.shape)) for w in kernels)
+    return total
+
+
+def measure_latency(model: tf.keras.Model, batch_sizes: Sequence[int] = (1, 32), repeats: int = 30) -> Dict[str, dict]:
+    """p50 latency of a traced forward pass (as served by ml.registry) on random inputs."""
+    spec = tf.TensorSpec(shape=model.input_shape, dtype=tf.float32)
+    traced = tf.function(lambda x: model(x, training=False), input_signature=[spec])
+    rng = np.random.default_rng(0)
+    out = {}
+    for b in batch_sizes:
+        x = tf.constant(rng.standard_normal((b,) + tuple(model.input_shape[1:])).astype(np.float32))
+        traced(x).numpy()  # trace
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            traced(x).numpy()
+            times.append((time.perf_counter() - t0) * 1000.0)
+        p50 = float(np.median(times))
+        out[str(b)] = {"p50_ms": round(p50, 3), "per_example_ms": round(p50 / b, 3)}
+    return out
+
+
+def profile_model(model: tf.keras.Model, batch_size: int = 32, repeats: int = 30) -> Dict[str, object]:
+    return {
+        "name": model.name,
+        "params": int(model.count_params()),
+        "flops": count_flops(model),
+        "latency": measure_latency(model, (1, batch_size), repeats),
+    }
+
+
+def format_profile(profile: Dict[str, object]) -> str:
+    latency = profile["latency"]
+    batch = max(latency, key=int)
+    return (
+        f"{profile['name']}: {profile['params'] / 1e3:.1f}k params, {profile['flops'] / 1e6:.1f} MFLOPs,"
+        f" latency {latency['1']['p50_ms']:.2f} ms (batch 1),"
+        f" {latency[batch]['p50_ms']:.2f} ms (batch {batch}, {latency[batch]['per_example_ms']:.2f} ms/example)"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Parameters, FLOPs and latency of every architecture.")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args(argv)
+
+    input_shape = cnn_input_shape(AudioConfig(), FeatureConfig(), ModelConfig())
+    print(f"Input shape: {input_shape}")
+    for name in ARCHITECTURES:
+        model = build_model(name, input_shape)
+        print(f"{name:<10} " + format_profile(profile_model(model, args.batch_size, args.repeats)))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,22 +1,35 @@
 from __future__ import annotations
 
+import io
 import os
-from typing import Dict, Tuple
+import sys
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
-import tensorflow as tf
 
-from .config import AudioConfig, FeatureConfig, ModelConfig
-from .features import extract_all_features
-from .modeling import build_cnn
-from .preprocess import preprocess_audio
+from . import metrics
+from .config import AudioConfig, DecodeConfig, FeatureConfig, ModelConfig, VizConfig, WindowConfig
+from .decode import AudioSource, AudioTooLong
+from .engine import featurize_clip
+from .preprocess import load_audio, resample
+from .viz import encode_array, peak_downsample, pool2d
 
+if TYPE_CHECKING:
+    import tensorflow as tf
 
-def _ensure_model(model_path: str, input_shape: Tuple[int, int, int]) -> tf.keras.Model:
+# TensorFlow is imported only by the "keras" backend, so a "tflite" worker never loads it.
+
+
+def _ensure_model(model_path: str, input_shape: Tuple[int, int, int]) -> "tf.keras.Model":
     """
     Load trained model if present; otherwise create a baseline untrained model and save it.
     This keeps the demo runnable out-of-the-box while still supporting proper training via ml/train.py.
     """
+    import tensorflow as tf
+
+    from .modeling import build_cnn
+
     os.makedirs(os.path.dirname(model_path), exist_ok=True)
     if os.path.exists(model_path):
         return tf.keras.models.load_model(model_path)
@@ -27,50 +40,309 @@ def _ensure_model(model_path: str, input_shape: Tuple[int, int, int]) -> tf.kera
     return model
 
 
+def load_tflite_interpreter(path: str, num_threads: int = 0):
+    """
+    First available of ai_edge_litert / tflite_runtime (no TensorFlow). Falling back to
+    tf.lite works but imports all of TensorFlow, so it is reported on stderr.
+    """
+    kwargs = {"model_path": path}
+    if num_threads > 0:
+        kwargs["num_threads"] = num_threads
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            print(
+                "Neither ai-edge-litert nor tflite-runtime is installed: the tflite backend falls back to "
+                "tf.lite and imports TensorFlow (pip install tflite-runtime to avoid it).",
+                file=sys.stderr,
+            )
+            import tensorflow as tf
+
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(**kwargs)
+
+
+class TFLiteModel:
+    """
+    (B, H, W, C) float32 -> (B, n_classes) with an exported .tflite model.
+    Quantized (int8/uint8) inputs/outputs are (de)quantized with the tensor's scale and
+    zero point. The interpreter is not thread-safe, so calls are serialized.
+    """
+
+    def __init__(self, path: str, num_threads: int = 0):
+        self.path = path
+        self._interp = load_tflite_interpreter(path, num_threads)
+        self._interp.allocate_tensors()
+        self._in = self._interp.get_input_details()[0]
+        self._out = self._interp.get_output_details()[0]
+        self.input_shape = tuple(int(d) for d in self._in["shape"][1:])
+        self._batch = int(self._in["shape"][0])
+        self._lock = threading.Lock()
+
+    def _resize(self, batch: int) -> None:
+        if batch != self._batch:
+            self._interp.resize_tensor_input(self._in["index"], (batch,) + self.input_shape)
+            self._interp.allocate_tensors()
+            self._in = self._interp.get_input_details()[0]
+            self._out = self._interp.get_output_details()[0]
+            self._batch = batch
+
+    def predict(self, x_b: np.ndarray) -> np.ndarray:
+        x_b = np.asarray(x_b, dtype=np.float32)
+        with self._lock:
+            self._resize(len(x_b))
+            dtype = self._in["dtype"]
+            if dtype != np.float32:
+                scale, zero = self._in["quantization"]
+                info = np.iinfo(dtype)
+                x_b = np.clip(np.round(x_b / scale + zero), info.min, info.max).astype(dtype)
+            self._interp.set_tensor(self._in["index"], x_b)
+            self._interp.invoke()
+            out = self._interp.get_tensor(self._out["index"])
+            if out.dtype != np.float32:
+                scale, zero = self._out["quantization"]
+                out = (out.astype(np.float32) - zero) * scale
+            return np.array(out, dtype=np.float32)
+
+
+def prepare_input(
+    file_bytes: AudioSource,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    with_waveform: bool = True,
+    decode_cfg: DecodeConfig = DecodeConfig(),
+) -> Tuple[np.ndarray, Optional[np.ndarray], int, Dict[str, np.ndarray]]:
+    """
+    CPU half of the pipeline (decode -> preprocess -> features).
+    Returns (x, y, sr, feats) where x is the (H, W, C) CNN input and y the
+    preprocessed waveform, or None when `with_waveform` is off and the
+    single-STFT feature path (ml.engine) does not need it.
+    With decode_cfg.truncate (opt-in) only the first duration_seconds (+ margin) are
+    decoded: the gate's noise floor and the peak gain then come from that span instead
+    of the whole upload, which moves class probabilities by up to ~9 points on long clips.
+    """
+    max_seconds = audio_cfg.duration_seconds + decode_cfg.margin_seconds if decode_cfg.truncate else None
+    y, sr = load_audio(file_bytes, audio_cfg, max_seconds=max_seconds, fast_path=decode_cfg.fast_path)
+    y, sr = resample(y, sr, audio_cfg)
+    x, feats, y = featurize_clip(y, sr, audio_cfg, feat_cfg, return_waveform=with_waveform)
+    return x, y, sr, feats
+
+
+def warm_up_pipeline(audio_cfg: AudioConfig, feat_cfg: FeatureConfig) -> None:
+    """
+    One decode -> resample -> features -> visualization pass on a synthetic WAV, so
+    module imports, filter/basis caches and numba compilation happen at startup
+    instead of on the first request.
+    """
+    import soundfile as sf
+
+    sr = 22050 if audio_cfg.target_sr != 22050 else 44100  # exercise the resampler
+    n = int(sr * audio_cfg.duration_seconds)
+    rng = np.random.default_rng(0)
+    y = 0.1 * np.sin(2 * np.pi * 220.0 * np.arange(n) / sr) + 0.01 * rng.standard_normal(n)
+    buf = io.BytesIO()
+    sf.write(buf, y.astype(np.float32), sr, format="WAV")
+    _, y_p, sr_p, feats = prepare_input(buf.getvalue(), audio_cfg, feat_cfg)
+    build_visualization(y_p, sr_p, feats)
+
+
+def infer_in_chunks(infer: Callable[[np.ndarray], np.ndarray], x_b: np.ndarray, chunk_size: int) -> np.ndarray:
+    """Batched forward pass over (N, H, W, C), at most `chunk_size` rows at a time to bound activation memory."""
+    outs = [np.asarray(infer(x_b[i : i + chunk_size])) for i in range(0, len(x_b), chunk_size)]
+    return np.concatenate(outs, axis=0)
+
+
+def decode_probabilities(probs: np.ndarray, model_cfg: ModelConfig) -> Tuple[str, float, Dict[str, float]]:
+    """One row of model output -> (label, confidence %, per-class %)."""
+    probs = np.asarray(probs).astype(np.float64)
+    probs = probs / (probs.sum() + 1e-12)
+
+    idx = int(np.argmax(probs))
+    label = model_cfg.classes[idx]
+    confidence = float(probs[idx] * 100.0)
+    prob_map = {cls: float(p * 100.0) for cls, p in zip(model_cfg.classes, probs)}
+    return label, confidence, prob_map
+
+
+def build_visualization(
+    y: np.ndarray,
+    sr: int,
+    feats: Dict[str, np.ndarray],
+    viz_cfg: VizConfig = VizConfig(),
+    mode: str = "json",
+) -> Dict[str, object]:
+    """
+    Waveform and mel-spectrogram of the whole clip, reduced for client rendering:
+    peak-preserving waveform buckets and an area/max pooled mel. `mode` "json" returns
+    float lists; "binary" returns base64 arrays (see ml.viz.encode_array).
+    """
+    with metrics.stage("visualization"):
+        waveform_ds = peak_downsample(y, viz_cfg.waveform_points).astype(np.float32)
+        mel = feats["mel"]  # (n_mels, t)
+        mel_ds = pool2d(mel, viz_cfg.mel_height, viz_cfg.mel_width, viz_cfg.mel_pool).astype(np.float32)
+
+        if mode == "binary":
+            return {
+                "sample_rate": int(sr),
+                "encoding": "binary",
+                "waveform": encode_array(waveform_ds, viz_cfg.binary_dtype),
+                "mel_spectrogram": encode_array(mel_ds, viz_cfg.binary_dtype),
+            }
+        return {
+            "sample_rate": int(sr),
+            "waveform": waveform_ds.tolist(),
+            "mel_spectrogram": mel_ds.tolist(),
+        }
+
+
 def predict_from_audio_bytes(
-    file_bytes: bytes,
+    file_bytes: AudioSource,
     model_path: str,
     audio_cfg: AudioConfig,
     feat_cfg: FeatureConfig,
     model_cfg: ModelConfig,
-) -> Tuple[str, float, Dict[str, float], Dict[str, object]]:
+    infer: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+    viz: str = "json",
+    viz_cfg: VizConfig = VizConfig(),
+    decode_cfg: DecodeConfig = DecodeConfig(),
+) -> Tuple[str, float, Dict[str, float], Optional[Dict[str, object]]]:
     """
+    `infer` maps a (B, H, W, C) batch to (B, n_classes) probabilities, e.g. ModelRegistry.predict.
+    When omitted the model is loaded from `model_path` (slow; kept for scripts).
+
     Returns:
       - predicted class label
       - confidence in percent
       - probabilities per class in percent
-      - visualization payload (downsampled waveform + mel-spectrogram)
+      - visualization payload (downsampled waveform + mel-spectrogram), None for viz="none"
     """
-    y, sr = preprocess_audio(file_bytes, audio_cfg)
-    x, feats = extract_all_features(y, sr, feat_cfg)
+    x, y, sr, feats = prepare_input(file_bytes, audio_cfg, feat_cfg, with_waveform=viz != "none", decode_cfg=decode_cfg)
     x_b = np.expand_dims(x, axis=0)  # (1, H, W, C)
 
-    model = _ensure_model(model_path, input_shape=x.shape)
-    probs = model.predict(x_b, verbose=0)[0].astype(np.float64)
-    probs = probs / (probs.sum() + 1e-12)
+    with metrics.stage("inference"):
+        if infer is None:
+            model = _ensure_model(model_path, input_shape=x.shape)
+            probs = model.predict(x_b, verbose=0)[0]
+        else:
+            probs = np.asarray(infer(x_b))[0]
 
-    idx = int(np.argmax(probs))
-    label = model_cfg.classes[idx]
-    confidence = float(probs[idx] * 100.0)
-    prob_map = {cls: float(p * 100.0) for cls, p in zip(model_cfg.classes, probs)}
+    label, confidence, prob_map = decode_probabilities(probs, model_cfg)
+    if viz == "none":
+        return label, confidence, prob_map, None
+    return label, confidence, prob_map, build_visualization(y, sr, feats, viz_cfg, viz)
+
+
+def iter_windows(y: np.ndarray, sr: int, audio_cfg: AudioConfig, win_cfg: WindowConfig) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Yield (start_sample, window) views of `duration_seconds` every `hop_seconds`.
+    A last window is aligned to the end of the clip so no audio is dropped; clips
+    shorter than one window yield a single (padded later) window.
+    """
+    win = int(audio_cfg.duration_seconds * sr)
+    hop = max(1, int(win_cfg.hop_seconds * sr))
+    if len(y) <= win:
+        yield 0, y
+        return
+    start = 0
+    for start in range(0, len(y) - win + 1, hop):
+        yield start, y[start : start + win]
+    if start + win < len(y):
+        yield len(y) - win, y[len(y) - win :]
+
+
+def aggregate_windows(probs: np.ndarray, how: str) -> np.ndarray:
+    """(n_windows, n_classes) -> (n_classes,) clip-level probabilities."""
+    if how == "mean":
+        return probs.mean(axis=0)
+    if how == "max":
+        return probs[int(np.argmax(probs.max(axis=1)))]
+    raise ValueError(f"Unknown window aggregation: {how!r} (expected 'mean' or 'max')")
 
-    # Visualization payload (keep JSON light)
-    waveform = y
-    # downsample waveform to <= 2000 points
-    n_w = min(2000, len(waveform))
-    w_idx = np.linspace(0, len(waveform) - 1, num=n_w).astype(int)
-    waveform_ds = waveform[w_idx].astype(np.float32)
-
-    mel = feats["mel"]  # (n_mels, t)
-    # downsample mel to 128x128-ish for client rendering
-    h = min(128, mel.shape[0])
-    w = min(128, mel.shape[1])
-    mel_ds = mel[:h, :w].astype(np.float32)
-
-    viz = {
-        "sample_rate": int(sr),
-        "waveform": waveform_ds.tolist(),
-        "mel_spectrogram": mel_ds.tolist(),
-    }
-    return label, confidence, prob_map, viz
 
+def predict_windows(
+    y: np.ndarray,
+    sr: int,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    model_cfg: ModelConfig,
+    win_cfg: WindowConfig,
+    infer: Callable[[np.ndarray], np.ndarray],
+) -> Tuple[np.ndarray, List[Dict[str, object]]]:
+    """
+    Score a resampled clip of any length window by window. Windows are featurized and
+    scored `batch_size` at a time, so memory beyond the waveform itself stays flat.
+    Returns (clip probabilities, per-window timeline).
+    """
+    rows: List[np.ndarray] = []
+    timeline: List[Dict[str, object]] = []
+    chunk: List[Tuple[int, np.ndarray]] = []
+
+    def flush() -> None:
+        xs = [featurize_clip(w, sr, audio_cfg, feat_cfg, return_waveform=False)[0] for _, w in chunk]
+        with metrics.stage("inference"):
+            probs_b = np.asarray(infer(np.stack(xs, axis=0)))
+        for (start, w), row in zip(chunk, probs_b):
+            label, confidence, prob_map = decode_probabilities(row, model_cfg)
+            timeline.append(
+                {
+                    "start_s": round(start / sr, 3),
+                    "end_s": round((start + len(w)) / sr, 3),
+                    "predicted_disease": label,
+                    "confidence": round(confidence, 2),
+                    "probabilities": {k: round(v, 4) for k, v in prob_map.items()},
+                }
+            )
+            rows.append(row)
+        chunk.clear()
+
+    for item in iter_windows(y, sr, audio_cfg, win_cfg):
+        chunk.append(item)
+        if len(chunk) >= win_cfg.batch_size:
+            flush()
+    if chunk:
+        flush()
+
+    return aggregate_windows(np.stack(rows, axis=0), win_cfg.aggregate), timeline
+
+
+def max_windowed_seconds(audio_cfg: AudioConfig, win_cfg: WindowConfig) -> Optional[float]:
+    """Longest clip a windowed request accepts (max_windows windows), or None without a cap."""
+    if win_cfg.max_windows <= 0:
+        return None
+    return audio_cfg.duration_seconds + (win_cfg.max_windows - 1) * win_cfg.hop_seconds
+
+
+def predict_windowed_from_audio_bytes(
+    file_bytes: AudioSource,
+    audio_cfg: AudioConfig,
+    feat_cfg: FeatureConfig,
+    model_cfg: ModelConfig,
+    win_cfg: WindowConfig,
+    infer: Callable[[np.ndarray], np.ndarray],
+    viz: str = "json",
+    viz_cfg: VizConfig = VizConfig(),
+    decode_cfg: DecodeConfig = DecodeConfig(),
+) -> Tuple[str, float, Dict[str, float], List[Dict[str, object]], Optional[Dict[str, object]]]:
+    """
+    Windowed counterpart of predict_from_audio_bytes for long recordings (decoded whole).
+    Clips longer than max_windowed_seconds raise AudioTooLong; decoding stops just past
+    the cap, so the decoded and resampled waveform (peak memory) is bounded by it.
+    Returns (label, confidence %, per-class %, window timeline, visualization of the first
+    window or None for viz="none").
+    """
+    cap = max_windowed_seconds(audio_cfg, win_cfg)
+    y, sr = load_audio(file_bytes, audio_cfg, max_seconds=cap + 1.0 if cap else None, fast_path=decode_cfg.fast_path)
+    if cap and len(y) > cap * sr:
+        raise AudioTooLong(f"Windowed requests accept at most {cap:g} s of audio ({win_cfg.max_windows} windows).")
+    y, sr = resample(y, sr, audio_cfg)
+    probs, timeline = predict_windows(y, sr, audio_cfg, feat_cfg, model_cfg, win_cfg, infer)
+    label, confidence, prob_map = decode_probabilities(probs, model_cfg)
+    if viz == "none":
+        return label, confidence, prob_map, timeline, None
+
+    win = int(audio_cfg.duration_seconds * sr)
+    _, feats, y_first = featurize_clip(y[:win], sr, audio_cfg, feat_cfg, return_waveform=True)
+    return label, confidence, prob_map, timeline, build_visualization(y_first, sr, feats, viz_cfg, viz)
@@ -1,31 +1,63 @@
 from __future__ import annotations
 
-import io
-from typing import Tuple
+from typing import Optional, Tuple
 
 import librosa
 import numpy as np
 
+from . import metrics
 from .config import AudioConfig
-
-
-def load_audio(file_bytes: bytes, cfg: AudioConfig) -> Tuple[np.ndarray, int]:
+from .decode import AudioSource, decode_audio
+from .resample import resample_batch
+
+# Spectral gate framing/thresholds (shared with the STFT feature engine in ml.engine).
+GATE_N_FFT = 1024
+GATE_HOP = 256
+GATE_PERCENTILE = 10
+GATE_FACTOR = 1.5
+
+
+def load_audio(
+    file_bytes: AudioSource,
+    cfg: AudioConfig,
+    max_seconds: Optional[float] = None,
+    fast_path: bool = True,
+) -> Tuple[np.ndarray, int]:
     """
-    Load audio bytes (wav/mp3/...) into mono float32 waveform at native sr.
-    Librosa uses soundfile/audioread under the hood depending on format.
+    Load audio bytes or a seekable binary file (wav/flac/ogg/mp3/...) into mono float32
+    waveform at native sr, at most `max_seconds` long when given (see ml.decode).
     """
-    bio = io.BytesIO(file_bytes)
-    y, sr = librosa.load(bio, sr=None, mono=True)
+    with metrics.stage("decode"):
+        y, sr = decode_audio(file_bytes, max_seconds=max_seconds, fast_path=fast_path)
     if y is None or len(y) == 0:
         raise ValueError("Empty/invalid audio.")
-    return y.astype(np.float32), int(sr)
+    metrics.observe("lungs_input_audio_seconds", len(y) / sr)
+    metrics.observe("lungs_input_sample_rate_total", 1, sample_rate=int(sr))
+    return y, int(sr)
 
 
-def resample(y: np.ndarray, sr: int, cfg: AudioConfig) -> Tuple[np.ndarray, int]:
+def resample(y: np.ndarray, sr: int, cfg: AudioConfig, tier: Optional[str] = None) -> Tuple[np.ndarray, int]:
+    """
+    (N,) clip or (B, N) batch of same-rate clips -> cfg.target_sr, with the ml.resample
+    `tier` (default cfg.resample_serving; training passes cfg.resample_training).
+    """
     if sr == cfg.target_sr:
         return y, sr
-    y_rs = librosa.resample(y, orig_sr=sr, target_sr=cfg.target_sr)
-    return y_rs.astype(np.float32), cfg.target_sr
+    with metrics.stage("resample"):
+        y_rs = resample_batch(y, sr, cfg.target_sr, tier or cfg.resample_serving)
+    return y_rs, cfg.target_sr
+
+
+def noise_gate_mask(mag: np.ndarray, n_ref_frames: Optional[int] = None) -> np.ndarray:
+    """
+    Boolean keep-mask for an STFT magnitude (freq x time): bins at or above
+    GATE_FACTOR x the per-frequency noise floor (GATE_PERCENTILE over time).
+    `n_ref_frames` restricts the floor estimate to the leading frames (e.g. when
+    trailing frames are zero padding).
+    """
+    ref = mag if n_ref_frames is None else mag[:, :n_ref_frames]
+    noise_floor = np.percentile(ref, GATE_PERCENTILE, axis=1, keepdims=True)
+    return mag >= (noise_floor * GATE_FACTOR)
 
 
 def reduce_noise(y: np.ndarray) -> np.ndarray:
@@ -36,14 +68,14 @@ def reduce_noise(y: np.ndarray) -> np.ndarray:
     - attenuate below a threshold
     This is deterministic and avoids extra deps (e.g., noisereduce).
     """
-    if y.size < 1024:
+    if y.size < GATE_N_FFT:
         return y
-    stft = librosa.stft(y, n_fft=1024, hop_length=256)
-    mag, phase = np.abs(stft), np.exp(1j * np.angle(stft))
-    noise_floor = np.percentile(mag, 10, axis=1, keepdims=True)
-    mask = mag >= (noise_floor * 1.5)
-    mag_d = mag * mask
-    y_d = librosa.istft(mag_d * phase, hop_length=256, length=len(y))
+    with metrics.stage("noise_gate"):
+        stft = librosa.stft(y, n_fft=GATE_N_FFT, hop_length=GATE_HOP)
+        mag, phase = np.abs(stft), np.exp(1j * np.angle(stft))
+        mask = noise_gate_mask(mag)
+        mag_d = mag * mask
+        y_d = librosa.istft(mag_d * phase, hop_length=GATE_HOP, length=len(y))
     return y_d.astype(np.float32)
 
 
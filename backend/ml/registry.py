@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .config import RuntimeConfig
+
+
+def file_fingerprint(path: str, chunk_size: int = 1 << 20) -> str:
+    """Short content hash identifying a model file version."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    Process-resident model holder for the API:
+    - loads model.h5 once per worker (instead of once per request)
+    - traces a single tf.function for any batch size
+    - runs a dummy warm-up inference so the first real request is not slow
+    `ready` flips to True only after warm-up succeeded.
+    With RuntimeConfig.backend == "tflite" the exported artifact is served instead and
+    TensorFlow is never imported. `warmup` (e.g. one pass of the DSP pipeline) runs
+    before `ready` too, so first-request import/JIT costs are paid at startup.
+    The keras backend applies RuntimeConfig thread counts, XLA and precision (ml.runtime);
+    with XLA batches are zero-padded to power-of-two sizes so each size compiles once.
+    Per-phase durations are kept in `timings` (seconds).
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        input_shape: Tuple[int, int, int],
+        runtime_cfg: RuntimeConfig = RuntimeConfig(),
+        warmup: Optional[Callable[[], None]] = None,
+    ):
+        if runtime_cfg.backend not in ("keras", "tflite"):
+            raise ValueError(f"Unknown model backend: {runtime_cfg.backend!r} (expected 'keras' or 'tflite')")
+        self.model_path = model_path
+        self.input_shape = tuple(int(d) for d in input_shape)
+        self.runtime_cfg = runtime_cfg
+        self.backend = runtime_cfg.backend
+        self.model = None  # tf.keras.Model or TFLiteModel
+        self.error: Optional[str] = None
+        self.fingerprint: Optional[str] = None  # content hash of the loaded model file
+        self.load_seconds: Optional[float] = None
+        self.timings: Dict[str, float] = {}
+        self.settings: Dict[str, object] = {}  # effective TensorFlow threads/XLA/precision (keras backend)
+        self._warmup = warmup
+        self._infer = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def load(self) -> None:
+        """Load + trace + warm up synchronously. Safe to call more than once."""
+        with self._lock:
+            if self._ready.is_set():
+                return
+            t0 = time.perf_counter()
+            try:
+                if self.backend == "tflite":
+                    model, fingerprint, infer = self._load_tflite()
+                else:
+                    model, fingerprint, infer = self._load_keras()
+                with self._phase("model_warmup"):
+                    dummy = np.zeros((1,) + self.input_shape, dtype=np.float32)
+                    infer(dummy)
+                if self._warmup is not None:
+                    with self._phase("pipeline_warmup"):
+                        self._warmup()
+
+                self.model = model
+                self.fingerprint = fingerprint
+                self._infer = infer
+                self.error = None
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                self.load_seconds = time.perf_counter() - t0
+            self._ready.set()
+
+    @contextmanager
+    def _phase(self, name: str) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - t0
+
+    def _load_keras(self):
+        with self._phase("import_runtime"):
+            import tensorflow as tf
+
+            from .predict import _ensure_model
+            from .runtime import batch_bucket, configure_tensorflow, with_precision
+
+            self.settings = configure_tensorflow(self.runtime_cfg)
+        with self._phase("model_load"):
+            model = _ensure_model(self.model_path, self.input_shape)
+            fingerprint = file_fingerprint(self.model_path)
+            if self.settings["precision"] != "float32":
+                model = with_precision(model, self.settings["precision"])
+                fingerprint += "-bf16"  # different outputs: separate prediction cache entries
+        spec = tf.TensorSpec(shape=(None,) + self.input_shape, dtype=tf.float32)
+        xla = self.runtime_cfg.xla
+
+        @tf.function(input_signature=[spec], jit_compile=xla)
+        def traced(x: tf.Tensor) -> tf.Tensor:
+            return model(x, training=False)
+
+        def infer(x_b: np.ndarray) -> np.ndarray:
+            n = len(x_b)
+            if xla and batch_bucket(n) != n:
+                pad = np.zeros((batch_bucket(n) - n,) + x_b.shape[1:], dtype=x_b.dtype)
+                return traced(tf.constant(np.concatenate([x_b, pad], axis=0))).numpy()[:n]
+            return traced(tf.constant(x_b)).numpy()
+
+        return model, fingerprint, infer
+
+    def _load_tflite(self):
+        path = self.runtime_cfg.tflite_path
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing {path}; create it with `python -m ml.export`.")
+        with self._phase("import_runtime"):
+            from .predict import TFLiteModel
+        with self._phase("model_load"):
+            model = TFLiteModel(path, num_threads=self.runtime_cfg.num_threads)
+        if model.input_shape != self.input_shape:
+            raise ValueError(f"{path} expects input {model.input_shape}, features are {self.input_shape}")
+        return model, file_fingerprint(path), model.predict
+
+    def start(self) -> threading.Thread:
+        """Load in a background thread so /health answers while the model warms up."""
+
+        def _run() -> None:
+            try:
+                self.load()
+            except Exception:
+                pass  # surfaced through `error` and /ready
+
+        t = threading.Thread(target=_run, name="model-warmup", daemon=True)
+        t.start()
+        return t
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def predict(self, x_b: np.ndarray) -> np.ndarray:
+        """(B, H, W, C) float32 -> (B, n_classes) probabilities."""
+        if not self._ready.is_set():
+            raise RuntimeError("Model is not loaded yet.")
+        x_b = np.asarray(x_b, dtype=np.float32)
+        metrics.observe("lungs_model_batch_size", len(x_b))
+        with metrics.stage("model_forward"):
+            return self._infer(x_b)
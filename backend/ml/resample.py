@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+"""
+Sample-rate conversion with selectable quality tiers.
+
+  soxr_vhq | soxr_hq | soxr_mq | soxr_lq   libsoxr (librosa's default is soxr_hq)
+  polyphase                                scipy.signal.resample_poly with a Kaiser
+                                           FIR designed once per (orig_sr, target_sr)
+
+Every tier takes one clip (N,) or a batch of same-rate clips (B, N). polyphase
+filters the whole batch in one call; soxr converts row by row into one output array
+(passing the rows as channels of one stream measured ~30% slower: it interleaves).
+
+Distance of the standardized CNN input from soxr_hq (8 s clips from 4-48 kHz):
+soxr_mq mean |dx| ~0.001 but max |dx| up to ~0.19 at ~20% less time, polyphase ~0.01
+(0.05 when upsampling from 4 kHz) and slower than soxr, soxr_lq ~0.07. Serving defaults
+to soxr_hq, the training tier, so /predict sees the features model.h5 was trained on.
+"""
+
+import functools
+import math
+from typing import Tuple
+
+import numpy as np
+
+SOXR_TIERS = {"soxr_vhq": "VHQ", "soxr_hq": "HQ", "soxr_mq": "MQ", "soxr_lq": "LQ"}
+TIERS = tuple(SOXR_TIERS) + ("polyphase",)
+
+# Kaiser beta 5.0 and 10 zero crossings per side: scipy.signal.resample_poly's own design.
+_POLY_BETA = 5.0
+_POLY_HALF_LEN = 10
+
+
+def check_tier(tier: str) -> str:
+    if tier not in TIERS:
+        raise ValueError(f"Unknown resampler: {tier!r} (expected one of {', '.join(TIERS)})")
+    return tier
+
+
+@functools.lru_cache(maxsize=32)
+def polyphase_filter(orig_sr: int, target_sr: int) -> Tuple[int, int, np.ndarray]:
+    """(up, down, taps) for orig_sr -> target_sr; the design is cached per rate pair."""
+    import scipy.signal
+
+    g = math.gcd(int(orig_sr), int(target_sr))
+    up, down = int(target_sr) // g, int(orig_sr) // g
+    max_rate = max(up, down)
+    taps = scipy.signal.firwin(
+        2 * _POLY_HALF_LEN * max_rate + 1, 1.0 / max_rate, window=("kaiser", _POLY_BETA)
+    ).astype(np.float32)
+    taps.setflags(write=False)
+    return up, down, taps
+
+
+def resample_batch(y: np.ndarray, orig_sr: int, target_sr: int, tier: str = "soxr_hq") -> np.ndarray:
+    """(N,) or (B, N) float32 at orig_sr -> same layout at target_sr."""
+    check_tier(tier)
+    y = np.asarray(y, dtype=np.float32)
+    if orig_sr == target_sr:
+        return y
+    if tier == "polyphase":
+        import scipy.signal
+
+        up, down, taps = polyphase_filter(orig_sr, target_sr)
+        return scipy.signal.resample_poly(y, up, down, axis=-1, window=taps).astype(np.float32, copy=False)
+
+    import soxr
+
+    quality = SOXR_TIERS[tier]
+    if y.ndim == 1:
+        return soxr.resample(y, orig_sr, target_sr, quality=quality)
+    first = soxr.resample(y[0], orig_sr, target_sr, quality=quality)
+    out = np.empty((len(y), len(first)), dtype=np.float32)
+    out[0] = first
+    for i in range(1, len(y)):
+        out[i] = soxr.resample(y[i], orig_sr, target_sr, quality=quality)
+    return out
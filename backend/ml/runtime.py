@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+"""
+TensorFlow execution settings (RuntimeConfig): thread pools, XLA and bfloat16.
+
+  configure_tensorflow(cfg)   thread pools; must run before TensorFlow executes any op
+  resolve_precision(cfg)      "mixed_bfloat16" only where the CPU has native bf16
+                              (avx512_bf16 / amx_bf16), else "float32"
+  with_precision(model, p)    same functional model and weights, layers in policy `p`
+                              (the softmax output stays float32)
+
+Several TensorFlow processes on one host (uvicorn workers, PIPELINE_EXECUTOR=process)
+each default to one thread per core; give each process cores / processes threads.
+
+Benchmark every combination (each in a fresh process, as thread pools are fixed once
+TensorFlow starts) and print throughput per setting:
+  cd backend
+  python -m ml.runtime [--batch-sizes 1,8,32] [--train] [--out runtime.json]
+"""
+
+import argparse
+import dataclasses
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .config import AudioConfig, FeatureConfig, ModelConfig, RuntimeConfig, cnn_input_shape
+
+PRECISIONS = ("float32", "mixed_bfloat16", "auto")
+_BF16_FLAGS = ("avx512_bf16", "amx_bf16")
+
+
+def cpu_supports_bf16() -> bool:
+    """Native bf16 arithmetic on this CPU (Linux /proc/cpuinfo flags; False elsewhere)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = line.split(":", 1)[1].split()
+                    return any(flag in flags for flag in _BF16_FLAGS)
+    except OSError:
+        pass
+    return False
+
+
+def resolve_precision(cfg: RuntimeConfig) -> str:
+    if cfg.precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision: {cfg.precision!r} (expected one of {', '.join(PRECISIONS)})")
+    if cfg.precision == "float32":
+        return "float32"
+    if cpu_supports_bf16():
+        return "mixed_bfloat16"
+    if cfg.precision == "mixed_bfloat16":
+        print("precision=mixed_bfloat16 requested but the CPU has no native bf16; using float32.", file=sys.stderr)
+    return "float32"
+
+
+def configure_tensorflow(cfg: RuntimeConfig) -> Dict[str, Any]:
+    """Apply thread counts; returns the effective settings (after TF has started they cannot change)."""
+    import tensorflow as tf
+
+    try:
+        if cfg.intra_op_threads > 0:
+            tf.config.threading.set_intra_op_parallelism_threads(cfg.intra_op_threads)
+        if cfg.inter_op_threads > 0:
+            tf.config.threading.set_inter_op_parallelism_threads(cfg.inter_op_threads)
+    except RuntimeError as e:  # runtime already initialized: keep whatever it runs with
+        print(f"TensorFlow thread settings not applied: {e}", file=sys.stderr)
+    return {
+        "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+        "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads(),
+        "xla": bool(cfg.xla),
+        "precision": resolve_precision(cfg),
+    }
+
+
+def with_precision(model: "Any", precision: str) -> "Any":
+    """Rebuild a functional Keras model with its layers in `precision`; float32 returns `model`."""
+    if precision == "float32":
+        return model
+    import tensorflow as tf
+
+    config = model.get_config()
+    layers = config["layers"]
+    for layer in layers:
+        if layer["class_name"] != "InputLayer":
+            layer["config"]["dtype"] = precision
+    layers[-1]["config"]["dtype"] = "float32"  # probabilities in float32
+    clone = tf.keras.Model.from_config(config)
+    clone.set_weights(model.get_weights())
+    return clone
+
+
+def batch_bucket(n: int) -> int:
+    """Next power of two: XLA compiles once per input shape, so batches are padded to buckets."""
+    return 1 << max(0, int(n) - 1).bit_length()
+
+
+def _thread_choices(cores: int) -> List[int]:
+    return sorted({1, max(1, cores // 2), cores})
+
+
+def combinations(cores: int, bf16: bool) -> List[RuntimeConfig]:
+    precisions = ("float32", "mixed_bfloat16") if bf16 else ("float32",)
+    out = []
+    for intra, inter, xla, precision in itertools.product(_thread_choices(cores), (1, 2), (False, True), precisions):
+        out.append(RuntimeConfig(intra_op_threads=intra, inter_op_threads=inter, xla=xla, precision=precision))
+    return out
+
+
+def _measure(cfg: RuntimeConfig, model_path: str, batch_sizes: Sequence[int], repeats: int, train: bool) -> Dict[str, Any]:
+    """Runs in a fresh process: configure TF, load the model, time inference (and a train step)."""
+    os.environ.setdefault("CUDA_VISIBLE_DEVICES", "-1")
+    settings = configure_tensorflow(cfg)
+    import tensorflow as tf
+
+    from .modeling import build_cnn
+
+    input_shape = cnn_input_shape(AudioConfig(), FeatureConfig(), ModelConfig())
+    if os.path.exists(model_path):
+        model = tf.keras.models.load_model(model_path)
+    else:
+        model = build_cnn(input_shape)
+    model = with_precision(model, settings["precision"])
+    spec = tf.TensorSpec(shape=(None,) + input_shape, dtype=tf.float32)
+    traced = tf.function(lambda x: model(x, training=False), input_signature=[spec], jit_compile=cfg.xla)
+
+    rng = np.random.default_rng(0)
+    result: Dict[str, Any] = {"settings": settings, "infer": {}}
+    for b in batch_sizes:
+        x = tf.constant(rng.standard_normal((b,) + input_shape).astype(np.float32))
+        t0 = time.perf_counter()
+        traced(x).numpy()  # trace (+ XLA compile)
+        first = time.perf_counter() - t0
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            traced(x).numpy()
+            times.append(time.perf_counter() - t0)
+        p50 = float(np.median(times))
+        result["infer"][str(b)] = {
+            "p50_ms": round(p50 * 1000.0, 3),
+            "clips_per_s": round(b / p50, 1),
+            "first_call_ms": round(first * 1000.0, 1),
+        }
+
+    if train:
+        if settings["precision"] != "float32":
+            tf.keras.mixed_precision.set_global_policy(settings["precision"])
+        fit_model = build_cnn(input_shape, jit_compile=cfg.xla)
+        b = 16
+        x = rng.standard_normal((b,) + input_shape).astype(np.float32)
+        y = rng.integers(0, fit_model.output_shape[-1], size=b)
+        fit_model.train_on_batch(x, y)
+        t0 = time.perf_counter()
+        steps = max(3, repeats // 2)
+        for _ in range(steps):
+            fit_model.train_on_batch(x, y)
+        step = (time.perf_counter() - t0) / steps
+        result["train"] = {"batch_size": b, "step_ms": round(step * 1000.0, 2), "clips_per_s": round(b / step, 1)}
+    return result
+
+
+def _run_child(cfg: RuntimeConfig, args: argparse.Namespace) -> Dict[str, Any]:
+    cmd = [
+        sys.executable, "-m", "ml.runtime", "--child", json.dumps(dataclasses.asdict(cfg)),
+        "--model", args.model, "--batch-sizes", args.batch_sizes, "--repeats", str(args.repeats),
+    ]
+    if args.train:
+        cmd.append("--train")
+    env = {**os.environ, "TF_CPP_MIN_LOG_LEVEL": "3"}
+    proc = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if proc.returncode != 0:
+        return {"settings": dataclasses.asdict(cfg), "error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _label(settings: Dict[str, Any]) -> str:
+    return (
+        f"intra={settings['intra_op_threads']} inter={settings['inter_op_threads']} "
+        f"xla={'on' if settings['xla'] else 'off'} {settings['precision']}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Throughput of TensorFlow thread/XLA/precision settings.")
+    parser.add_argument("--model", default=os.path.join("model", "model.h5"), help="untrained build_cnn if missing")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--train", action="store_true", help="also time train_on_batch (batch 16)")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="thread counts are tried up to this")
+    parser.add_argument("--out", default="", help="write all results as JSON")
+    parser.add_argument("--child", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b]
+
+    if args.child:
+        cfg = RuntimeConfig(**json.loads(args.child))
+        print(json.dumps(_measure(cfg, args.model, batch_sizes, args.repeats, args.train)))
+        return 0
+
+    bf16 = cpu_supports_bf16()
+    print(f"{args.cores} cores, native bf16: {'yes' if bf16 else 'no'}")
+    results = []
+    for cfg in combinations(args.cores, bf16):
+        r = _run_child(cfg, args)
+        results.append(r)
+        if "error" in r:
+            print(f"{_label({**dataclasses.asdict(cfg), 'precision': cfg.precision})}: failed {r['error']}")
+            continue
+        cols = "  ".join(f"b{b} {r['infer'][str(b)]['clips_per_s']:>8.1f}/s" for b in batch_sizes)
+        train = f"  train {r['train']['clips_per_s']:>7.1f}/s" if "train" in r else ""
+        print(f"{_label(r['settings']):<44} {cols}{train}")
+
+    ok = [r for r in results if "error" not in r]
+    for b in batch_sizes:
+        best = max(ok, key=lambda r: r["infer"][str(b)]["clips_per_s"], default=None)
+        if best is not None:
+            print(f"best for batch {b}: {_label(best['settings'])} ({best['infer'][str(b)]['clips_per_s']}/s)")
+    if args.train and ok:
+        best = max(ok, key=lambda r: r["train"]["clips_per_s"])
+        print(f"best for training: {_label(best['settings'])} ({best['train']['clips_per_s']}/s)")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"cores": args.cores, "bf16": bf16, "results": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
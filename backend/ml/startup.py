@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+"""
+Cold-start profiling for the API (`python main.py --profile-startup`).
+
+Reports, in milliseconds:
+- imports: `import main` in a fresh interpreter (python -X importtime), split into
+  main's direct imports and the first import of each heavy package
+- phases: app startup until /health answers, model/DSP warm-up until /ready (with
+  the registry's per-phase timings), then the first and second /predict
+"""
+
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+HEAVY_PACKAGES = ("numpy", "scipy", "fastapi", "librosa", "numba", "soundfile", "sklearn", "tensorflow")
+
+
+def parse_importtime(stderr: str) -> List[Tuple[int, str, float]]:
+    """`-X importtime` lines -> [(depth, module, cumulative ms)] in import order."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, _, rest = line.partition("import time:")
+        _self_us, cum_us, name = rest.split("|", 2)
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((depth, name.strip(), int(cum_us) / 1000.0))
+    return rows
+
+
+def import_breakdown(module: str = "main", cwd: Optional[str] = None, top: int = 12) -> Dict[str, Any]:
+    """Import `module` in a fresh interpreter and break the time down per import."""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ),
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = parse_importtime(proc.stderr)
+    total = next((ms for depth, name, ms in rows if name == module and depth == 0), None)
+
+    # importtime lists children before their parent; main's direct imports are the
+    # depth-1 rows immediately preceding its own row.
+    direct: List[Tuple[str, float]] = []
+    for depth, name, ms in rows:
+        if depth == 1:
+            direct.append((name, ms))
+        elif depth == 0 and name != module:
+            direct = []
+        elif depth == 0:
+            break
+    first_seen: Dict[str, float] = {}
+    for _, name, ms in rows:
+        if name in HEAVY_PACKAGES and name not in first_seen:
+            first_seen[name] = ms
+    return {
+        "module": module,
+        "interpreter_wall_ms": round(wall_ms, 1),
+        "import_ms": round(total, 1) if total is not None else None,
+        "direct_imports_ms": {n: round(ms, 1) for n, ms in sorted(direct, key=lambda r: -r[1])[:top]},
+        "heavy_packages_ms": {n: round(first_seen.get(n, 0.0), 1) for n in HEAVY_PACKAGES if n in first_seen},
+        "not_imported": [n for n in HEAVY_PACKAGES if n not in first_seen],
+    }
+
+
+def _synthetic_wav(seed: int, seconds: float = 4.0, sr: int = 16000) -> bytes:
+    import numpy as np
+    import soundfile as sf
+
+    rng = np.random.default_rng(seed)
+    y = (0.1 * rng.standard_normal(int(seconds * sr))).astype(np.float32)
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, format="WAV")
+    return buf.getvalue()
+
+
+def profile_phases(app_module: Any, ready_timeout_s: float = 300.0) -> Dict[str, Any]:
+    """Drive the app in-process (lifespan included) and time each startup phase."""
+    from fastapi.testclient import TestClient
+
+    phases: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    with TestClient(app_module.app) as client:
+        client.get("/health")
+        phases["startup_to_health_ms"] = (time.perf_counter() - t0) * 1000.0
+
+        deadline = time.perf_counter() + ready_timeout_s
+        while client.get("/ready").status_code != 200:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"/ready not 200 after {ready_timeout_s}s: {client.get('/ready').json()}")
+            time.sleep(0.02)
+        phases["startup_to_ready_ms"] = (time.perf_counter() - t0) * 1000.0
+
+        # Distinct clips, so the prediction cache cannot answer the second request.
+        for seed, name in enumerate(("first_predict_ms", "second_predict_ms")):
+            data = _synthetic_wav(seed)
+            t = time.perf_counter()
+            r = client.post("/predict", files={"file": ("profile.wav", data, "audio/wav")})
+            phases[name] = (time.perf_counter() - t) * 1000.0
+            if r.status_code != 200:
+                raise RuntimeError(f"/predict failed during profiling: {r.status_code} {r.text[:500]}")
+        phases["time_to_first_prediction_ms"] = (time.perf_counter() - t0) * 1000.0 - phases["second_predict_ms"]
+
+    registry = app_module.registry
+    return {
+        "mode": app_module.executor.mode,
+        "backend": registry.backend,
+        "phases_ms": {k: round(v, 1) for k, v in phases.items()},
+        "warmup_phases_ms": {k: round(v * 1000.0, 1) for k, v in registry.timings.items()},
+    }
+
+
+def profile_startup(app_module: Any, json_path: Optional[str] = None) -> Dict[str, Any]:
+    cwd = os.path.dirname(os.path.abspath(app_module.__file__))
+    report = {"imports": import_breakdown("main", cwd=cwd), **profile_phases(app_module)}
+
+    imp = report["imports"]
+    print(f"import main: {imp['import_ms']} ms (interpreter wall {imp['interpreter_wall_ms']} ms)")
+    for name, ms in imp["direct_imports_ms"].items():
+        print(f"  {name:<32} {ms:>9.1f} ms")
+    print("heavy packages at import: " + (", ".join(f"{n} {ms} ms" for n, ms in imp["heavy_packages_ms"].items()) or "none"))
+    print("deferred: " + (", ".join(imp["not_imported"]) or "none"))
+    print(f"phases ({report['mode']} executor, {report['backend']} backend):")
+    for name, ms in {**report["phases_ms"], **{f"  warmup.{k}": v for k, v in report["warmup_phases_ms"].items()}}.items():
+        print(f"  {name:<32} {ms:>9.1f} ms")
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {json_path}")
+    return report
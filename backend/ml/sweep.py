@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+"""
+Stratified k-fold cross-validation over a hyperparameter grid, on cached features.
+
+Every file is featurized once into the training feature store (non-augmented features,
+as `ml.train --no-augment`); after that each trial only reads the memory-mapped store.
+A trial is one (architecture, learning rate, dropout, batch size) x fold: it trains on
+the other folds (a seeded, stratified validation_split of them for early stopping, as
+ml.train) and scores the held-out fold. Trials run in `--jobs` spawned worker processes,
+each pinned to `--threads` TensorFlow intra-op threads, so trials do not oversubscribe
+cores. A trial that raises is recorded with its error and the sweep continues.
+
+Output:
+  model/sweep.csv   one row per trial: hyperparameters, fold, accuracy, loss, epochs, seconds, error
+  model/model.h5    the configuration with the best mean fold accuracy, retrained on every file
+
+Run:
+  cd backend
+  python -m ml.sweep --folds 5 --arch cnn,separable --lr 1e-3,3e-4 --dropout default,0.4 --batch-size 16,32
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .config import AudioConfig, FeatureConfig, ModelConfig, RuntimeConfig, cnn_input_shape
+from .feature_store import FeatureStore, ensure_features
+from .featurize import featurize_files
+from .modeling import ARCHITECTURES
+from .train import TrainConfig, TrainPaths, load_metadata
+
+
+@dataclass(frozen=True)
+class Params:
+    architecture: str
+    learning_rate: float
+    dropout: Optional[float]  # None: the architecture's per-block rates
+    batch_size: int
+
+    def label(self) -> str:
+        dropout = "default" if self.dropout is None else f"{self.dropout:g}"
+        return f"{self.architecture} lr={self.learning_rate:g} dropout={dropout} batch={self.batch_size}"
+
+
+@dataclass(frozen=True)
+class Trial:
+    params: Params
+    fold: Optional[int]  # None: the final fit on every file
+    train_idx: Tuple[int, ...]
+    test_idx: Tuple[int, ...]
+
+
+def grid(
+    architectures: Sequence[str],
+    lrs: Sequence[float],
+    dropouts: Sequence[Optional[float]],
+    batch_sizes: Sequence[int],
+) -> List[Params]:
+    return [Params(*p) for p in itertools.product(architectures, lrs, dropouts, batch_sizes)]
+
+
+def _split(value: str, cast) -> List:
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def _dropout(value: str) -> Optional[float]:
+    return None if value.strip() == "default" else float(value)
+
+
+# Per worker process: the feature store, entry hashes and labels shared by all trials.
+_CTX: Dict[str, object] = {}
+
+
+def _init_worker(store_dir: str, hashes: List[str], labels: np.ndarray, threads: int, cfg: TrainConfig) -> None:
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    from .runtime import configure_tensorflow
+
+    configure_tensorflow(RuntimeConfig(intra_op_threads=threads, inter_op_threads=1))
+    audio_cfg, feat_cfg = AudioConfig(), FeatureConfig()
+    store = FeatureStore(store_dir, audio_cfg, feat_cfg, shape=cnn_input_shape(audio_cfg, feat_cfg, ModelConfig()))
+    _CTX.update(store=store, hashes=hashes, labels=labels, cfg=cfg)
+
+
+def split_validation(
+    train_idx: np.ndarray, labels: np.ndarray, fraction: float, seed: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (fit, validation) indices: a seeded split of `train_idx`, stratified by label.
+    Fold indices come back sorted and the metadata is grouped by label, so a tail
+    slice would hold one class; falls back to a plain shuffled split when a class
+    is too small to stratify.
+    """
+    from sklearn.model_selection import train_test_split
+
+    if int(len(train_idx) * fraction) == 0:
+        return train_idx, train_idx[:0]
+    try:
+        fit_idx, val_idx = train_test_split(
+            train_idx, test_size=fraction, random_state=seed, stratify=labels[train_idx]
+        )
+    except ValueError:  # a class with < 2 files, or fewer validation files than classes
+        fit_idx, val_idx = train_test_split(train_idx, test_size=fraction, random_state=seed)
+    return fit_idx, val_idx
+
+
+def run_trial(trial: Trial, model_out: str = "") -> Dict[str, object]:
+    """Fit one trial in this (initialized) worker; saves the model to `model_out` when given."""
+    import tensorflow as tf
+
+    from .modeling import build_model
+    from .train import StoreSequence, balanced_class_weights, training_callbacks
+
+    store, hashes, labels, cfg = _CTX["store"], _CTX["hashes"], _CTX["labels"], _CTX["cfg"]
+    p = trial.params
+    t0 = time.perf_counter()
+    seed = cfg.seed + (trial.fold or 0)
+    tf.keras.backend.clear_session()  # workers run many trials: drop the previous model's graph
+    tf.random.set_seed(seed)
+
+    fit_idx, val_idx = split_validation(np.asarray(trial.train_idx), labels, cfg.validation_split, seed)
+
+    def sequence(idx: np.ndarray, shuffle: bool) -> StoreSequence:
+        view = store.view([hashes[i] for i in idx])
+        return StoreSequence(view, labels[idx], p.batch_size, shuffle=shuffle, seed=seed)
+
+    model = build_model(
+        p.architecture, store.shape, len(ModelConfig.classes), learning_rate=p.learning_rate, dropout=p.dropout
+    )
+    history = model.fit(
+        sequence(fit_idx, True),
+        validation_data=sequence(val_idx, False),
+        epochs=cfg.epochs,
+        class_weight=balanced_class_weights(labels[fit_idx]),
+        callbacks=training_callbacks(),
+        verbose=0,
+    )
+    result: Dict[str, object] = {
+        **asdict(p),
+        "fold": "all" if trial.fold is None else trial.fold,
+        "train_files": len(fit_idx),
+        "test_files": len(trial.test_idx),
+        "epochs": len(history.history["loss"]),
+        "val_accuracy": round(float(max(history.history["val_accuracy"])), 4),
+    }
+    if len(trial.test_idx):
+        loss, acc = model.evaluate(sequence(np.asarray(trial.test_idx), False), verbose=0)
+        result.update(accuracy=round(float(acc), 4), loss=round(float(loss), 4))
+    if model_out:
+        os.makedirs(os.path.dirname(model_out) or ".", exist_ok=True)
+        model.save(model_out)
+    result["seconds"] = round(time.perf_counter() - t0, 1)
+    return result
+
+
+def featurize_all(paths: TrainPaths, cfg: TrainConfig) -> Tuple[FeatureStore, List[str], np.ndarray]:
+    """Every decodable file of the metadata in the feature store: (store, hashes, labels)."""
+    audio_cfg, feat_cfg, model_cfg = AudioConfig(), FeatureConfig(), ModelConfig()
+    store = FeatureStore(
+        paths.feature_store_dir, audio_cfg, feat_cfg, shape=cnn_input_shape(audio_cfg, feat_cfg, model_cfg)
+    )
+    df = load_metadata(paths, model_cfg.classes)
+    label_to_idx = {c: i for i, c in enumerate(model_cfg.classes)}
+    wav_paths, labels = [], []
+    for _, row in df.iterrows():
+        wav_path = os.path.join(paths.audio_dir, str(row["filename"]))
+        if os.path.exists(wav_path):
+            wav_paths.append(wav_path)
+            labels.append(label_to_idx[str(row["label"])])
+    if not wav_paths:
+        raise ValueError("No audio files found. Check your dataset paths/metadata.")
+    hashes = ensure_features(
+        store,
+        wav_paths,
+        lambda todo: featurize_files(
+            todo, range(len(todo)), audio_cfg, feat_cfg,
+            do_augment=False, seed=cfg.seed, workers=cfg.workers, desc="featurize",
+        ),
+        on_error=lambda path, message: None,  # printed by featurize_files; the file is dropped
+    )
+    ok = [i for i, h in enumerate(hashes) if h is not None]
+    if not ok:
+        raise ValueError("No audio files could be featurized.")
+    return store, [hashes[i] for i in ok], np.asarray(labels, dtype=np.int64)[ok]
+
+
+def summarize(results: pd.DataFrame) -> pd.DataFrame:
+    """Mean/std fold accuracy and total seconds per configuration over its completed folds, best first."""
+    keys = ["architecture", "learning_rate", "dropout", "batch_size"]
+    folds = results[results["fold"] != "all"]
+    if "error" in folds:
+        folds = folds[folds["error"].isna()]
+    if "accuracy" not in folds:  # no trial completed
+        return pd.DataFrame(columns=keys)
+    folds = folds.fillna({"dropout": "default"})
+    out = folds.groupby(keys, sort=False).agg(
+        folds=("accuracy", "count"),
+        accuracy_mean=("accuracy", "mean"),
+        accuracy_std=("accuracy", "std"),
+        loss_mean=("loss", "mean"),
+        epochs_mean=("epochs", "mean"),
+        seconds=("seconds", "sum"),
+    )
+    return out.sort_values("accuracy_mean", ascending=False).reset_index()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from sklearn.model_selection import StratifiedKFold
+
+    parser = argparse.ArgumentParser(description="k-fold cross-validation x hyperparameter grid on cached features.")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--arch", default="cnn", help=f"comma-separated, of: {', '.join(ARCHITECTURES)}")
+    parser.add_argument("--lr", default="1e-3", help="comma-separated learning rates")
+    parser.add_argument("--dropout", default="default", help="comma-separated rates; 'default' = per-block rates")
+    parser.add_argument("--batch-size", default=str(TrainConfig.batch_size), help="comma-separated batch sizes")
+    parser.add_argument("--epochs", type=int, default=TrainConfig.epochs)
+    parser.add_argument("--seed", type=int, default=TrainConfig.seed)
+    parser.add_argument("--workers", type=int, default=TrainConfig.workers, help="featurization processes (0 = all cores)")
+    parser.add_argument("--jobs", type=int, default=0, help="trial processes (0 = cores / threads)")
+    parser.add_argument("--threads", type=int, default=0, help="TensorFlow threads per trial (0 = cores / jobs)")
+    parser.add_argument("--out", default=os.path.join("model", "sweep.csv"))
+    parser.add_argument("--no-final", action="store_true", help="only cross-validate; leave model.h5 alone")
+    args = parser.parse_args(argv)
+
+    architectures = _split(args.arch, str)
+    unknown = [a for a in architectures if a not in ARCHITECTURES]
+    if unknown:
+        parser.error(f"unknown architecture(s): {', '.join(unknown)}")
+    configs = grid(architectures, _split(args.lr, float), _split(args.dropout, _dropout), _split(args.batch_size, int))
+    cfg = TrainConfig(seed=args.seed, epochs=args.epochs, workers=args.workers, augment=False)
+    paths = TrainPaths()
+
+    t_start = time.perf_counter()
+    store, hashes, labels = featurize_all(paths, cfg)
+    print(
+        f"Feature store: {len(store)} entries in {store.dir}; "
+        f"{len(hashes)} files ready in {time.perf_counter() - t_start:.1f}s"
+    )
+
+    skf = StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=args.seed)
+    folds = list(skf.split(np.zeros(len(labels)), labels))
+    trials = [
+        Trial(p, k, tuple(int(i) for i in train_idx), tuple(int(i) for i in test_idx))
+        for p in configs
+        for k, (train_idx, test_idx) in enumerate(folds)
+    ]
+
+    cores = os.cpu_count() or 1
+    jobs = args.jobs or max(1, min(len(trials), cores // max(1, args.threads)))
+    threads = args.threads or max(1, cores // jobs)
+    print(f"{len(configs)} configurations x {args.folds} folds = {len(trials)} trials, {jobs} x {threads} threads")
+
+    ctx = multiprocessing.get_context("spawn")
+    initargs = (paths.feature_store_dir, hashes, labels, threads, cfg)
+    results: List[Optional[Dict[str, object]]] = [None] * len(trials)  # table rows in grid order
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=ctx, initializer=_init_worker, initargs=initargs) as pool:
+        futures = {pool.submit(run_trial, t): i for i, t in enumerate(trials)}
+        for done, f in enumerate(as_completed(futures), 1):
+            i = futures[f]
+            prefix = f"[sweep] {done}/{len(trials)} {trials[i].params.label()} fold {trials[i].fold}"
+            try:
+                r = results[i] = f.result()
+            except Exception as e:  # record the failed trial, keep the others
+                results[i] = {**asdict(trials[i].params), "fold": trials[i].fold, "error": f"{type(e).__name__}: {e}"}
+                print(f"{prefix}: failed: {results[i]['error']}", flush=True)
+                continue
+            print(
+                f"{prefix}: accuracy {r['accuracy']:.4f}, {r['epochs']} epochs, {r['seconds']:.1f}s",
+                flush=True,
+            )
+
+        failed = sum("error" in r for r in results)
+        if failed:
+            print(f"{failed}/{len(trials)} trials failed; see the error column of {args.out}")
+        summary = summarize(pd.DataFrame(results))
+        best: Optional[Params] = None
+        if summary.empty:
+            print("No trial completed; skipping the final fit.")
+        else:
+            print(summary.to_string(index=False))
+            best_row = summary.iloc[0]
+            best = Params(
+                architecture=str(best_row["architecture"]),
+                learning_rate=float(best_row["learning_rate"]),
+                dropout=None if best_row["dropout"] == "default" else float(best_row["dropout"]),
+                batch_size=int(best_row["batch_size"]),
+            )
+            print(f"Best: {best.label()} (mean fold accuracy {best_row['accuracy_mean']:.4f})")
+
+        if best is not None and not args.no_final:
+            final_trial = Trial(best, None, tuple(range(len(labels))), ())
+            try:
+                final = pool.submit(run_trial, final_trial, paths.model_out).result()
+            except Exception as e:
+                final = {**asdict(best), "fold": "all", "error": f"{type(e).__name__}: {e}"}
+                print(f"Final fit failed: {final['error']}")
+            else:
+                print(f"Saved model to {paths.model_out} ({final['train_files']} training files, {final['seconds']:.1f}s)")
+            results.append(final)
+
+    table = pd.DataFrame(results).fillna({"dropout": "default"})
+    if "error" in table:
+        table = table[[c for c in table if c != "error"] + ["error"]]
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    table.to_csv(args.out, index=False)
+    print(f"Wrote {len(table)} rows to {args.out}; sweep took {time.perf_counter() - t_start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,11 +13,29 @@ to be easy to adapt: update `load_metadata()` to match your metadata format.
 
 Outputs:
   backend/model/model.h5
+
+Non-augmented features are kept in a memory-mapped feature store
+(dataset/icbhi_2017/features/, see ml/feature_store.py), so unchanged files are
+never featurized twice and evaluation reads them by mmap. With augmentation on,
+full-length clean (resampled, denoised) clips are stored instead
+(dataset/icbhi_2017/clips/) and loader workers augment, normalize, pad/trim and
+featurize each batch on the fly, in build_example's order, so every epoch sees fresh
+augmentation and memory stays flat.
+
+With --frontend graph the model takes waveforms (ml/frontend.py): the stores hold
+normalized fixed-length clips (dataset/icbhi_2017/model_waveforms/), augmented
+batches are only augmented + normalized + trimmed on the loader side, and STFT/mel/MFCC run inside the
+model. Output: backend/model/model_waveform.keras.
+
+Run:
+  cd backend
+  python -m ml.train [--no-augment] [--frontend graph] [--arch separable]
 """
 
+import argparse
 import os
 from dataclasses import dataclass
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
 import pandas as pd
@@ -25,10 +43,19 @@ import tensorflow as tf
 from sklearn.model_selection import train_test_split
 from sklearn.utils.class_weight import compute_class_weight
 
-from .config import AudioConfig, FeatureConfig, ModelConfig
-from .features import extract_all_features
-from .modeling import build_cnn
-from .preprocess import normalize, pad_or_trim, reduce_noise, resample
+from .config import AudioConfig, FeatureConfig, ModelConfig, RuntimeConfig, cnn_input_shape
+from .feature_store import FeatureStore, StoreView, ensure_features
+from .featurize import (
+    build_example,
+    example_rng,
+    examples_from_waveforms,
+    featurize_files,
+    model_waveform,
+    prepare_waveforms,
+    stored_waveform,
+)
+from .modeling import ARCHITECTURES, build_model, format_profile, profile_model
+from .runtime import configure_tensorflow
 
 
 @dataclass(frozen=True)
@@ -37,6 +64,26 @@ class TrainPaths:
     audio_dir: str = os.path.join("dataset", "icbhi_2017", "audio")
     metadata_csv: str = os.path.join("dataset", "icbhi_2017", "metadata.csv")
     model_out: str = os.path.join("model", "model.h5")
+    feature_store_dir: str = os.path.join("dataset", "icbhi_2017", "features")
+    waveform_store_dir: str = os.path.join("dataset", "icbhi_2017", "clips")  # full-length clean clips
+    model_waveform_store_dir: str = os.path.join("dataset", "icbhi_2017", "model_waveforms")
+    waveform_model_out: str = os.path.join("model", "model_waveform.keras")
+
+
+@dataclass(frozen=True)
+class TrainConfig:
+    seed: int = 42
+    epochs: int = 60
+    batch_size: int = 16
+    validation_split: float = 0.2
+    augment: bool = True  # fresh augmentation per epoch; otherwise train on stored features
+    workers: int = 0  # featurization processes (0 = all cores, 1 = in-process)
+    loader_workers: int = 4  # keras loader workers augmenting/featurizing batches during fit
+    loader_processes: bool = False  # loader workers are processes instead of threads
+    prefetch_batches: int = 10  # batches queued ahead of the model
+    frontend: str = "numpy"  # "graph": the model takes waveforms and computes features in-graph
+    runtime: RuntimeConfig = RuntimeConfig()  # TensorFlow threads, XLA train step, bf16 policy
+    architecture: str = "cnn"  # one of modeling.ARCHITECTURES
 
 
 def load_metadata(paths: TrainPaths, classes: List[str]) -> pd.DataFrame:
@@ -44,6 +91,8 @@ def load_metadata(paths: TrainPaths, classes: List[str]) -> pd.DataFrame:
     Minimal contract: a CSV with columns:
       - filename: audio filename (relative to audio_dir)
       - label: one of ModelConfig.classes
+    With the probe columns written by ml.make_metadata, files that failed to decode are
+    dropped here, before any featurization is scheduled.
     """
     if not os.path.exists(paths.metadata_csv):
         raise FileNotFoundError(
@@ -54,122 +103,312 @@ def load_metadata(paths: TrainPaths, classes: List[str]) -> pd.DataFrame:
     if "filename" not in df.columns or "label" not in df.columns:
         raise ValueError("metadata.csv must contain columns: filename,label")
     df = df[df["label"].isin(classes)].copy()
+    if "decode_ok" in df.columns:
+        bad = ~df["decode_ok"].astype(str).str.lower().isin(("true", "1"))
+        if bad.any():
+            print(f"Skipping {int(bad.sum())} files marked undecodable in metadata.csv (see its error column).")
+        df = df[~bad]
+        rates = df["sample_rate"].value_counts().sort_index()
+        print(
+            f"Manifest: {len(df)} files, {df['duration_seconds'].sum() / 3600:.2f} h, "
+            + ", ".join(f"{int(sr)} Hz x{n}" for sr, n in rates.items())
+        )
     if df.empty:
         raise ValueError("No rows with valid labels found in metadata.csv.")
     return df
 
 
-def augment(y: np.ndarray, sr: int, rng: np.random.Generator) -> np.ndarray:
+def split_train_test(df: pd.DataFrame, classes: List[str], seed: int) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """The stratified 80/20 (train, held-out test) split ml.train uses for `seed`."""
+    label_to_idx = {c: i for i, c in enumerate(classes)}
+    return train_test_split(
+        df,
+        test_size=0.2,
+        random_state=seed,
+        stratify=df["label"].map(label_to_idx).astype(int).values,
+    )
+
+
+def training_callbacks() -> List[tf.keras.callbacks.Callback]:
+    """Early stopping on validation accuracy (best weights restored) and LR decay on plateau."""
+    return [
+        tf.keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=8, restore_best_weights=True),
+        tf.keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=4),
+    ]
+
+
+def balanced_class_weights(y: np.ndarray) -> Dict[int, float]:
+    classes = np.unique(y)
+    weights = compute_class_weight(class_weight="balanced", classes=classes, y=y)
+    return {int(c): float(w) for c, w in zip(classes, weights)}
+
+
+# Keras 3 (TF >= 2.16) takes the loader settings on the dataset (PyDataset); Keras 2
+# (the pinned TF 2.13) takes them as fit() arguments and its Sequence accepts none.
+KERAS_PYDATASET = hasattr(tf.keras.utils, "PyDataset")
+
+
+def loader_kwargs(workers: int, use_multiprocessing: bool, max_queue_size: int) -> Tuple[Dict, Dict]:
+    """(Sequence kwargs, fit kwargs) for the loader settings on the installed Keras."""
+    kwargs = dict(workers=workers, use_multiprocessing=use_multiprocessing, max_queue_size=max_queue_size)
+    return (kwargs, {}) if KERAS_PYDATASET else ({}, kwargs)
+
+
+class StoreSequence(tf.keras.utils.Sequence):
+    """Batches of (features, labels) read from a memory-mapped StoreView."""
+
+    def __init__(
+        self,
+        view: StoreView,
+        labels: np.ndarray,
+        batch_size: int,
+        shuffle: bool,
+        seed: int = 0,
+        **kwargs,  # Keras 3 only: workers / use_multiprocessing / max_queue_size (see loader_kwargs)
+    ):
+        super().__init__(**kwargs)
+        self.view = view
+        self.labels = labels
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+        self.order = np.arange(len(view))
+        if shuffle:
+            self.rng.shuffle(self.order)
+
+    def __len__(self) -> int:
+        return int(np.ceil(len(self.order) / self.batch_size))
+
+    def __getitem__(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        idx = self.order[i * self.batch_size : (i + 1) * self.batch_size]
+        return self.view.take(idx), self.labels[idx]
+
+    def on_epoch_end(self) -> None:
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+
+
+class AugmentedSequence(StoreSequence):
     """
-    Simple augmentation:
-    - random gain
-    - mild time shift
-    - optional gaussian noise
+    Stored full-length clean clips -> augment -> normalize -> pad/trim -> features, one
+    batch at a time (the order of featurize.build_example).
+    Example j in epoch e is augmented with example_rng(seed, row_indices[j], e), so
+    the stream is reproducible whatever the number of loader workers.
+    With `waveforms=True` batches stop before the feature pass (in-graph front end).
     """
-    out = y.copy()
-    gain = rng.uniform(0.8, 1.2)
-    out = out * gain
-
-    shift = int(rng.uniform(-0.1, 0.1) * len(out))
-    out = np.roll(out, shift)
-
-    if rng.random() < 0.35:
-        noise = rng.normal(0, 0.005, size=out.shape).astype(np.float32)
-        out = out + noise
-
-    return out.astype(np.float32)
-
-
-def build_example(
-    wav_path: str,
-    audio_cfg: AudioConfig,
-    feat_cfg: FeatureConfig,
-    do_augment: bool,
-    rng: np.random.Generator,
-) -> np.ndarray:
-    import soundfile as sf
-
-    y, sr = sf.read(wav_path, dtype="float32", always_2d=False)
-    if y.ndim > 1:
-        y = np.mean(y, axis=1).astype(np.float32)
-    y, sr = resample(y, int(sr), audio_cfg)
-    y = reduce_noise(y)
-    if do_augment:
-        y = augment(y, sr, rng)
-    y = normalize(y)
-    y = pad_or_trim(y, sr, audio_cfg)
-    x, _ = extract_all_features(y, sr, feat_cfg)
-    return x
-
-
-def main() -> None:
-    tf.random.set_seed(42)
-    rng = np.random.default_rng(42)
+
+    def __init__(
+        self,
+        view: StoreView,
+        labels: np.ndarray,
+        row_indices: np.ndarray,
+        audio_cfg: AudioConfig,
+        feat_cfg: FeatureConfig,
+        batch_size: int,
+        seed: int = 0,
+        waveforms: bool = False,
+        **kwargs,
+    ):
+        super().__init__(view, labels, batch_size, shuffle=True, seed=seed, **kwargs)
+        self.waveforms = waveforms
+        self.row_indices = np.asarray(row_indices)
+        self.audio_cfg = audio_cfg
+        self.feat_cfg = feat_cfg
+        self.seed = seed
+        self.epoch = 0
+
+    def __getitem__(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        idx = self.order[i * self.batch_size : (i + 1) * self.batch_size]
+        ys = [np.array(self.view[j]) for j in idx]
+        rngs = [example_rng(self.seed, self.row_indices[j], self.epoch) for j in idx]
+        sr = self.audio_cfg.target_sr
+        if self.waveforms:
+            return prepare_waveforms(ys, sr, self.audio_cfg, rngs=rngs), self.labels[idx]
+        return examples_from_waveforms(ys, sr, self.audio_cfg, self.feat_cfg, rngs=rngs), self.labels[idx]
+
+    def on_epoch_end(self) -> None:
+        self.epoch += 1
+        super().on_epoch_end()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> TrainConfig:
+    parser = argparse.ArgumentParser(description="Train the respiratory sound CNN.")
+    parser.add_argument("--epochs", type=int, default=TrainConfig.epochs)
+    parser.add_argument("--batch-size", type=int, default=TrainConfig.batch_size)
+    parser.add_argument("--seed", type=int, default=TrainConfig.seed)
+    parser.add_argument("--no-augment", action="store_true", help="train on stored (non-augmented) features via mmap")
+    parser.add_argument("--workers", type=int, default=TrainConfig.workers, help="featurization processes (0 = all cores)")
+    parser.add_argument("--loader-workers", type=int, default=TrainConfig.loader_workers)
+    parser.add_argument("--loader-processes", action="store_true", help="use processes for loader workers")
+    parser.add_argument("--prefetch-batches", type=int, default=TrainConfig.prefetch_batches)
+    parser.add_argument(
+        "--frontend",
+        choices=("numpy", "graph"),
+        default=TrainConfig.frontend,
+        help="graph: train the waveform-input model with in-graph features (ml/frontend.py)",
+    )
+    parser.add_argument(
+        "--arch",
+        choices=tuple(ARCHITECTURES),
+        default=TrainConfig.architecture,
+        help="model variant (ml/modeling.py): cnn, separable or time_pool",
+    )
+    parser.add_argument("--intra-op-threads", type=int, default=RuntimeConfig.intra_op_threads)
+    parser.add_argument("--inter-op-threads", type=int, default=RuntimeConfig.inter_op_threads)
+    parser.add_argument("--xla", action="store_true", help="XLA-compile the train step")
+    parser.add_argument(
+        "--precision",
+        choices=("float32", "mixed_bfloat16", "auto"),
+        default=RuntimeConfig.precision,
+        help="mixed_bfloat16 / auto: bf16 compute on CPUs with native bf16",
+    )
+    args = parser.parse_args(argv)
+    return TrainConfig(
+        seed=args.seed,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        augment=not args.no_augment,
+        workers=args.workers,
+        loader_workers=args.loader_workers,
+        loader_processes=args.loader_processes,
+        prefetch_batches=args.prefetch_batches,
+        frontend=args.frontend,
+        architecture=args.arch,
+        runtime=RuntimeConfig(
+            intra_op_threads=args.intra_op_threads,
+            inter_op_threads=args.inter_op_threads,
+            xla=args.xla,
+            precision=args.precision,
+        ),
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    train_cfg = parse_args(argv)
+    settings = configure_tensorflow(train_cfg.runtime)
+    if settings["precision"] != "float32":
+        tf.keras.mixed_precision.set_global_policy(settings["precision"])
+    print(f"TensorFlow: {settings}")
+    tf.random.set_seed(train_cfg.seed)
 
     audio_cfg = AudioConfig()
     feat_cfg = FeatureConfig()
     model_cfg = ModelConfig()
     paths = TrainPaths()
+    in_graph = train_cfg.frontend == "graph"
+    n_samples = int(audio_cfg.duration_seconds * audio_cfg.target_sr)
+    if in_graph:
+        # Model inputs are waveforms: the "feature" store holds normalized fixed-length clips.
+        store = FeatureStore(paths.model_waveform_store_dir, audio_cfg, None, shape=(n_samples,))
+        example_job = model_waveform
+    else:
+        store = FeatureStore(
+            paths.feature_store_dir, audio_cfg, feat_cfg, shape=cnn_input_shape(audio_cfg, feat_cfg, model_cfg)
+        )
+        example_job = build_example
 
     df = load_metadata(paths, model_cfg.classes)
     label_to_idx = {c: i for i, c in enumerate(model_cfg.classes)}
-    y_all = df["label"].map(label_to_idx).astype(int).values
-
-    train_df, test_df = train_test_split(
-        df,
-        test_size=0.2,
-        random_state=42,
-        stratify=y_all,
-    )
+    train_df, test_df = split_train_test(df, model_cfg.classes, train_cfg.seed)
 
-    # Build features in-memory (simple + reviewable). For larger sets, use tf.data + caching.
-    def build_set(split_df: pd.DataFrame, augment_on: bool) -> Tuple[np.ndarray, np.ndarray]:
-        xs: List[np.ndarray] = []
-        ys: List[int] = []
-        for _, row in split_df.iterrows():
+    def existing_rows(split_df: pd.DataFrame) -> Tuple[List[str], List[int], np.ndarray]:
+        paths_, row_indices, labels = [], [], []
+        for row_index, row in split_df.iterrows():
             wav_path = os.path.join(paths.audio_dir, str(row["filename"]))
             if not os.path.exists(wav_path):
                 continue
-            x = build_example(wav_path, audio_cfg, feat_cfg, do_augment=augment_on, rng=rng)
-            xs.append(x)
-            ys.append(int(label_to_idx[str(row["label"])]))
-        if not xs:
+            paths_.append(wav_path)
+            row_indices.append(int(row_index))
+            labels.append(int(label_to_idx[str(row["label"])]))
+        if not paths_:
             raise ValueError("No audio files found. Check your dataset paths/metadata.")
-        return np.stack(xs, axis=0), np.array(ys, dtype=np.int64)
+        return paths_, row_indices, np.array(labels, dtype=np.int64)
+
+    def stored_set(
+        split_df: pd.DataFrame, target: FeatureStore, job, desc: str
+    ) -> Tuple[StoreView, np.ndarray, np.ndarray]:
+        """(view, labels, row indices) of the rows whose entries are (now) in `target`."""
+        wav_paths, row_indices, labels = existing_rows(split_df)
+        hashes = ensure_features(
+            target,
+            wav_paths,
+            lambda todo: featurize_files(
+                todo, range(len(todo)), audio_cfg, feat_cfg,
+                do_augment=False, seed=train_cfg.seed, workers=train_cfg.workers, desc=desc, job=job,
+            ),
+            on_error=lambda path, message: None,  # printed by featurize_files; the example is dropped
+        )
+        ok = [i for i, h in enumerate(hashes) if h is not None]
+        if not ok:
+            raise ValueError("No audio files could be featurized.")
+        return target.view([hashes[i] for i in ok]), labels[ok], np.asarray(row_indices)[ok]
 
-    x_train, y_train = build_set(train_df, augment_on=True)
-    x_test, y_test = build_set(test_df, augment_on=False)
+    # Same split semantics as validation_split: the last fraction of the training rows.
+    n_val = int(len(train_df) * train_cfg.validation_split)
+    fit_df, val_df = train_df.iloc[: len(train_df) - n_val], train_df.iloc[len(train_df) - n_val :]
 
-    class_weights = compute_class_weight(
-        class_weight="balanced",
-        classes=np.unique(y_train),
-        y=y_train,
+    loader, fit_loader = loader_kwargs(
+        train_cfg.loader_workers, train_cfg.loader_processes, train_cfg.prefetch_batches
     )
-    class_weight_map = {int(c): float(w) for c, w in zip(np.unique(y_train), class_weights)}
-
-    model = build_cnn(input_shape=x_train.shape[1:])
-    callbacks = [
-        tf.keras.callbacks.EarlyStopping(monitor="val_accuracy", patience=8, restore_best_weights=True),
-        tf.keras.callbacks.ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=4),
-    ]
-
+    x_test, y_test, _ = stored_set(test_df, store, example_job, "test")
+    x_val, y_val, _ = stored_set(val_df, store, example_job, "val")
+    if train_cfg.augment:
+        wave_store = FeatureStore(paths.waveform_store_dir, audio_cfg, None, shape=None)  # variable-length clips
+        x_fit, y_fit, fit_rows = stored_set(fit_df, wave_store, stored_waveform, "train (clips)")
+        fit_seq = AugmentedSequence(
+            x_fit,
+            y_fit,
+            fit_rows,
+            audio_cfg,
+            feat_cfg,
+            train_cfg.batch_size,
+            seed=train_cfg.seed,
+            waveforms=in_graph,
+            **loader,
+        )
+        print(f"Clip store: {len(wave_store)} entries in {wave_store.dir}")
+    else:
+        x_fit, y_fit, _ = stored_set(fit_df, store, example_job, "train")
+        fit_seq = StoreSequence(x_fit, y_fit, train_cfg.batch_size, shuffle=True, seed=train_cfg.seed, **loader)
+    print(f"Feature store: {len(store)} entries in {store.dir}")
+
+    class_weight_map = balanced_class_weights(y_fit)
+
+    if in_graph:
+        from .frontend import build_waveform_cnn
+
+        model = build_waveform_cnn(
+            audio_cfg,
+            feat_cfg,
+            cnn_input_shape(audio_cfg, feat_cfg, model_cfg),
+            architecture=train_cfg.architecture,
+            num_classes=len(model_cfg.classes),
+            jit_compile=train_cfg.runtime.xla,
+        )
+        model_out = paths.waveform_model_out
+    else:
+        model = build_model(
+            train_cfg.architecture, store.shape, num_classes=len(model_cfg.classes), jit_compile=train_cfg.runtime.xla
+        )
+        model_out = paths.model_out
     model.fit(
-        x_train,
-        y_train,
-        validation_split=0.2,
-        epochs=60,
-        batch_size=16,
+        fit_seq,
+        validation_data=StoreSequence(x_val, y_val, train_cfg.batch_size, shuffle=False),
+        epochs=train_cfg.epochs,
         class_weight=class_weight_map,
-        callbacks=callbacks,
+        callbacks=training_callbacks(),
         verbose=1,
+        **fit_loader,
     )
 
-    test_loss, test_acc = model.evaluate(x_test, y_test, verbose=0)
+    test_seq = StoreSequence(x_test, y_test, train_cfg.batch_size, shuffle=False)
+    test_loss, test_acc = model.evaluate(test_seq, verbose=0)
     print(f"Test accuracy: {test_acc:.4f}  loss: {test_loss:.4f}")
+    print(f"Architecture {train_cfg.architecture}: " + format_profile(profile_model(model, train_cfg.batch_size)))
 
-    os.makedirs(os.path.dirname(paths.model_out), exist_ok=True)
-    model.save(paths.model_out)
-    print(f"Saved model to {paths.model_out}")
+    os.makedirs(os.path.dirname(model_out), exist_ok=True)
+    model.save(model_out)
+    print(f"Saved model to {model_out}")
 
 
 if __name__ == "__main__":
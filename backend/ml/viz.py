@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import base64
+from typing import Dict, Tuple
+
+import numpy as np
+
+VIZ_MODES = ("none", "json", "binary")
+
+
+def _bin_starts(n: int, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Start index and size of `n_out` contiguous, non-empty bins covering range(n)."""
+    edges = np.linspace(0, n, n_out + 1).astype(np.int64)
+    return edges[:-1], np.diff(edges)
+
+
+def pool2d(x: np.ndarray, out_h: int, out_w: int, how: str = "area") -> np.ndarray:
+    """
+    Reduce a (H, W) array to at most (out_h, out_w) over its whole extent:
+    "area" averages each block, "max" keeps its maximum. Axes already small enough are kept.
+    """
+    h, w = x.shape
+    rows, row_n = _bin_starts(h, min(out_h, h))
+    cols, col_n = _bin_starts(w, min(out_w, w))
+    if how == "max":
+        return np.maximum.reduceat(np.maximum.reduceat(x, rows, axis=0), cols, axis=1)
+    if how == "area":
+        sums = np.add.reduceat(np.add.reduceat(x, rows, axis=0, dtype=np.float64), cols, axis=1)
+        return (sums / np.outer(row_n, col_n)).astype(x.dtype)
+    raise ValueError(f"Unknown pooling: {how!r} (expected 'area' or 'max')")
+
+
+def peak_downsample(y: np.ndarray, n_out: int) -> np.ndarray:
+    """At most `n_out` points over the whole clip, each the largest-magnitude sample of its bucket."""
+    starts, _ = _bin_starts(len(y), min(n_out, len(y)))
+    hi = np.maximum.reduceat(y, starts)
+    lo = np.minimum.reduceat(y, starts)
+    return np.where(hi >= -lo, hi, lo)
+
+
+def encode_array(x: np.ndarray, dtype: str) -> Dict[str, object]:
+    """
+    Base64 payload of `x` for viz=binary. Decode as
+      values = frombuffer(b64decode(data), dtype).reshape(shape) * scale + offset
+    (little-endian; scale=1, offset=0 for float16).
+    """
+    x = np.asarray(x, dtype=np.float32)
+    if dtype == "float16":
+        q, scale, offset = x.astype("<f2"), 1.0, 0.0
+    elif dtype == "uint8":
+        lo, hi = (float(x.min()), float(x.max())) if x.size else (0.0, 0.0)
+        scale = (hi - lo) / 255.0 if hi > lo else 1.0
+        offset = lo
+        q = np.clip(np.round((x - lo) / scale), 0, 255).astype(np.uint8)
+    else:
+        raise ValueError(f"Unknown binary dtype: {dtype!r} (expected 'uint8' or 'float16')")
+    return {
+        "dtype": dtype,
+        "shape": list(x.shape),
+        "scale": scale,
+        "offset": offset,
+        "data": base64.b64encode(q.tobytes()).decode("ascii"),
+    }
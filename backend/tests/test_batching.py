@@ -0,0 +1,97 @@
+import threading
+
+import numpy as np
+
+from ml.batching import MicroBatcher
+from ml.config import BatchConfig
+
+
+def _blocking_infer():
+    """infer() that holds the first batch until `release` is set, so later submits queue up."""
+    release = threading.Event()
+    calls = []
+
+    def infer(x_b: np.ndarray) -> np.ndarray:
+        calls.append(len(x_b))
+        release.wait(5.0)
+        return np.tile(np.arange(5, dtype=np.float32), (len(x_b), 1))
+
+    return infer, release, calls
+
+
+def test_cancelled_submit_does_not_stop_dispatcher():
+    infer, release, calls = _blocking_infer()
+    batcher = MicroBatcher(infer, BatchConfig(max_batch_size=1, max_wait_ms=0.0))
+    batcher.start()
+    try:
+        running = batcher.submit(np.zeros((2, 2, 2), np.float32))
+        cancelled = batcher.submit(np.zeros((2, 2, 2), np.float32))
+        assert cancelled.cancel()  # still queued behind `running`
+        later = batcher.submit(np.zeros((2, 2, 2), np.float32))
+        release.set()
+
+        assert running.result(timeout=5.0).shape == (5,)
+        assert later.result(timeout=5.0).shape == (5,)
+        assert cancelled.cancelled()
+        assert batcher.stats()["requests"] == 2
+    finally:
+        batcher.stop()
+
+
+def test_infer_error_reaches_every_caller_and_dispatcher_survives():
+    state = {"fail": True}
+
+    def infer(x_b: np.ndarray) -> np.ndarray:
+        if state["fail"]:
+            state["fail"] = False
+            raise RuntimeError("boom")
+        return np.zeros((len(x_b), 5), np.float32)
+
+    batcher = MicroBatcher(infer, BatchConfig(max_batch_size=4, max_wait_ms=1.0))
+    batcher.start()
+    try:
+        failing = batcher.submit(np.zeros((2, 2, 2), np.float32))
+        try:
+            failing.result(timeout=5.0)
+        except RuntimeError as e:
+            assert str(e) == "boom"
+        else:
+            raise AssertionError("expected the infer error")
+        assert batcher.submit(np.zeros((2, 2, 2), np.float32)).result(timeout=5.0).shape == (5,)
+    finally:
+        batcher.stop()
+
+
+class _FailingCollect(MicroBatcher):
+    """Raises once, after it has already dequeued the queued requests."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_next = True
+
+    def _collect(self, batch):
+        batch = super()._collect(batch)
+        if self.fail_next:
+            self.fail_next = False
+            raise RuntimeError("collect broke")
+        return batch
+
+
+def test_dispatcher_error_fails_every_dequeued_request():
+    infer, release, _ = _blocking_infer()
+    release.set()
+    batcher = _FailingCollect(infer, BatchConfig(max_batch_size=4, max_wait_ms=50.0))
+    futures = [batcher.submit(np.zeros((2, 2, 2), np.float32)) for _ in range(3)]
+    batcher.start()  # all three are queued: the first batch collects them, then fails
+    try:
+        for f in futures:
+            try:
+                f.result(timeout=5.0)
+            except RuntimeError as e:
+                assert str(e) == "collect broke"
+            else:
+                raise AssertionError("expected the dispatcher error")
+        assert batcher.stats()["dispatch_errors"] == 1
+        assert batcher.submit(np.zeros((2, 2, 2), np.float32)).result(timeout=5.0).shape == (5,)
+    finally:
+        batcher.stop()
@@ -0,0 +1,36 @@
+import dataclasses
+
+import numpy as np
+
+from ml.bench import synth_lung_sound
+from ml.config import AudioConfig, FeatureConfig
+from ml.engine import featurize_clip
+from ml.features import extract_all_features
+from ml.preprocess import normalize, pad_or_trim, reduce_noise
+
+AUDIO = AudioConfig()
+SR = AUDIO.target_sr
+
+
+def _reference(y: np.ndarray, feat_cfg: FeatureConfig) -> np.ndarray:
+    x, _ = extract_all_features(pad_or_trim(normalize(reduce_noise(y)), SR, AUDIO), SR, feat_cfg)
+    return x
+
+
+def test_default_serves_the_reference_path():
+    feat_cfg = FeatureConfig()
+    assert not feat_cfg.shared_stft
+    y = synth_lung_sound(6.0, SR, seed=1)
+    x, _, _ = featurize_clip(y, SR, AUDIO, feat_cfg, return_waveform=False)
+    np.testing.assert_allclose(x, _reference(y, feat_cfg), atol=1e-5)
+
+
+def test_shared_stft_error_within_documented_bounds():
+    """The bounds ml.engine documents for synthetic lung sounds (mean 0.06, p95 0.21)."""
+    feat_cfg = dataclasses.replace(FeatureConfig(), shared_stft=True)
+    for seed, seconds in enumerate((1.0, 3.0, 6.0, 10.0)):
+        y = synth_lung_sound(seconds, SR, seed=seed)
+        x, _, _ = featurize_clip(y, SR, AUDIO, feat_cfg, return_waveform=False)
+        d = np.abs(x - _reference(y, feat_cfg))
+        assert d.mean() <= 0.06, (seconds, d.mean())
+        assert np.percentile(d, 95) <= 0.21, (seconds, np.percentile(d, 95))
@@ -0,0 +1,36 @@
+import asyncio
+import operator
+import os
+import time
+
+import pytest
+
+from ml.config import ExecutorConfig
+from ml.executor import ExecutorUnavailable, PipelineExecutor
+
+
+async def _wait_ready(executor: PipelineExecutor, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not executor.ready:
+        assert time.monotonic() < deadline, "executor did not become ready"
+        await asyncio.sleep(0.05)
+
+
+def test_broken_process_pool_is_rebuilt():
+    async def scenario() -> None:
+        executor = PipelineExecutor(ExecutorConfig(mode="process", max_workers=1))
+        executor.start()
+        try:
+            await _wait_ready(executor)
+            assert await executor.run(operator.add, 1, 2) == 3
+
+            with pytest.raises(ExecutorUnavailable):
+                await executor.run(os._exit, 1)  # the worker dies mid-call
+            assert executor.stats()["restarts"] == 1
+
+            await _wait_ready(executor)
+            assert await executor.run(operator.add, 2, 3) == 5
+        finally:
+            executor.shutdown()
+
+    asyncio.run(scenario())
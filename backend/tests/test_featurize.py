@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+from ml.bench import synth_lung_sound
+from ml.config import AudioConfig, FeatureConfig
+from ml.feature_store import FeatureStore, ensure_features
+from ml.featurize import build_example, example_rng, examples_from_waveforms, featurize_files, stored_waveform
+from ml.train import AugmentedSequence
+
+AUDIO = AudioConfig()
+FEATURES = FeatureConfig()
+SEED = 7
+
+
+def _wav_files(tmp_path, seconds=(4.0, 11.0)):
+    paths = []
+    for i, s in enumerate(seconds):
+        path = os.path.join(tmp_path, f"clip{i}.wav")
+        y = synth_lung_sound(s, 22050, seed=i)
+        y[len(y) // 2 :] *= 3.0  # the clip's peak lies past the first window
+        sf.write(path, y, 22050, subtype="FLOAT")
+        paths.append(path)
+    return paths
+
+
+def _clip_store(tmp_path, paths):
+    store = FeatureStore(os.path.join(tmp_path, "clips"), AUDIO, None, shape=None)
+    hashes = ensure_features(
+        store,
+        paths,
+        lambda todo: featurize_files(
+            todo, range(len(todo)), AUDIO, FEATURES, do_augment=False, seed=SEED, workers=1, job=stored_waveform
+        ),
+    )
+    return store.view(hashes)
+
+
+def test_stored_clips_without_augmentation_match_build_example(tmp_path):
+    paths = _wav_files(tmp_path)
+    view = _clip_store(tmp_path, paths)
+    assert len(view[1]) > int(AUDIO.duration_seconds * AUDIO.target_sr)  # stored whole, not trimmed
+    x = examples_from_waveforms([np.array(view[i]) for i in range(len(view))], AUDIO.target_sr, AUDIO, FEATURES)
+    expected = np.stack([build_example(p, AUDIO, FEATURES, False, None) for p in paths])
+    np.testing.assert_allclose(x, expected, atol=1e-5)
+
+
+def test_augmented_batches_match_build_example(tmp_path):
+    paths = _wav_files(tmp_path)
+    rows = np.array([3, 9])
+    seq = AugmentedSequence(_clip_store(tmp_path, paths), np.array([0, 1]), rows, AUDIO, FEATURES, 2, seed=SEED)
+    x, _ = seq[0]
+    expected = {
+        int(r): build_example(p, AUDIO, FEATURES, True, example_rng(SEED, int(r), 0)) for p, r in zip(paths, rows)
+    }
+    for k, j in enumerate(seq.order[:2]):
+        np.testing.assert_allclose(x[k], expected[int(rows[j])], atol=1e-5)
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sqlite3
+import time
+
+from ml.config import JobConfig
+from ml.jobs import JobQueue, JobRunner
+
+
+class FlakyQueue(JobQueue):
+    """JobQueue whose first claim fails like a locked database."""
+
+    def __init__(self, cfg: JobConfig):
+        super().__init__(cfg)
+        self.claim_errors = 1
+
+    def claim(self):
+        if self.claim_errors:
+            self.claim_errors -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return super().claim()
+
+
+def test_worker_survives_a_queue_error(tmp_path):
+    cfg = JobConfig(db_path=os.path.join(tmp_path, "jobs.sqlite3"), workers=1, poll_interval_seconds=0.01)
+    queue = FlakyQueue(cfg)
+
+    async def handler(data: bytes, params) -> bytes:
+        return data.upper()
+
+    async def scenario() -> None:
+        runner = JobRunner(queue, handler, cfg)
+        runner.start()
+        try:
+            job_id = await asyncio.to_thread(queue.submit, b"ok", {})
+            runner.notify()
+            deadline = time.monotonic() + 5.0
+            while queue.get(job_id)["status"] != "done":
+                assert time.monotonic() < deadline, "job was not processed"
+                await asyncio.sleep(0.01)
+            assert queue.get(job_id)["result"] == b"OK"
+            assert runner.stats()["errors"] == 1
+        finally:
+            await runner.stop()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        queue.close()
+
+
+def test_restarted_process_with_the_same_pid_recovers_stranded_jobs(tmp_path):
+    cfg = JobConfig(db_path=os.path.join(tmp_path, "jobs.sqlite3"), lease_seconds=30.0)
+    before = JobQueue(cfg)  # the process that died mid-job
+    job_id = before.submit(b"audio", {})
+    assert before.claim().id == job_id
+    before.close()
+
+    after = JobQueue(cfg)  # restarted server: same pid (os.getpid()), new token
+    try:
+        assert after.recover() == 0  # the lease is still fresh: the old owner may be alive
+        assert after.get(job_id)["status"] == "running"
+        assert after.recover(now=time.time() + cfg.lease_seconds + 1) == 1
+        assert after.get(job_id)["status"] == "queued"
+        assert after.claim().id == job_id
+    finally:
+        after.close()
+
+
+def test_heartbeat_keeps_a_live_owner_lease(tmp_path):
+    cfg = JobConfig(db_path=os.path.join(tmp_path, "jobs.sqlite3"), lease_seconds=30.0)
+    owner, other = JobQueue(cfg), JobQueue(cfg)
+    try:
+        job_id = owner.submit(b"audio", {})
+        owner.claim()
+        later = time.time() + cfg.lease_seconds + 1
+        assert owner.heartbeat(now=later) == 1
+        assert other.recover(now=later + 1) == 0
+        assert owner.recover(now=later + cfg.lease_seconds + 10) == 0  # never recovers its own jobs
+        assert other.get(job_id)["status"] == "running"
+    finally:
+        owner.close()
+        other.close()
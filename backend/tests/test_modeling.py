@@ -0,0 +1,18 @@
+import tensorflow as tf
+
+from ml.modeling import build_model, count_flops
+
+
+def test_count_flops_matches_hand_count():
+    inputs = tf.keras.Input(shape=(8, 8, 1))
+    x = tf.keras.layers.Conv2D(4, 3, padding="same")(inputs)  # 2 * 64 positions * (3*3*1*4)
+    x = tf.keras.layers.SeparableConv2D(4, 3, padding="same")(x)  # 2 * 64 * (3*3*4 + 4*4)
+    x = tf.keras.layers.Flatten()(x)
+    outputs = tf.keras.layers.Dense(3)(x)  # 2 * (256*3)
+    model = tf.keras.Model(inputs, outputs)
+    assert count_flops(model) == 2 * 64 * 36 + 2 * 64 * 52 + 2 * 256 * 3
+
+
+def test_every_architecture_reports_flops():
+    for arch in ("cnn", "separable", "time_pool"):
+        assert count_flops(build_model(arch, (32, 24, 2), num_classes=5)) > 0, arch
@@ -0,0 +1,52 @@
+import dataclasses
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from ml.bench import synth_lung_sound
+from ml.config import AudioConfig, DecodeConfig, FeatureConfig, ModelConfig, WindowConfig
+from ml.decode import AudioTooLong
+from ml.predict import max_windowed_seconds, predict_windowed_from_audio_bytes, prepare_input
+
+AUDIO = AudioConfig()
+FEATURES = FeatureConfig()
+
+
+def _wav(seconds: float, seed: int) -> bytes:
+    y = synth_lung_sound(seconds, AUDIO.target_sr, seed=seed)
+    y[int(AUDIO.duration_seconds * AUDIO.target_sr) * 2 :] *= 4.0  # louder tail: truncation sees a different peak
+    buf = io.BytesIO()
+    sf.write(buf, y, AUDIO.target_sr, format="WAV", subtype="FLOAT")
+    return buf.getvalue()
+
+
+def test_default_decode_reads_the_whole_upload():
+    decode_cfg = DecodeConfig()
+    assert not decode_cfg.truncate
+    data = _wav(30.0, seed=3)
+    x, _, _, _ = prepare_input(data, AUDIO, FEATURES, False, decode_cfg)
+    x_whole, _, _, _ = prepare_input(data, AUDIO, FEATURES, False, dataclasses.replace(decode_cfg, truncate=True, margin_seconds=1e9))
+    np.testing.assert_array_equal(x, x_whole)
+
+    x_truncated, _, _, _ = prepare_input(data, AUDIO, FEATURES, False, dataclasses.replace(decode_cfg, truncate=True))
+    assert not np.allclose(x, x_truncated)
+
+
+def test_serving_resamples_like_training_by_default():
+    assert AUDIO.resample_serving == AUDIO.resample_training
+
+
+def test_windowed_requests_are_capped_at_max_windows():
+    win_cfg = WindowConfig(hop_seconds=3.0, max_windows=3)
+    assert max_windowed_seconds(AUDIO, win_cfg) == 12.0
+
+    def infer(x_b: np.ndarray) -> np.ndarray:
+        return np.full((len(x_b), len(ModelConfig.classes)), 0.2, np.float32)
+
+    args = (AUDIO, FEATURES, ModelConfig(), win_cfg, infer, "none")
+    _, _, _, timeline, _ = predict_windowed_from_audio_bytes(_wav(12.0, seed=1), *args)
+    assert len(timeline) == 3
+    with pytest.raises(AudioTooLong):
+        predict_windowed_from_audio_bytes(_wav(20.0, seed=1), *args)
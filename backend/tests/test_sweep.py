@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+from ml.sweep import split_validation, summarize
+
+
+def test_validation_split_is_stratified_on_label_sorted_folds():
+    labels = np.repeat(np.arange(5), 20)  # metadata order: grouped by label
+    train_idx = np.arange(80)  # StratifiedKFold-style sorted indices covering 4 classes
+    fit_idx, val_idx = split_validation(train_idx, labels, 0.2, seed=0)
+    assert sorted(np.concatenate([fit_idx, val_idx]).tolist()) == train_idx.tolist()
+    assert len(val_idx) == 16
+    assert np.bincount(labels[val_idx], minlength=5).tolist() == [4, 4, 4, 4, 0]
+    again, _ = split_validation(train_idx, labels, 0.2, seed=0)
+    np.testing.assert_array_equal(fit_idx, again)
+
+
+def test_validation_split_falls_back_when_a_class_is_too_small():
+    labels = np.array([0] * 10 + [1])
+    fit_idx, val_idx = split_validation(np.arange(11), labels, 0.2, seed=0)
+    assert len(fit_idx) + len(val_idx) == 11 and len(val_idx) == 3
+
+
+def test_summary_skips_failed_trials():
+    base = {"architecture": "cnn", "learning_rate": 1e-3, "dropout": None}
+    rows = [
+        {**base, "batch_size": 16, "fold": 0, "accuracy": 0.5, "loss": 1.0, "epochs": 3, "seconds": 1.0},
+        {**base, "batch_size": 16, "fold": 1, "error": "ValueError: boom"},
+        {**base, "batch_size": 32, "fold": 0, "error": "ValueError: boom"},
+    ]
+    summary = summarize(pd.DataFrame(rows))
+    assert summary["batch_size"].tolist() == [16]
+    assert summary["folds"].tolist() == [1]
+    assert summarize(pd.DataFrame(rows[1:])).empty